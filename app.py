@@ -1,17 +1,28 @@
 """
-Main application file - runs both Flask webhook server and Telegram bot
+Main application file - Flask webhook server.
+With PROCESS_ROLE=all it also runs the Telegram bot and background jobs in-process.
 """
+import atexit
 import logging
 import asyncio
+import sys
 from threading import Thread
+from apscheduler.schedulers.background import BackgroundScheduler
 from flask import Flask, request, jsonify
 from telegram import Update
 from telegram.ext import Application
 
 from config import TELEGRAM_BOT_TOKEN, PORT, DEBUG, setup_logging
+from config import WEBHOOK_URL, TELEGRAM_MODE, TELEGRAM_WEBHOOK_PATH, TELEGRAM_WEBHOOK_SECRET
 from config import STAGE_MAPPING, STAGE_DESCRIPTIONS
+from config import WEBHOOK_QUEUE_SIZE, WEBHOOK_QUEUE_OVERFLOW, WEBHOOK_COALESCE_WINDOW, PROCESS_ROLE
 from database import init_db, get_session, User
-from bot.main import setup_handlers
+from bot.main import setup_handlers, close_database
+from bot.jobs import setup_jobs
+from services.webhook_queue import WebhookQueue
+from services.deal_index import deal_index
+from services.drive_folder_pool import drive_folder_pool
+from services.jobs import register_jobs
 
 # Setup logging
 setup_logging(DEBUG)
@@ -23,23 +34,63 @@ app = Flask(__name__)
 # Global telegram application
 telegram_app = None
 
+# Event loop the telegram application runs on (set once the bot is initialized)
+bot_loop = None
+
+# Seconds to wait at exit for the bot to shut down and close its database connections
+BOT_SHUTDOWN_TIMEOUT = 10
+
+
+async def on_bot_started(application: Application):
+    """Publish the bot's event loop so other threads can submit coroutines to it"""
+    global bot_loop
+    bot_loop = asyncio.get_running_loop()
+    logger.info("Telegram bot event loop is ready")
+
 
 def create_telegram_app():
     """Create and configure telegram application"""
     global telegram_app
 
-    telegram_app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    telegram_app = Application.builder().token(TELEGRAM_BOT_TOKEN) \
+        .post_init(on_bot_started).post_shutdown(close_database).build()
 
-    # Setup all handlers
+    # Setup all handlers and jobs
     setup_handlers(telegram_app)
+    setup_jobs(telegram_app)
 
     logger.info("Telegram application created")
     return telegram_app
 
 
+async def start_webhook_bot():
+    """Initialize bot and register webhook; updates arrive via telegram_webhook route"""
+    await telegram_app.initialize()
+    await on_bot_started(telegram_app)
+
+    await telegram_app.bot.set_webhook(
+        url=f"{WEBHOOK_URL.rstrip('/')}{TELEGRAM_WEBHOOK_PATH}",
+        allowed_updates=Update.ALL_TYPES,
+        secret_token=TELEGRAM_WEBHOOK_SECRET,
+        drop_pending_updates=False
+    )
+
+    # Start processing update_queue (and job queue)
+    await telegram_app.start()
+
+
+async def stop_webhook_bot():
+    """Counterpart of start_webhook_bot, as run_polling does once its loop stops"""
+    if telegram_app.running:
+        await telegram_app.stop()
+    await telegram_app.shutdown()
+    # post_shutdown is only called by run_polling/run_webhook
+    await close_database(telegram_app)
+
+
 def run_telegram_bot():
-    """Run telegram bot in polling mode in separate thread"""
-    logger.info("Starting Telegram bot in polling mode...")
+    """Run telegram bot in polling or webhook mode in separate thread"""
+    logger.info(f"Starting Telegram bot in {TELEGRAM_MODE} mode...")
 
     # Initialize database
     init_db()
@@ -48,13 +99,122 @@ def run_telegram_bot():
     # Create telegram app
     create_telegram_app()
 
-    # Run polling
-    telegram_app.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
+    # This thread owns the bot's event loop
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    if TELEGRAM_MODE == 'webhook':
+        try:
+            loop.run_until_complete(start_webhook_bot())
+            loop.run_forever()
+        finally:
+            loop.run_until_complete(stop_webhook_bot())
+            loop.close()
+        return
+
+    # Run polling (signal handlers can only be installed in the main thread)
+    telegram_app.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True, stop_signals=None)
+
+
+def stop_telegram_bot():
+    """Stop the bot's event loop at exit, so the bot thread shuts the bot down and closes the async engine"""
+    if bot_loop is None or bot_loop.is_closed():
+        return
+
+    bot_loop.call_soon_threadsafe(bot_loop.stop)
+    bot_thread.join(timeout=BOT_SHUTDOWN_TIMEOUT)
+    if bot_thread.is_alive():
+        logger.warning("Telegram bot did not shut down in time")
+
+
+def send_notification(chat_id: int, text: str):
+    """Submit message to the bot's event loop, or hand it over to the bot process"""
+    if telegram_app is None or bot_loop is None:
+        from services import notification_service
+        notification_service.schedule_message(chat_id, text, message_type='stage_update')
+        return
+
+    future = asyncio.run_coroutine_threadsafe(
+        telegram_app.bot.send_message(chat_id=chat_id, text=text),
+        bot_loop
+    )
+
+    def log_result(f):
+        if f.exception():
+            logger.error(f"Error sending notification to {chat_id}: {f.exception()}")
+
+    future.add_done_callback(log_result)
+
+
+def handle_deal_update(event: dict):
+    """Apply a queued ONCRMDEALUPDATE event (runs on the queue consumer thread)"""
+    from services import user_service
+    from bot.utils import messages
 
+    deal_id = event['deal_id']
+    new_stage = event['stage_id']
 
-# Start telegram bot in background thread
-bot_thread = Thread(target=run_telegram_bot, daemon=True)
-bot_thread.start()
+    # Find user by deal_id
+    telegram_id = deal_index.lookup(deal_id)
+    if not telegram_id:
+        logger.info(f"User not found for deal_id: {deal_id}")
+        return
+
+    with get_session() as db_session:
+        user = db_session.get(User, telegram_id)
+        current_stage = user.current_stage if user else None
+
+    # Most deal updates are edits of other fields - nothing to write or announce
+    if new_stage == current_stage:
+        logger.debug(f"Stage unchanged for deal {deal_id}: {new_stage}")
+        return
+
+    # Update stage in database
+    user_service.update_stage(telegram_id, new_stage)
+
+    # Send notification to user
+    stage_display = STAGE_MAPPING.get(new_stage, new_stage)
+    stage_desc = STAGE_DESCRIPTIONS.get(stage_display, '')
+    send_notification(telegram_id, messages.STAGE_UPDATED.format(stage_display, stage_desc))
+
+    logger.info(f"Stage updated for user {telegram_id}: {new_stage}")
+
+
+webhook_queue = WebhookQueue(
+    handle_deal_update,
+    maxsize=WEBHOOK_QUEUE_SIZE,
+    overflow_policy=WEBHOOK_QUEUE_OVERFLOW,
+    coalesce_key='deal_id',
+    coalesce_window=WEBHOOK_COALESCE_WINDOW
+)
+
+if PROCESS_ROLE in ('web', 'all'):
+    deal_index.load()
+    webhook_queue.start()
+
+if PROCESS_ROLE == 'all':
+    # Background jobs (stage reconciliation)
+    scheduler = register_jobs(BackgroundScheduler(timezone='UTC'))
+    scheduler.start()
+
+    # Start telegram bot in background thread
+    bot_thread = Thread(target=run_telegram_bot, daemon=True)
+    bot_thread.start()
+    atexit.register(stop_telegram_bot)
+
+
+def bitrix_stats():
+    """Bitrix rate limiter and call stats, if this process talks to Bitrix at all"""
+    bitrix = sys.modules.get('integrations.bitrix')
+    if bitrix is None:
+        return None
+
+    return {
+        'rate_limiter': bitrix.bitrix_rate_limiter.get_stats(),
+        'lookup_cache': bitrix.bitrix_lookup_cache.get_stats(),
+        'calls': bitrix.bitrix_client.get_stats(),
+        'async_calls': bitrix.async_bitrix_client.get_stats()
+    }
 
 
 @app.route('/')
@@ -64,60 +224,72 @@ def index():
         'status': 'online',
         'service': 'Dosudebka Bot',
         'version': '1.0.0',
-        'bot_running': telegram_app is not None
+        'role': PROCESS_ROLE,
+        'bot_running': bot_loop is not None,
+        'webhook_queue': webhook_queue.get_stats(),
+        'deal_index': deal_index.get_stats(),
+        'drive_folder_pool': drive_folder_pool.get_stats(),
+        'bitrix': bitrix_stats()
     })
 
 
 @app.route('/bitrix-webhook', methods=['POST'])
 def bitrix_webhook():
-    """Handle Bitrix24 webhook for stage updates"""
-    try:
-        data = request.get_json()
-        logger.info(f"Received Bitrix webhook: {data}")
+    """Validate Bitrix24 webhook and enqueue stage updates for the consumer"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'status': 'error', 'message': 'Invalid payload'}), 400
+
+    logger.debug(f"Received Bitrix webhook: {data}")
 
-        event = data.get('event')
+    if data.get('event') != 'ONCRMDEALUPDATE':
+        return jsonify({'status': 'ok'}), 200
 
-        if event == 'ONCRMDEALUPDATE':
-            deal_id = data['data']['FIELDS']['ID']
-            new_stage = data['data']['FIELDS'].get('STAGE_ID')
+    fields = (data.get('data') or {}).get('FIELDS') or {}
+    new_stage = fields.get('STAGE_ID')
 
-            if new_stage:
-                from services import user_service
+    try:
+        deal_id = int(fields['ID'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Invalid deal ID'}), 400
 
-                # Find user by deal_id
-                with get_session() as db_session:
-                    user = db_session.query(User).filter(User.bitrix_deal_id == int(deal_id)).first()
+    # Cached registration lookups of this deal's contact are stale now (PROCESS_ROLE=all;
+    # a separate bot process relies on the cache's TTLs)
+    bitrix = sys.modules.get('integrations.bitrix')
+    if bitrix is not None:
+        bitrix.bitrix_lookup_cache.invalidate_deal(deal_id)
 
-                    if user:
-                        # Update stage in database
-                        user_service.update_stage(user.telegram_id, new_stage)
+    if not new_stage:
+        return jsonify({'status': 'ok'}), 200
 
-                        # Send notification to user
-                        from bot.utils import messages
+    # Most deals have no bot user - reject them without touching the DB
+    if deal_index.is_known_missing(deal_id):
+        return jsonify({'status': 'error', 'message': 'User not found'}), 404
 
-                        stage_display = STAGE_MAPPING.get(new_stage, new_stage)
-                        stage_desc = STAGE_DESCRIPTIONS.get(stage_display, '')
+    if not webhook_queue.put({'deal_id': deal_id, 'stage_id': new_stage}):
+        return jsonify({'status': 'error', 'message': 'Webhook queue is full'}), 503
 
-                        message = messages.STAGE_UPDATED.format(stage_display, stage_desc)
+    return jsonify({'status': 'accepted'}), 202
 
-                        # Send message via telegram bot
-                        if telegram_app:
-                            asyncio.run(telegram_app.bot.send_message(
-                                chat_id=user.telegram_id,
-                                text=message
-                            ))
 
-                        logger.info(f"Stage updated for user {user.telegram_id}: {new_stage}")
-                        return jsonify({'status': 'ok', 'message': 'Stage updated'}), 200
+@app.route(TELEGRAM_WEBHOOK_PATH, methods=['POST'])
+def telegram_webhook():
+    """Feed Telegram update into the bot's update queue"""
+    if TELEGRAM_MODE != 'webhook' or telegram_app is None or bot_loop is None:
+        return jsonify({'status': 'error', 'message': 'Bot is not running'}), 503
 
-                logger.warning(f"User not found for deal_id: {deal_id}")
-                return jsonify({'status': 'error', 'message': 'User not found'}), 404
+    if TELEGRAM_WEBHOOK_SECRET and \
+            request.headers.get('X-Telegram-Bot-Api-Secret-Token') != TELEGRAM_WEBHOOK_SECRET:
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
 
-        return jsonify({'status': 'ok'}), 200
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'status': 'error', 'message': 'Invalid payload'}), 400
+
+    update = Update.de_json(data, telegram_app.bot)
+    asyncio.run_coroutine_threadsafe(telegram_app.update_queue.put(update), bot_loop)
 
-    except Exception as e:
-        logger.error(f"Error processing Bitrix webhook: {e}", exc_info=True)
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+    return jsonify({'status': 'ok'}), 200
 
 
 if __name__ == '__main__':
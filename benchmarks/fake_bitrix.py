@@ -0,0 +1,530 @@
+"""
+Local stand-in for the Bitrix24 REST API, for load tests and offline benchmarks.
+
+Implements crm.contact.list, crm.deal.list, crm.deal.get, crm.deal.update and batch
+on synthetic data, with configurable latency, error rate and a leaky-bucket rate limit
+like the real portal. Can also fire ONCRMDEALUPDATE webhooks at the bot.
+
+    python benchmarks/fake_bitrix.py --contacts 100000 --rate-limit 2 --latency 0.05
+    BITRIX_WEBHOOK_URL=http://127.0.0.1:8090/rest/1/fake/ python app.py
+
+Contact N (1-based) has phone +38050NNNNNNN (N zero-padded to 7 digits) and deal N.
+GET /stats returns request counters.
+"""
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+from bisect import bisect_right
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import requests
+from flask import Flask, request, jsonify
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 50
+MAX_BATCH_COMMANDS = 50
+
+CATEGORY_STAGES = ['NEW', 'PREPARATION', 'PREPAYMENT_INVOICE', 'EXECUTING', 'FINAL_INVOICE', 'WON', 'LOSE']
+FIRST_NAMES = ['Олександр', 'Марія', 'Іван', 'Олена', 'Андрій', 'Наталія', 'Сергій', 'Тетяна']
+LAST_NAMES = ['Шевченко', 'Коваленко', 'Бондаренко', 'Ткаченко', 'Кравченко', 'Мельник', 'Бойко']
+
+REF_PATTERN = re.compile(r'\$result\[([^\]]+)\]((?:\[[^\]]*\])*)')
+KEY_PATTERN = re.compile(r'^([^\[]+)((?:\[[^\]]*\])*)$')
+FILTER_PATTERN = re.compile(r'^(>=|<=|!=|>|<|@|!@|!|=)?(.+)$')
+
+
+class FakeBitrixError(Exception):
+    def __init__(self, code: str, description: str = '', status: int = 400):
+        super().__init__(code)
+        self.code = code
+        self.description = description
+        self.status = status
+
+
+def phone_digits(phone: str) -> str:
+    return re.sub(r'\D', '', str(phone))
+
+
+def parse_php_query(query: str) -> Dict:
+    """Decode PHP http_build_query encoding (filter[@ID][0]=1) into nested dicts/lists"""
+    root = {}
+    for key, value in parse_qsl(query, keep_blank_values=True):
+        match = KEY_PATTERN.match(key)
+        if not match:
+            continue
+        path = [match.group(1)] + re.findall(r'\[([^\]]*)\]', match.group(2))
+
+        node = root
+        for part in path[:-1]:
+            node = node.setdefault(part, {})
+            if not isinstance(node, dict):
+                break
+        else:
+            last = path[-1]
+            node[last if last != '' else str(len(node))] = value
+
+    return _lists_from_dicts(root)
+
+
+def _lists_from_dicts(value: Any) -> Any:
+    if isinstance(value, dict):
+        value = {k: _lists_from_dicts(v) for k, v in value.items()}
+        if value and all(k.isdigit() for k in value):
+            return [value[k] for k in sorted(value, key=int)]
+    return value
+
+
+class LeakyBucket:
+    """Bitrix-style limit: requests fill the bucket, it drains at `rate` per second"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = 0.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.rate <= 0:
+            return True
+
+        with self._lock:
+            now = time.monotonic()
+            self.level = max(0.0, self.level - (now - self.updated) * self.rate)
+            self.updated = now
+            if self.level + 1 > self.capacity:
+                return False
+            self.level += 1
+            return True
+
+
+class FakeStore:
+    """In-memory contacts and deals with the indexes the client's filters need"""
+
+    def __init__(self, contacts: int, category_id: int, category_share: float, seed: int):
+        self.category_id = category_id
+        self.contacts = {}
+        self.deals = {}
+        self.by_phone = {}
+        self.deals_by_contact = defaultdict(list)
+        self._lock = threading.RLock()
+
+        rng = random.Random(seed)
+        for i in range(1, contacts + 1):
+            phone = f"+38050{i:07d}"
+            self.contacts[i] = {
+                'ID': str(i),
+                'NAME': rng.choice(FIRST_NAMES),
+                'LAST_NAME': rng.choice(LAST_NAMES),
+                'PHONE': [{'ID': str(i), 'VALUE_TYPE': 'MOBILE', 'VALUE': phone, 'TYPE_ID': 'PHONE'}],
+            }
+            self.by_phone[phone_digits(phone)] = i
+
+            in_funnel = rng.random() < category_share
+            category = category_id if in_funnel else 0
+            stage = rng.choice(CATEGORY_STAGES[:5])
+            self.deals[i] = {
+                'ID': str(i),
+                'TITLE': f"Deal {i}",
+                'CATEGORY_ID': str(category),
+                'STAGE_ID': f"C{category}:{stage}" if category else stage,
+                'CONTACT_ID': str(i),
+                'OPPORTUNITY': f"{rng.randint(1, 500) * 1000}.00",
+                'CURRENCY_ID': 'UAH',
+                'UF_CRM_QUESTION_15': '',
+            }
+            self.deals_by_contact[i].append(i)
+
+        self.deal_ids = sorted(self.deals)
+        self.contact_ids = sorted(self.contacts)
+        self.funnel_deal_ids = [d for d in self.deal_ids if self.deals[d]['CATEGORY_ID'] == str(category_id)]
+
+    def table(self, entity: str) -> Tuple[Dict[int, Dict], List[int]]:
+        if entity == 'contact':
+            return self.contacts, self.contact_ids
+        return self.deals, self.deal_ids
+
+    def candidates(self, entity: str, conditions: List[Tuple[str, str, Any]], ascending: bool):
+        """Narrow the scan with an index where the filter allows it"""
+        rows, ids = self.table(entity)
+
+        for op, field, value in conditions:
+            if field == 'ID' and op in ('=', '@'):
+                wanted = value if isinstance(value, list) else [value]
+                return sorted({int(v) for v in wanted if str(v).isdigit()}, reverse=not ascending)
+            if entity == 'contact' and field == 'PHONE' and op == '=':
+                contact_id = self.by_phone.get(phone_digits(value))
+                return [contact_id] if contact_id else []
+            if entity == 'deal' and field == 'CONTACT_ID' and op == '=':
+                return list(self.deals_by_contact.get(int(value), [])) if str(value).isdigit() else []
+
+        for op, field, value in conditions:
+            if field == 'ID' and op in ('>', '>=') and ascending:
+                start = bisect_right(ids, int(value) - (1 if op == '>=' else 0))
+                return (ids[i] for i in range(start, len(ids)))
+
+        return ids if ascending else reversed(ids)
+
+
+def parse_filter(filter: Dict) -> List[Tuple[str, str, Any]]:
+    conditions = []
+    for key, value in (filter or {}).items():
+        op, field = FILTER_PATTERN.match(key).groups()
+        conditions.append((op or '=', field, value))
+    return conditions
+
+
+def matches(row: Dict, conditions: List[Tuple[str, str, Any]]) -> bool:
+    for op, field, expected in conditions:
+        actual = row.get(field)
+
+        if field == 'PHONE':
+            digits = {phone_digits(p['VALUE']) for p in actual or []}
+            if phone_digits(expected) not in digits:
+                return False
+            continue
+
+        if op in ('@', '!@'):
+            values = {str(v) for v in (expected if isinstance(expected, list) else [expected])}
+            if (str(actual) in values) != (op == '@'):
+                return False
+        elif op in ('=', '!', '!='):
+            if (str(actual) == str(expected)) != (op == '='):
+                return False
+        else:
+            try:
+                left, right = float(actual), float(expected)
+            except (TypeError, ValueError):
+                return False
+            if not {'>': left > right, '>=': left >= right, '<': left < right, '<=': left <= right}[op]:
+                return False
+
+    return True
+
+
+class FakeBitrix:
+    """Method handlers plus latency, error and rate limit injection"""
+
+    def __init__(self, store: FakeStore, latency: float = 0.0, jitter: float = 0.0,
+                 command_latency: float = 0.0, error_rate: float = 0.0,
+                 rate_limit: float = 0.0, burst: int = 50, seed: int = 0):
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+        self.command_latency = command_latency
+        self.error_rate = error_rate
+        self.buckets = defaultdict(lambda: LeakyBucket(rate_limit, burst))
+        self.rng = random.Random(seed)
+        self.stats = defaultdict(int)
+        self._stats_lock = threading.Lock()
+        self.methods = {
+            'crm.contact.list': lambda p: self._list('contact', p),
+            'crm.deal.list': lambda p: self._list('deal', p),
+            'crm.deal.get': self._deal_get,
+            'crm.deal.update': self._deal_update,
+            'batch': self._batch,
+        }
+
+    def count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def handle(self, token: str, method: str, params: Dict) -> Tuple[Dict, int]:
+        """Serve one REST call. Returns (payload, HTTP status)"""
+        started = time.monotonic()
+        self.count(f"calls.{method}")
+
+        if not self.buckets[token].allow():
+            self.count('throttled')
+            return {'error': 'QUERY_LIMIT_EXCEEDED', 'error_description': 'Too many requests'}, 503
+
+        delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.count('injected_errors')
+            return {'error': 'INTERNAL_SERVER_ERROR', 'error_description': 'Injected failure'}, 500
+
+        try:
+            payload = self.call(method, params)
+        except FakeBitrixError as e:
+            return {'error': e.code, 'error_description': e.description}, e.status
+
+        finish = time.monotonic()
+        payload['time'] = {'start': started, 'finish': finish, 'duration': finish - started}
+        return payload, 200
+
+    def call(self, method: str, params: Dict) -> Dict:
+        handler = self.methods.get(method)
+        if handler is None:
+            raise FakeBitrixError('ERROR_METHOD_NOT_FOUND', 'Method not found!', 404)
+        return handler(params or {})
+
+    def _list(self, entity: str, params: Dict) -> Dict:
+        conditions = parse_filter(params.get('filter'))
+        order = params.get('order') or {'ID': 'ASC'}
+        select = params.get('select') or []
+        try:
+            start = int(params.get('start') or 0)
+        except ValueError:
+            start = 0
+
+        rows, _ = self.store.table(entity)
+        order_field, direction = next(iter(order.items())) if order else ('ID', 'ASC')
+        ascending = str(direction).upper() != 'DESC'
+
+        with self.store._lock:
+            if order_field == 'ID':
+                candidates = self.store.candidates(entity, conditions, ascending)
+            else:
+                candidates = sorted(self.store.candidates(entity, conditions, True),
+                                    key=lambda i: str(rows[i].get(order_field, '')), reverse=not ascending)
+
+            found = []
+            if start < 0:
+                # start=-1: no counting, just the first page
+                for row_id in candidates:
+                    row = rows.get(row_id)
+                    if row and matches(row, conditions):
+                        found.append(row)
+                        if len(found) == PAGE_SIZE:
+                            break
+                total = None
+                page = found
+            else:
+                found = [rows[i] for i in candidates if i in rows and matches(rows[i], conditions)]
+                total = len(found)
+                page = found[start:start + PAGE_SIZE]
+
+            if select and '*' not in select:
+                fields = set(select) | {'ID'}
+                page = [{k: v for k, v in row.items() if k in fields} for row in page]
+            else:
+                page = [dict(row) for row in page]
+
+        payload = {'result': page}
+        if total is not None:
+            payload['total'] = total
+            if start + PAGE_SIZE < total:
+                payload['next'] = start + PAGE_SIZE
+        return payload
+
+    def _deal_id(self, params: Dict) -> int:
+        try:
+            deal_id = int(params.get('id') or params.get('ID'))
+        except (TypeError, ValueError):
+            raise FakeBitrixError('', 'ID is not defined or invalid.')
+        if deal_id not in self.store.deals:
+            raise FakeBitrixError('', 'Not found')
+        return deal_id
+
+    def _deal_get(self, params: Dict) -> Dict:
+        with self.store._lock:
+            return {'result': dict(self.store.deals[self._deal_id(params)])}
+
+    def _deal_update(self, params: Dict) -> Dict:
+        fields = params.get('fields') or {}
+        with self.store._lock:
+            deal = self.store.deals[self._deal_id(params)]
+            for key, value in fields.items():
+                if key != 'ID':
+                    deal[key] = value if isinstance(value, str) else json.dumps(value)
+        return {'result': True}
+
+    def _batch(self, params: Dict) -> Dict:
+        commands = params.get('cmd') or {}
+        if isinstance(commands, list):
+            commands = dict(enumerate(commands))
+        if len(commands) > MAX_BATCH_COMMANDS:
+            raise FakeBitrixError('ERROR_BATCH_LENGTH_EXCEEDED', 'Max batch length exceeded')
+        halt = str(params.get('halt') or '0') not in ('0', '', 'false')
+
+        results, errors, totals, nexts = {}, {}, {}, {}
+        for name, command in commands.items():
+            name = str(name)
+            method, _, query = str(command).partition('?')
+            if method == 'batch':
+                errors[name] = {'error': 'ERROR_BATCH_METHOD_NOT_ALLOWED', 'error_description': ''}
+                continue
+
+            if self.command_latency:
+                time.sleep(self.command_latency)
+            self.count(f"batch_commands.{method}")
+
+            try:
+                payload = self.call(method, resolve_refs(parse_php_query(query), results))
+            except FakeBitrixError as e:
+                errors[name] = {'error': e.code, 'error_description': e.description}
+                if halt:
+                    break
+                continue
+
+            results[name] = payload['result']
+            if 'total' in payload:
+                totals[name] = payload['total']
+            if 'next' in payload:
+                nexts[name] = payload['next']
+
+        # PHP serializes empty maps as lists
+        return {'result': {
+            'result': results or [],
+            'result_error': errors or [],
+            'result_total': totals or [],
+            'result_next': nexts or [],
+            'result_time': [],
+        }}
+
+
+def resolve_refs(value: Any, results: Dict) -> Any:
+    """Substitute $result[name][0][ID] references with earlier batch results"""
+    if isinstance(value, dict):
+        return {k: resolve_refs(v, results) for k, v in value.items()}
+    if isinstance(value, list):
+        return [resolve_refs(v, results) for v in value]
+    if not isinstance(value, str) or '$result[' not in value:
+        return value
+
+    def lookup(match) -> str:
+        node = results.get(match.group(1))
+        for key in re.findall(r'\[([^\]]*)\]', match.group(2)):
+            if isinstance(node, list) and key.isdigit() and int(key) < len(node):
+                node = node[int(key)]
+            elif isinstance(node, dict) and key in node:
+                node = node[key]
+            else:
+                return ''
+        return '' if node is None else str(node)
+
+    return REF_PATTERN.sub(lookup, value)
+
+
+class WebhookEmitter(threading.Thread):
+    """Posts ONCRMDEALUPDATE events with a new STAGE_ID to the bot at a fixed rate"""
+
+    def __init__(self, fake: FakeBitrix, target: str, rate: float, deals: int = 0, duration: float = 0.0):
+        super().__init__(daemon=True, name='webhook-emitter')
+        self.fake = fake
+        self.target = target
+        self.rate = rate
+        self.duration = duration
+        funnel = fake.store.funnel_deal_ids
+        self.deal_ids = funnel[:deals] if deals else funnel
+        self.session = requests.Session()
+        self.rng = random.Random()
+
+    def run(self):
+        if not self.deal_ids:
+            logger.warning("No deals in the funnel category, webhook emitter is idle")
+            return
+
+        interval = 1.0 / self.rate
+        started = next_at = time.monotonic()
+        category = self.fake.store.category_id
+
+        while not self.duration or time.monotonic() - started < self.duration:
+            deal_id = self.rng.choice(self.deal_ids)
+            stage = f"C{category}:{self.rng.choice(CATEGORY_STAGES)}"
+            with self.fake.store._lock:
+                self.fake.store.deals[deal_id]['STAGE_ID'] = stage
+
+            payload = {
+                'event': 'ONCRMDEALUPDATE',
+                'data': {'FIELDS': {'ID': str(deal_id), 'STAGE_ID': stage}},
+                'ts': str(int(time.time())),
+            }
+            try:
+                response = self.session.post(self.target, json=payload, timeout=10)
+                self.fake.count(f"webhooks.{response.status_code}")
+            except requests.RequestException as e:
+                self.fake.count('webhooks.failed')
+                logger.debug(f"Webhook delivery failed: {e}")
+
+            # Fixed schedule, so a slow receiver lowers throughput instead of bunching events
+            next_at += interval
+            pause = next_at - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+
+        logger.info("Webhook emitter finished")
+
+
+def create_app(fake: FakeBitrix) -> Flask:
+    app = Flask(__name__)
+
+    @app.route('/rest/<user_id>/<token>/<path:method>', methods=['GET', 'POST'])
+    def rest(user_id, token, method):
+        if method.endswith('.json'):
+            method = method[:-len('.json')]
+
+        params = request.get_json(silent=True)
+        if not isinstance(params, dict):
+            params = parse_php_query(request.get_data(as_text=True)) if request.form else {}
+            params.update(parse_php_query(request.query_string.decode()))
+
+        payload, status = fake.handle(token, method, params)
+        return jsonify(payload), status
+
+    @app.route('/stats', methods=['GET'])
+    def stats():
+        with fake._stats_lock:
+            return jsonify(dict(fake.stats))
+
+    return app
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Fake Bitrix24 REST server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--contacts', type=int, default=100000, help='contacts to seed, one deal each')
+    parser.add_argument('--category-id', type=int, default=7, help='funnel used by the bot')
+    parser.add_argument('--category-share', type=float, default=0.5, help='share of deals in the funnel')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random latency, up to seconds')
+    parser.add_argument('--command-latency', type=float, default=0.0, help='seconds per batch command')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of INTERNAL_SERVER_ERROR answers')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='requests/second per webhook, 0 - unlimited')
+    parser.add_argument('--burst', type=int, default=50, help='leaky bucket capacity')
+    parser.add_argument('--webhook-target', help='e.g. http://127.0.0.1:5000/bitrix-webhook')
+    parser.add_argument('--webhook-rate', type=float, default=1.0, help='ONCRMDEALUPDATE events per second')
+    parser.add_argument('--webhook-deals', type=int, default=0,
+                        help='only update the first N funnel deals (those with bot users), 0 - all')
+    parser.add_argument('--webhook-duration', type=float, default=0.0, help='seconds, 0 - until stopped')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    # Per-request access log would dominate the output under load
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    args = parse_args(argv)
+
+    started = time.monotonic()
+    store = FakeStore(args.contacts, args.category_id, args.category_share, args.seed)
+    logger.info(f"Seeded {len(store.contacts)} contacts and {len(store.deals)} deals "
+                f"({len(store.funnel_deal_ids)} in category {args.category_id}) "
+                f"in {time.monotonic() - started:.1f}s")
+
+    fake = FakeBitrix(store, latency=args.latency, jitter=args.jitter, command_latency=args.command_latency,
+                      error_rate=args.error_rate, rate_limit=args.rate_limit, burst=args.burst, seed=args.seed)
+
+    if args.webhook_target:
+        WebhookEmitter(fake, args.webhook_target, args.webhook_rate,
+                       args.webhook_deals, args.webhook_duration).start()
+        logger.info(f"Sending ONCRMDEALUPDATE to {args.webhook_target} at {args.webhook_rate}/s")
+
+    logger.info(f"BITRIX_WEBHOOK_URL=http://{args.host}:{args.port}/rest/1/fake/")
+    create_app(fake).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
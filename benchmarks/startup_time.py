@@ -0,0 +1,97 @@
+"""
+Cold-start benchmark: import time of the bot's modules in fresh interpreters.
+
+    python benchmarks/startup_time.py
+    python benchmarks/startup_time.py --module integrations --runs 20 --first-use
+
+--first-use also times building the Drive service (needs GOOGLE_OAUTH_TOKEN or token.json).
+--importtime prints the slowest imports from `python -X importtime`.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = ['integrations', 'bot.handlers']
+
+IMPORT_SNIPPET = """
+import time
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+FIRST_USE_SNIPPET = """
+import time
+from integrations import google_drive_client
+started = time.perf_counter()
+google_drive_client.service
+print(time.perf_counter() - started)
+"""
+
+
+def run_snippet(code: str) -> float:
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else 'failed')
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def measure(code: str, runs: int) -> List[float]:
+    # One warm-up run so .pyc compilation is not counted
+    run_snippet(code)
+    return [run_snippet(code) for _ in range(runs)]
+
+
+def report(label: str, timings: List[float]):
+    print(f"{label:<30} min {min(timings) * 1000:8.1f} ms   "
+          f"median {statistics.median(timings) * 1000:8.1f} ms   "
+          f"max {max(timings) * 1000:8.1f} ms")
+
+
+def slowest_imports(module: str, top: int):
+    """Cumulative import time per module from -X importtime"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        # "import time:  self [us] | cumulative | imported package"
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), name.strip()))
+
+    print(f"\nSlowest imports under {module} (cumulative):")
+    for cumulative_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Measure import/startup time')
+    parser.add_argument('--module', action='append', help='module to import (repeatable)')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--first-use', action='store_true', help='time building the Drive service')
+    parser.add_argument('--importtime', type=int, default=0, metavar='N', help='show N slowest imports')
+    args = parser.parse_args(argv)
+
+    for module in args.module or DEFAULT_MODULES:
+        try:
+            report(f"import {module}", measure(IMPORT_SNIPPET.format(module=module), args.runs))
+        except RuntimeError as e:
+            print(f"import {module}: {e}")
+        if args.importtime:
+            slowest_imports(module, args.importtime)
+
+    if args.first_use:
+        try:
+            report('Drive service first use', measure(FIRST_USE_SNIPPET, args.runs))
+        except RuntimeError as e:
+            print(f"Drive service first use: {e}")
+
+
+if __name__ == '__main__':
+    main()
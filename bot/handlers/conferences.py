@@ -3,7 +3,7 @@ from telegram import Update
 from telegram.ext import ContextTypes
 from bot.keyboards import reply, inline
 from bot.utils import messages
-from services import conference_service, user_service
+from services import async_conference_service, async_user_service
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -14,7 +14,7 @@ async def show_conferences(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = update.effective_user.id
 
     # Get active conferences
-    conferences = conference_service.get_active_conferences()
+    conferences = await async_conference_service.get_active_conferences()
 
     if not conferences:
         await update.message.reply_text(
@@ -29,8 +29,8 @@ async def show_conferences(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     for conf in conferences:
-        is_registered = conference_service.is_user_registered(conf.id, telegram_id)
-        participants_count = conference_service.get_participants_count(conf.id)
+        is_registered = await async_conference_service.is_user_registered(conf.id, telegram_id)
+        participants_count = await async_conference_service.get_participants_count(conf.id)
 
         message = messages.CONFERENCE_INVITATION.format(
             conf.title,
@@ -61,11 +61,11 @@ async def handle_conference_callback(update: Update, context: ContextTypes.DEFAU
         conference_id = int(data.replace('conf_register_', ''))
 
         # Register user
-        success = conference_service.register_user(conference_id, telegram_id)
+        success = await async_conference_service.register_user(conference_id, telegram_id)
 
         if success:
             # Update conference attendance flag
-            user_service.update_user(telegram_id, conference_attended=True)
+            await async_user_service.update_user(telegram_id, conference_attended=True)
 
             await query.edit_message_text(
                 messages.CONFERENCE_REGISTERED
@@ -1,11 +1,14 @@
+import asyncio
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes
 from bot.keyboards import reply, inline
 from bot.utils import messages
 from bot.utils.document_packages import get_required_documents
-from services import questionnaire_service, document_service, user_service
-from integrations import google_drive_client
+from services import async_questionnaire_service, async_document_service, async_user_service, upload_job_service
+from services.image_processing import image_processing_service
+from .registration import ensure_client_folder
+from config import TELEGRAM_FILE_MAX_SIZE
 
 logger = logging.getLogger(__name__)
 
@@ -15,13 +18,13 @@ async def start_upload(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = update.effective_user.id
 
     # Get user
-    user = user_service.get_user(telegram_id)
+    user = await async_user_service.get_user(telegram_id)
     if not user:
         await update.message.reply_text("Будь ласка, спочатку пройдіть реєстрацію (/start)")
         return
 
     # Get questionnaire answers
-    answers = questionnaire_service.get_answers(telegram_id)
+    answers = await async_questionnaire_service.get_answers(telegram_id)
 
     if not answers:
         await update.message.reply_text("Будь ласка, спочатку заповніть анкету")
@@ -40,6 +43,7 @@ async def start_upload(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Save to context
     context.user_data['required_docs'] = required_docs
     context.user_data['current_doc_index'] = 0
+    context.user_data['current_doc_pages'] = 0
 
     # Show document list
     doc_list = messages.DOCUMENTS_UPLOAD_START + "\n\n"
@@ -58,14 +62,33 @@ async def start_upload(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=reply.get_back_keyboard()
     )
 
+    await update.message.reply_text(
+        _document_request(context),
+        reply_markup=inline.get_next_document_keyboard()
+    )
+
+
+def _current_document(context: ContextTypes.DEFAULT_TYPE):
+    """Name of the required document being collected, or None outside the upload flow"""
+    required_docs = context.user_data.get('required_docs') or []
+    index = context.user_data.get('current_doc_index', 0)
+    return required_docs[index][0] if index < len(required_docs) else None
+
+
+def _document_request(context: ContextTypes.DEFAULT_TYPE) -> str:
+    required_docs = context.user_data['required_docs']
+    index = context.user_data['current_doc_index']
+    return messages.DOCUMENT_REQUEST.format(index + 1, len(required_docs), required_docs[index][0])
+
 
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle document upload"""
     telegram_id = update.effective_user.id
 
-    # Get user
-    user = user_service.get_user(telegram_id)
-    if not user or not user.google_drive_folder_id:
+    # Get user and the Drive folder uploads go to
+    user = await async_user_service.get_user(telegram_id)
+    folder_id = await ensure_client_folder(user) if user else None
+    if not folder_id:
         await update.message.reply_text("Помилка: не знайдено папку на Google Drive")
         return
 
@@ -80,44 +103,51 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Непідтримуваний формат файлу")
         return
 
+    if file.file_size and file.file_size > TELEGRAM_FILE_MAX_SIZE:
+        await update.message.reply_text(
+            messages.DOCUMENT_TOO_LARGE.format(file_name, TELEGRAM_FILE_MAX_SIZE // (1024 * 1024))
+        )
+        return
+
+    # Same Telegram file sent again - no need to download it at all
+    duplicate_of = (
+        await async_document_service.find_duplicate(telegram_id, telegram_file_unique_id=file.file_unique_id)
+        or await asyncio.to_thread(upload_job_service.find_queued, telegram_id, file.file_unique_id)
+    )
+    if duplicate_of:
+        await update.message.reply_text(messages.DOCUMENT_ALREADY_RECEIVED.format(duplicate_of))
+        return
+
     try:
-        # Download file
-        telegram_file = await file.get_file()
-        file_content = await telegram_file.download_as_bytearray()
-
-        # Get documents folder ID
-        with get_session() as session:
-            from database import User
-            user_obj = session.query(User).filter(User.telegram_id == telegram_id).first()
-
-            if not user_obj:
-                await update.message.reply_text("Помилка: користувача не знайдено")
-                return
-
-            # In real implementation, we need to get the documents subfolder ID
-            # For now, use main folder
-            folder_id = user_obj.google_drive_folder_id
-
-        # Upload to Google Drive
-        mime_type = file.mime_type if hasattr(file, 'mime_type') else 'application/octet-stream'
-        google_file_id = google_drive_client.upload_file(
-            bytes(file_content),
-            file_name,
-            folder_id,
-            mime_type
+        # Download and upload to Google Drive are done by the worker; the user is notified when it finishes
+        mime_type = file.mime_type if hasattr(file, 'mime_type') else 'image/jpeg'
+
+        # Photos of one required document are collected and merged into a PDF by the worker
+        document_type = _current_document(context)
+        bundle = bool(document_type) and image_processing_service.enabled and \
+            image_processing_service.can_bundle(mime_type)
+
+        job_id = await asyncio.to_thread(
+            upload_job_service.enqueue,
+            telegram_id=telegram_id,
+            telegram_file_id=file.file_id,
+            file_name=file_name,
+            folder_id=folder_id,
+            mime_type=mime_type,
+            telegram_file_unique_id=file.file_unique_id,
+            document_type=document_type,
+            bundle=bundle
         )
 
-        if google_file_id:
-            # Save to database
-            document_service.save_document(
-                telegram_id=telegram_id,
-                document_type=file_name,
-                file_name=file_name,
-                google_drive_file_id=google_file_id
+        if job_id and bundle:
+            context.user_data['current_doc_pages'] = context.user_data.get('current_doc_pages', 0) + 1
+            await update.message.reply_text(
+                messages.DOCUMENT_PAGE_RECEIVED.format(context.user_data['current_doc_pages'], document_type),
+                reply_markup=inline.get_next_document_keyboard()
             )
-
+        elif job_id:
             await update.message.reply_text(
-                messages.DOCUMENT_UPLOADED.format(file_name),
+                messages.DOCUMENT_RECEIVED.format(file_name),
                 reply_markup=reply.get_main_menu_keyboard()
             )
         else:
@@ -127,5 +157,31 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Error uploading document: {e}")
         await update.message.reply_text(f"Помилка: {str(e)}")
 
+async def handle_next_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Close the current document (its photos become one PDF) and ask for the next one"""
+    query = update.callback_query
+    await query.answer()
+
+    document_type = _current_document(context)
+    if not document_type:
+        await query.edit_message_reply_markup(reply_markup=None)
+        return
+
+    if context.user_data.get('current_doc_pages'):
+        await asyncio.to_thread(upload_job_service.flush_bundles, update.effective_user.id, document_type)
+
+    context.user_data['current_doc_index'] += 1
+    context.user_data['current_doc_pages'] = 0
+    await query.edit_message_reply_markup(reply_markup=None)
 
-from database import get_session
+    if _current_document(context):
+        await query.message.reply_text(
+            _document_request(context),
+            reply_markup=inline.get_next_document_keyboard()
+        )
+    else:
+        context.user_data.pop('required_docs', None)
+        await query.message.reply_text(
+            messages.DOCUMENTS_UPLOAD_COMPLETE,
+            reply_markup=reply.get_main_menu_keyboard()
+        )
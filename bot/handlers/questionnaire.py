@@ -5,8 +5,7 @@ from bot.keyboards import reply
 from bot.utils import messages
 from bot.utils.messages import QUESTIONNAIRE_QUESTIONS
 from bot.utils.document_packages import get_required_documents
-from services import questionnaire_service, user_service
-from integrations import google_drive_client, bitrix_client
+from services import async_questionnaire_service, async_user_service
 from database import User, get_session
 
 logger = logging.getLogger(__name__)
@@ -63,18 +62,9 @@ async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q_num = context.user_data.get('current_question', 1)
     answer = update.message.text
 
-    # Save answer
-    questionnaire_service.save_answer(telegram_id, q_num, answer)
-
-    # Update question 15 in Bitrix if it's the last question
-    if q_num == 15:
-        user = user_service.get_user(telegram_id)
-        if user and user.bitrix_deal_id:
-            bitrix_client.update_deal_custom_field(
-                user.bitrix_deal_id,
-                'UF_CRM_QUESTION_15',
-                answer
-            )
+    # Save answer; question 15 is also written back to the Bitrix deal via the outbox
+    crm_fields = {'UF_CRM_QUESTION_15': answer} if q_num == 15 else None
+    await async_questionnaire_service.save_answer(telegram_id, q_num, answer, crm_fields)
 
     # Move to next question
     context.user_data['current_question'] = q_num + 1
@@ -87,23 +77,16 @@ async def finish_questionnaire(update: Update, context: ContextTypes.DEFAULT_TYP
     telegram_id = update.effective_user.id
 
     # Get all answers
-    answers = questionnaire_service.get_answers(telegram_id)
+    answers = await async_questionnaire_service.get_answers(telegram_id)
 
     # Determine client category
-    category = questionnaire_service.determine_client_category(answers)
+    category = async_questionnaire_service.determine_client_category(answers)
 
     # Update user category
-    user_service.set_client_category(telegram_id, category)
+    await async_user_service.set_client_category(telegram_id, category)
 
     # Save questionnaire to Google Drive
-    user = user_service.get_user(telegram_id)
-    if user and user.google_drive_folder_id:
-        answers_with_questions = questionnaire_service.get_answers_with_questions(telegram_id)
-        google_drive_client.create_questionnaire_file(
-            answers_with_questions,
-            user.phone_number,
-            user.google_drive_folder_id
-        )
+    await async_questionnaire_service.export_questionnaire(telegram_id)
 
     await update.message.reply_text(
         messages.QUESTIONNAIRE_COMPLETE,
@@ -119,6 +102,9 @@ async def finish_questionnaire(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def cancel_questionnaire(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cancel questionnaire"""
+    # Answers changed before cancelling must not leave the Drive copy stale
+    await async_questionnaire_service.export_questionnaire(update.effective_user.id, only_existing=True)
+
     await update.message.reply_text(
         "Анкетування скасовано.",
         reply_markup=reply.get_main_menu_keyboard()
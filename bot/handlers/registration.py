@@ -1,11 +1,14 @@
+import asyncio
 import logging
+import weakref
+from typing import Optional
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, MessageHandler, filters
 from bot.keyboards import reply
 from bot.utils import validators, messages
 from bot.utils.validators import sanitize_folder_name
-from services import user_service
-from integrations import bitrix_client, google_drive_client
+from services import async_user_service, drive_folder_pool
+from integrations import async_bitrix_client, async_google_drive_client, GoogleDriveClient
 from config import STAGE_MAPPING
 
 logger = logging.getLogger(__name__)
@@ -13,13 +16,17 @@ logger = logging.getLogger(__name__)
 # Conversation states
 AWAITING_NAME, AWAITING_PHONE = range(2)
 
+# Folder creation is serialized per user, so a retry from the upload flow does not race
+# the background task started at registration
+_folder_locks = weakref.WeakValueDictionary()
+
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
     telegram_id = update.effective_user.id
 
     # Check if user is already registered
-    if user_service.user_exists(telegram_id):
+    if await async_user_service.user_exists(telegram_id):
         await update.message.reply_text(
             "Ви вже зареєстровані! Використовуйте меню для навігації.",
             reply_markup=reply.get_main_menu_keyboard()
@@ -64,6 +71,69 @@ async def handle_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return AWAITING_PHONE
 
 
+def _folder_lock(telegram_id: int) -> asyncio.Lock:
+    lock = _folder_locks.get(telegram_id)
+    if lock is None:
+        lock = _folder_locks[telegram_id] = asyncio.Lock()
+    return lock
+
+
+async def _create_client_folder(telegram_id: int, folder_name: str) -> Optional[str]:
+    """Create client's folder structure unless the user got one meanwhile. Call with the folder lock held"""
+    user = await async_user_service.get_user(telegram_id)
+    if user and user.google_drive_folder_id:
+        return user.google_drive_folder_id
+
+    folder_structure = await async_google_drive_client.create_folder_structure(folder_name)
+
+    if folder_structure:
+        await async_user_service.set_google_folder(telegram_id, folder_structure['main_folder_id'])
+        logger.info(f"Created Google Drive folder for user {telegram_id}")
+        return folder_structure['main_folder_id']
+
+    logger.error(f"Google Drive folder was not created for user {telegram_id}")
+    return None
+
+
+async def provision_client_folder(telegram_id: int, folder_name: str, pooled: dict = None) -> Optional[str]:
+    """
+    Rename the folder claimed from the pool, or create client's folder structure if none was free.
+    Returns the folder ID, or None if it could not be created (ensure_client_folder retries then).
+    """
+    if pooled:
+        if await async_google_drive_client.rename_file(pooled['folder_id'], folder_name):
+            await asyncio.to_thread(drive_folder_pool.mark_assigned, pooled['folder_id'])
+        # Otherwise the pool refill job retries the rename
+        return pooled['folder_id']
+
+    async with _folder_lock(telegram_id):
+        return await _create_client_folder(telegram_id, folder_name)
+
+
+async def ensure_client_folder(user) -> Optional[str]:
+    """User's Drive folder, provisioned now if that failed in background at registration"""
+    if user.google_drive_folder_id:
+        return user.google_drive_folder_id
+
+    folder_name = GoogleDriveClient.client_folder_name(
+        sanitize_folder_name(user.full_name),
+        user.phone_number.replace('+', '')
+    )
+
+    async with _folder_lock(user.telegram_id):
+        current = await async_user_service.get_user(user.telegram_id)
+        if current and current.google_drive_folder_id:
+            return current.google_drive_folder_id
+
+        logger.info(f"Provisioning missing Google Drive folder for user {user.telegram_id}")
+        pooled = await asyncio.to_thread(drive_folder_pool.claim, user.telegram_id, folder_name)
+        if pooled:
+            await async_user_service.set_google_folder(user.telegram_id, pooled['folder_id'])
+            return await provision_client_folder(user.telegram_id, folder_name, pooled)
+
+        return await _create_client_folder(user.telegram_id, folder_name)
+
+
 async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle phone number input and complete registration"""
     phone = update.message.text.strip()
@@ -83,7 +153,7 @@ async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Search in Bitrix24
     try:
-        bitrix_data = bitrix_client.find_client_in_funnel(cleaned_phone)
+        bitrix_data = await async_bitrix_client.find_client_in_funnel(cleaned_phone)
 
         if not bitrix_data:
             await update.message.reply_text(
@@ -93,7 +163,7 @@ async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return ConversationHandler.END
 
         # Create user in database
-        user = user_service.create_user(
+        user = await async_user_service.create_user(
             telegram_id=telegram_id,
             full_name=full_name,
             phone_number=cleaned_phone,
@@ -108,19 +178,25 @@ async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return ConversationHandler.END
 
-        # Create Google Drive folder structure
-        folder_structure = google_drive_client.create_client_folder_structure(
+        # Take a pre-created Google Drive folder if the pool has one (a single DB update)
+        folder_name = GoogleDriveClient.client_folder_name(
             sanitize_folder_name(full_name),
             cleaned_phone.replace('+', '')
         )
-
-        if folder_structure:
-            user_service.set_google_folder(telegram_id, folder_structure['main_folder_id'])
-            logger.info(f"Created Google Drive folder for user {telegram_id}")
+        pooled = await asyncio.to_thread(drive_folder_pool.claim, telegram_id, folder_name)
+        if pooled:
+            await async_user_service.set_google_folder(telegram_id, pooled['folder_id'])
 
         # Registration success
         await update.message.reply_text(messages.REGISTRATION_SUCCESS)
 
+        # Renaming or creating the folder is not needed until the questionnaire is done,
+        # so it runs in background instead of delaying the reply
+        context.application.create_task(
+            provision_client_folder(telegram_id, folder_name, pooled),
+            update=update
+        )
+
         # Import here to avoid circular import
         from .questionnaire import start_questionnaire
         await start_questionnaire(update, context)
@@ -3,7 +3,7 @@ from telegram import Update
 from telegram.ext import ContextTypes
 from bot.keyboards import reply
 from bot.utils import messages
-from services import user_service
+from services import async_user_service
 from config import STAGE_MAPPING, STAGE_DESCRIPTIONS
 
 logger = logging.getLogger(__name__)
@@ -14,7 +14,7 @@ async def show_roadmap(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = update.effective_user.id
 
     # Get user
-    user = user_service.get_user(telegram_id)
+    user = await async_user_service.get_user(telegram_id)
 
     if not user:
         await update.message.reply_text(
@@ -0,0 +1,36 @@
+import asyncio
+import logging
+from telegram.ext import Application, ContextTypes
+from config import NOTIFICATION_POLL_INTERVAL
+from services import notification_service
+
+logger = logging.getLogger(__name__)
+
+
+async def deliver_scheduled_messages(context: ContextTypes.DEFAULT_TYPE):
+    """Send notifications handed over by web/worker processes"""
+    messages = await asyncio.to_thread(notification_service.claim_due_messages)
+    if not messages:
+        return
+
+    sent_ids = []
+    for message_id, telegram_id, text in messages:
+        try:
+            await context.bot.send_message(chat_id=telegram_id, text=text)
+            sent_ids.append(message_id)
+        except Exception as e:
+            logger.error(f"Error delivering message {message_id} to {telegram_id}: {e}")
+
+    await asyncio.to_thread(notification_service.mark_sent, sent_ids)
+    logger.info(f"Delivered {len(sent_ids)}/{len(messages)} scheduled messages")
+
+
+def setup_jobs(application: Application):
+    """Setup recurring bot jobs"""
+    application.job_queue.run_repeating(
+        deliver_scheduled_messages,
+        interval=NOTIFICATION_POLL_INTERVAL,
+        first=NOTIFICATION_POLL_INTERVAL,
+        name='deliver_scheduled_messages'
+    )
+    logger.info("Bot jobs registered")
@@ -49,6 +49,14 @@ def get_document_upload_options():
     return InlineKeyboardMarkup(keyboard)
 
 
+def get_next_document_keyboard():
+    """Inline keyboard to finish the current document and move to the next one"""
+    keyboard = [
+        [InlineKeyboardButton("➡️ Наступний документ", callback_data="doc_next")]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+
 def get_pagination_keyboard(page: int, total_pages: int, prefix: str):
     """Generic pagination keyboard"""
     keyboard = []
@@ -1,6 +1,7 @@
 import logging
+from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
-from config import TELEGRAM_BOT_TOKEN, setup_logging, DEBUG
+from config import TELEGRAM_BOT_TOKEN, TELEGRAM_MODE, setup_logging, DEBUG
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +30,7 @@ def setup_handlers(application: Application):
     from .handlers import documents
     application.add_handler(MessageHandler(filters.Regex('^📤 Завантажити документи$'), documents.start_upload))
     application.add_handler(MessageHandler(filters.Document.ALL | filters.PHOTO, documents.handle_document))
+    application.add_handler(CallbackQueryHandler(documents.handle_next_document, pattern='^doc_next$'))
 
     # Conferences
     from .handlers import conferences
@@ -47,16 +49,29 @@ def setup_handlers(application: Application):
     logger.info("All handlers registered")
 
 
+async def close_database(application: Application):
+    """Close the async engine's connections while the bot's event loop is still running"""
+    from database import dispose_async_engine
+    await dispose_async_engine()
+
+
 def main():
-    """Main function to run bot in polling mode (for local development)"""
+    """Run the bot process (PROCESS_ROLE=bot) in polling mode"""
     setup_logging(DEBUG)
 
+    if TELEGRAM_MODE == 'webhook':
+        logger.error("Webhook mode is served by the web process, run it with PROCESS_ROLE=all instead")
+        return
+
     # Create application
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    application = Application.builder().token(TELEGRAM_BOT_TOKEN).post_shutdown(close_database).build()
 
-    # Setup handlers
+    # Setup handlers and jobs
     setup_handlers(application)
 
+    from .jobs import setup_jobs
+    setup_jobs(application)
+
     # Initialize database
     from database import init_db
     init_db()
@@ -67,5 +82,4 @@ def main():
 
 
 if __name__ == '__main__':
-    from telegram import Update
     main()
@@ -84,10 +84,36 @@ DOCUMENTS_UPLOAD_START = """
 Натисніть на відповідну кнопку, щоб завантажити документ.
 """
 
+DOCUMENT_REQUEST = """
+📄 Документ {} з {}: {}
+
+Надішліть файл або фото. Якщо документ має кілька сторінок, надішліть фото всіх сторінок, а потім натисніть «Наступний документ».
+"""
+
+DOCUMENT_PAGE_RECEIVED = """
+📥 Сторінку {} документа "{}" отримано. Надішліть наступну або натисніть «Наступний документ».
+"""
+
+DOCUMENT_RECEIVED = """
+📥 Документ "{}" отримано, зберігаємо його. Ми повідомимо, щойно він буде завантажений.
+"""
+
 DOCUMENT_UPLOADED = """
 ✅ Документ "{}" успішно завантажено!
 """
 
+DOCUMENT_ALREADY_RECEIVED = """
+ℹ️ Документ "{}" вже отримано раніше, надсилати його повторно не потрібно.
+"""
+
+DOCUMENT_TOO_LARGE = """
+❌ Файл "{}" завеликий. Максимальний розмір - {} МБ.
+"""
+
+DOCUMENT_UPLOAD_FAILED = """
+❌ Не вдалося зберегти документ "{}". Будь ласка, надішліть його ще раз або зверніться до менеджера.
+"""
+
 DOCUMENTS_UPLOAD_COMPLETE = """
 ✅ Всі необхідні документи завантажені!
 
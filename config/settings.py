@@ -6,14 +6,68 @@ load_dotenv()
 # Telegram
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+# 'polling' or 'webhook'. Webhook mode receives updates on TELEGRAM_WEBHOOK_PATH of the
+# Flask server, so the bot runs inside the web process (PROCESS_ROLE=all, one gunicorn worker)
+TELEGRAM_MODE = os.getenv('TELEGRAM_MODE', 'polling')
+TELEGRAM_WEBHOOK_PATH = '/telegram-webhook'
+# Sent back by Telegram in X-Telegram-Bot-Api-Secret-Token header
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET')
 
 # Bitrix24
 BITRIX_WEBHOOK_URL = os.getenv('BITRIX_WEBHOOK_URL')
 BITRIX_CATEGORY_ID = int(os.getenv('BITRIX_CATEGORY_ID', '7'))
+# Keep-alive connections to the portal, retries for failed calls, request timeout (seconds)
+BITRIX_POOL_SIZE = int(os.getenv('BITRIX_POOL_SIZE', '10'))
+BITRIX_MAX_RETRIES = int(os.getenv('BITRIX_MAX_RETRIES', '3'))
+BITRIX_TIMEOUT = float(os.getenv('BITRIX_TIMEOUT', '10'))
+# Client-side token bucket: requests/second (0 disables) and burst size (webhooks allow ~2 requests/second)
+# for the whole portal; each process gets BITRIX_RATE_SHARE of it (see below)
+BITRIX_RATE_LIMIT = float(os.getenv('BITRIX_RATE_LIMIT', '2'))
+BITRIX_RATE_BURST = int(os.getenv('BITRIX_RATE_BURST', '10'))
+# Contact/deal lookup cache: entries, TTL and TTL of "not found" answers, seconds.
+# Deal webhooks invalidate entries only in the process receiving them, so "not found"
+# (a client retrying registration right after the deal was created) is kept briefly
+BITRIX_CACHE_SIZE = int(os.getenv('BITRIX_CACHE_SIZE', '1000'))
+BITRIX_CACHE_TTL = float(os.getenv('BITRIX_CACHE_TTL', '300'))
+BITRIX_CACHE_NEGATIVE_TTL = float(os.getenv('BITRIX_CACHE_NEGATIVE_TTL', '10'))
+# How often to re-sync deal stages from Bitrix, seconds (0 disables)
+STAGE_RECONCILE_INTERVAL = int(os.getenv('STAGE_RECONCILE_INTERVAL', '3600'))
+# CRM write-back outbox: drain interval (seconds, 0 disables) and rows per pass
+CRM_OUTBOX_INTERVAL = int(os.getenv('CRM_OUTBOX_INTERVAL', '5'))
+CRM_OUTBOX_BATCH_SIZE = int(os.getenv('CRM_OUTBOX_BATCH_SIZE', '200'))
 
 # Google Drive
 GOOGLE_DRIVE_FOLDER_ID = os.getenv('GOOGLE_DRIVE_FOLDER_ID')
 GOOGLE_OAUTH_TOKEN = os.getenv('GOOGLE_OAUTH_TOKEN')
+# The access token is refreshed in background this many seconds before it expires
+GOOGLE_TOKEN_REFRESH_MARGIN = int(os.getenv('GOOGLE_TOKEN_REFRESH_MARGIN', '300'))
+# Drive calls from the bot run on a thread pool of this size (also the concurrency limit)
+DRIVE_MAX_WORKERS = int(os.getenv('DRIVE_MAX_WORKERS', '4'))
+# Spare client folders kept ready for registration: target size (0 disables),
+# refill when fewer than DRIVE_FOLDER_POOL_MIN are left, check interval in seconds
+DRIVE_FOLDER_POOL_SIZE = int(os.getenv('DRIVE_FOLDER_POOL_SIZE', '10'))
+DRIVE_FOLDER_POOL_MIN = int(os.getenv('DRIVE_FOLDER_POOL_MIN', '3'))
+DRIVE_FOLDER_POOL_INTERVAL = int(os.getenv('DRIVE_FOLDER_POOL_INTERVAL', '60'))
+# Files are streamed Telegram -> temp file -> Drive in chunks of this size. Drive's resumable
+# upload needs multiples of 256 KB, so other values are rounded (down, at least 256 KB)
+DRIVE_CHUNK_ALIGNMENT = 256 * 1024
+FILE_TRANSFER_CHUNK_SIZE = max(
+    DRIVE_CHUNK_ALIGNMENT,
+    int(os.getenv('FILE_TRANSFER_CHUNK_SIZE', str(1024 * 1024))) // DRIVE_CHUNK_ALIGNMENT * DRIVE_CHUNK_ALIGNMENT
+)
+# Bot API does not serve files larger than 20 MB
+TELEGRAM_FILE_MAX_SIZE = int(os.getenv('TELEGRAM_FILE_MAX_SIZE', str(20 * 1024 * 1024)))
+# Document upload jobs: parallel uploads per worker process and polling interval, seconds
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', '4'))
+UPLOAD_JOB_INTERVAL = int(os.getenv('UPLOAD_JOB_INTERVAL', '2'))
+# Photos are downscaled to fit an A4 page at this DPI and recompressed (needs Pillow)
+IMAGE_PROCESSING_ENABLED = os.getenv('IMAGE_PROCESSING_ENABLED', 'True').lower() == 'true'
+IMAGE_TARGET_DPI = int(os.getenv('IMAGE_TARGET_DPI', '150'))
+IMAGE_JPEG_QUALITY = int(os.getenv('IMAGE_JPEG_QUALITY', '80'))
+# Photos sent for one required document are merged into a PDF once the user moves on
+# to the next document or sends nothing for this many seconds
+DOCUMENT_BUNDLE_IDLE_SECONDS = int(os.getenv('DOCUMENT_BUNDLE_IDLE_SECONDS', '300'))
+DOCUMENT_BUNDLE_MAX_PAGES = int(os.getenv('DOCUMENT_BUNDLE_MAX_PAGES', '50'))
 
 # Database
 DATABASE_URL = os.getenv('DATABASE_URL')
@@ -23,6 +77,19 @@ if DATABASE_URL and DATABASE_URL.startswith('postgres://'):
 # Admin
 ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', 'f7T9vQ1111wLp2Gx8Z')
 
+# Process role: 'web' (webhook server), 'bot' (the single Telegram bot process),
+# 'worker' (background jobs) or 'all' (everything in one process, for local runs)
+PROCESS_ROLE = os.getenv('PROCESS_ROLE', 'all')
+# Share of BITRIX_RATE_LIMIT/BITRIX_RATE_BURST this process may use. Shares of all running
+# processes should add up to 1; a web process's default is split between its gunicorn workers
+BITRIX_RATE_SHARES = {'all': 1.0, 'bot': 0.5, 'worker': 0.4, 'web': 0.1}
+BITRIX_RATE_SHARE = float(os.getenv(
+    'BITRIX_RATE_SHARE',
+    BITRIX_RATE_SHARES.get(PROCESS_ROLE, 1.0) / (int(os.getenv('WEB_CONCURRENCY', '1')) if PROCESS_ROLE == 'web' else 1)
+))
+# How often the bot process picks up notifications handed over by web processes, seconds
+NOTIFICATION_POLL_INTERVAL = float(os.getenv('NOTIFICATION_POLL_INTERVAL', '2'))
+
 # Server (managed by Render.com)
 PORT = int(os.getenv('PORT', '8080'))
 DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
@@ -57,3 +124,13 @@ CLIENT_CATEGORIES = {
     'MFO': 'МФО',
     'BANK': 'Банки',
 }
+
+# Bitrix webhook ingestion queue
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+# What to do when the queue is full: 'reject' (answer 503) or 'drop_oldest'
+WEBHOOK_QUEUE_OVERFLOW = os.getenv('WEBHOOK_QUEUE_OVERFLOW', 'reject')
+# Seconds to collapse bursts of updates for the same deal into the latest one (0 disables)
+WEBHOOK_COALESCE_WINDOW = float(os.getenv('WEBHOOK_COALESCE_WINDOW', '3'))
+
+# Seconds to remember that a deal has no bot user
+DEAL_INDEX_NEGATIVE_TTL = float(os.getenv('DEAL_INDEX_NEGATIVE_TTL', '600'))
@@ -1,8 +1,11 @@
-from .models import Base, User, QuestionnaireAnswer, Document, Conference, ConferenceRegistration, ScheduledMessage, ClientCategory
+from .models import Base, User, QuestionnaireAnswer, Document, Conference, ConferenceRegistration, ScheduledMessage, ClientCategory, CrmOutbox, PooledDriveFolder, UploadJob, OAuthToken
 from .connection import engine, Session, init_db, get_session, get_db
+from .async_connection import AsyncSessionFactory, get_async_engine, get_async_session, dispose_async_engine
 
 __all__ = [
     'Base', 'User', 'QuestionnaireAnswer', 'Document', 'Conference',
-    'ConferenceRegistration', 'ScheduledMessage', 'ClientCategory',
-    'engine', 'Session', 'init_db', 'get_session', 'get_db'
+    'ConferenceRegistration', 'ScheduledMessage', 'ClientCategory', 'CrmOutbox',
+    'PooledDriveFolder', 'UploadJob', 'OAuthToken',
+    'engine', 'Session', 'init_db', 'get_session', 'get_db',
+    'AsyncSessionFactory', 'get_async_engine', 'get_async_session', 'dispose_async_engine'
 ]
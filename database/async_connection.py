@@ -0,0 +1,59 @@
+from contextlib import asynccontextmanager
+import logging
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from config import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+# Objects stay readable after the session closes; relationships are not lazy-loaded in async code
+AsyncSessionFactory = async_sessionmaker(expire_on_commit=False)
+
+_engine = None
+
+
+def async_database_url(url: str) -> URL:
+    """DATABASE_URL with the asyncpg driver (psycopg2's sslmode becomes asyncpg's ssl)"""
+    url = make_url(url)
+    if url.drivername in ('postgresql', 'postgresql+psycopg2'):
+        url = url.set(drivername='postgresql+asyncpg')
+        sslmode = url.query.get('sslmode')
+        if sslmode:
+            url = url.difference_update_query(['sslmode']).update_query_dict({'ssl': sslmode})
+    return url
+
+
+def get_async_engine() -> AsyncEngine:
+    """
+    Async engine of the bot's event loop, created on first use so processes
+    that never touch it (web, worker) do not need asyncpg
+    """
+    global _engine
+    if _engine is None:
+        _engine = create_async_engine(async_database_url(DATABASE_URL), echo=False, pool_pre_ping=True)
+        AsyncSessionFactory.configure(bind=_engine)
+    return _engine
+
+
+@asynccontextmanager
+async def get_async_session():
+    """Provide a transactional scope for database operations, without blocking the event loop"""
+    get_async_engine()
+    session = AsyncSessionFactory()
+    try:
+        yield session
+        await session.commit()
+    except Exception as e:
+        await session.rollback()
+        logger.error(f"Database session error: {e}")
+        raise
+    finally:
+        await session.close()
+
+
+async def dispose_async_engine():
+    """Close pooled connections, e.g. when the bot shuts down"""
+    global _engine
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
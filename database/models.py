@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Enum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Enum, Index, JSON, BigInteger
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import enum
@@ -15,7 +15,10 @@ class ClientCategory(enum.Enum):
 
 class User(Base):
     __tablename__ = 'pt_users'
-    __table_args__ = {'schema': 'pretrial'}
+    __table_args__ = (
+        Index('idx_pt_users_bitrix_deal', 'bitrix_deal_id'),
+        {'schema': 'pretrial'},
+    )
 
     telegram_id = Column(Integer, primary_key=True)
     full_name = Column(String(255), nullable=False)
@@ -23,12 +26,16 @@ class User(Base):
     bitrix_contact_id = Column(Integer, nullable=True)
     bitrix_deal_id = Column(Integer, nullable=True)
     registration_date = Column(DateTime, default=datetime.utcnow)
+    # When bitrix_deal_id was last set; web processes re-read deals changed since their last sync
+    deal_updated_at = Column(DateTime, nullable=True)
     current_stage = Column(String(50), nullable=True)
     client_category = Column(Enum(ClientCategory), nullable=True)
     conference_attended = Column(Boolean, default=False)
     conference_disabled = Column(Boolean, default=False)
     financial_push_enabled = Column(Boolean, default=False)
     google_drive_folder_id = Column(String(255), nullable=True)
+    # anketa_{phone}.txt on Drive, updated in place on every export
+    questionnaire_file_id = Column(String(255), nullable=True)
 
     # Relationships
     questionnaire_answers = relationship('QuestionnaireAnswer', back_populates='user', cascade='all, delete-orphan')
@@ -58,7 +65,11 @@ class QuestionnaireAnswer(Base):
 
 class Document(Base):
     __tablename__ = 'pt_documents'
-    __table_args__ = {'schema': 'pretrial'}
+    __table_args__ = (
+        Index('idx_pt_documents_hash', 'telegram_id', 'content_hash'),
+        Index('idx_pt_documents_unique_id', 'telegram_id', 'telegram_file_unique_id'),
+        {'schema': 'pretrial'},
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     telegram_id = Column(Integer, ForeignKey('pretrial.pt_users.telegram_id'), nullable=False)
@@ -67,6 +78,9 @@ class Document(Base):
     google_drive_file_id = Column(String(255), nullable=True)
     upload_date = Column(DateTime, default=datetime.utcnow)
     is_validated = Column(Boolean, default=False)
+    content_hash = Column(String(64), nullable=True)  # sha256 hex
+    file_size = Column(BigInteger, nullable=True)
+    telegram_file_unique_id = Column(String(255), nullable=True)
 
     # Relationship
     user = relationship('User', back_populates='documents')
@@ -113,6 +127,20 @@ class ConferenceRegistration(Base):
         return f"<ConferenceRegistration(conf={self.conference_id}, user={self.telegram_id})>"
 
 
+class OAuthToken(Base):
+    """Current access token of an OAuth client, shared by all processes"""
+    __tablename__ = 'pt_oauth_tokens'
+    __table_args__ = {'schema': 'pretrial'}
+
+    name = Column(String(50), primary_key=True)
+    access_token = Column(Text, nullable=True)
+    expires_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<OAuthToken(name='{self.name}', expires_at={self.expires_at})>"
+
+
 class ScheduledMessage(Base):
     __tablename__ = 'pt_scheduled_messages'
     __table_args__ = {'schema': 'pretrial'}
@@ -120,9 +148,12 @@ class ScheduledMessage(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     telegram_id = Column(Integer, nullable=False)
     message_type = Column(String(50), nullable=False)
+    text = Column(Text, nullable=True)
     scheduled_for = Column(DateTime, nullable=False)
     sent = Column(Boolean, default=False)
     sent_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0)
+    claimed_at = Column(DateTime, nullable=True)
 
     def __repr__(self):
         return f"<ScheduledMessage(type='{self.message_type}', user={self.telegram_id})>"
@@ -140,3 +171,84 @@ class Admin(Base):
 
     def __repr__(self):
         return f"<Admin(telegram_id={self.telegram_id}, username='{self.username}')>"
+
+
+class CrmOutbox(Base):
+    __tablename__ = 'pt_crm_outbox'
+    __table_args__ = (
+        Index('idx_pt_crm_outbox_pending', 'status', 'id'),
+        {'schema': 'pretrial'},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    deal_id = Column(Integer, nullable=False)
+    fields = Column(JSON, nullable=False)
+    status = Column(String(20), default='pending')  # pending, sending, done, failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    claimed_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<CrmOutbox(id={self.id}, deal={self.deal_id}, status='{self.status}')>"
+
+
+class PooledDriveFolder(Base):
+    __tablename__ = 'pt_drive_folder_pool'
+    __table_args__ = (
+        Index('idx_pt_drive_folder_pool_status', 'status', 'id'),
+        {'schema': 'pretrial'},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    folder_id = Column(String(255), nullable=False, unique=True)
+    documents_folder_id = Column(String(255), nullable=True)
+    status = Column(String(20), default='ready')  # ready, claimed (rename pending), assigned
+    folder_name = Column(String(255), nullable=True)
+    telegram_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    claimed_at = Column(DateTime, nullable=True)
+    assigned_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<PooledDriveFolder(folder={self.folder_id}, status='{self.status}')>"
+
+
+class UploadJob(Base):
+    __tablename__ = 'pt_upload_jobs'
+    __table_args__ = (
+        Index('idx_pt_upload_jobs_status', 'status', 'next_attempt_at'),
+        Index('idx_pt_upload_jobs_bundle', 'bundle_job_id'),
+        {'schema': 'pretrial'},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    telegram_id = Column(Integer, ForeignKey('pretrial.pt_users.telegram_id'), nullable=False)
+    # Empty for a PDF bundle job; its pages are the jobs pointing at it via bundle_job_id
+    telegram_file_id = Column(String(255), nullable=True)
+    telegram_file_unique_id = Column(String(255), nullable=True)
+    file_name = Column(String(255), nullable=False)
+    mime_type = Column(String(255), nullable=True)
+    folder_id = Column(String(255), nullable=False)
+    # Required document (from DOCUMENT_PACKAGES) the file was sent for
+    document_type = Column(String(255), nullable=True)
+    bundle_job_id = Column(Integer, ForeignKey('pretrial.pt_upload_jobs.id'), nullable=True)
+    # pending, uploading, done, duplicate, failed, split (bundle with no decodable page);
+    # pages of a bundle: collecting -> bundled (-> pending if the page cannot be decoded)
+    status = Column(String(20), default='pending')
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    claimed_at = Column(DateTime, nullable=True)
+    resumable_uri = Column(Text, nullable=True)
+    bytes_uploaded = Column(BigInteger, default=0)
+    content_hash = Column(String(64), nullable=True)
+    file_size = Column(BigInteger, nullable=True)
+    google_drive_file_id = Column(String(255), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<UploadJob(id={self.id}, user={self.telegram_id}, status='{self.status}')>"
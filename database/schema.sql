@@ -15,14 +15,19 @@ CREATE TABLE IF NOT EXISTS pretrial.pt_users (
     bitrix_contact_id INTEGER,
     bitrix_deal_id INTEGER,
     registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    deal_updated_at TIMESTAMP,
     current_stage VARCHAR(50),
     client_category VARCHAR(20),
     conference_attended BOOLEAN DEFAULT FALSE,
     conference_disabled BOOLEAN DEFAULT FALSE,
     financial_push_enabled BOOLEAN DEFAULT FALSE,
-    google_drive_folder_id VARCHAR(255)
+    google_drive_folder_id VARCHAR(255),
+    questionnaire_file_id VARCHAR(255)
 );
 
+ALTER TABLE pretrial.pt_users ADD COLUMN IF NOT EXISTS questionnaire_file_id VARCHAR(255);
+ALTER TABLE pretrial.pt_users ADD COLUMN IF NOT EXISTS deal_updated_at TIMESTAMP;
+
 -- Questionnaire answers table
 CREATE TABLE IF NOT EXISTS pretrial.pt_questionnaire_answers (
     id SERIAL PRIMARY KEY,
@@ -40,9 +45,17 @@ CREATE TABLE IF NOT EXISTS pretrial.pt_documents (
     file_name VARCHAR(255) NOT NULL,
     google_drive_file_id VARCHAR(255),
     upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    is_validated BOOLEAN DEFAULT FALSE
+    is_validated BOOLEAN DEFAULT FALSE,
+    content_hash VARCHAR(64),
+    file_size BIGINT,
+    telegram_file_unique_id VARCHAR(255)
 );
 
+-- Columns added for duplicate detection
+ALTER TABLE pretrial.pt_documents ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+ALTER TABLE pretrial.pt_documents ADD COLUMN IF NOT EXISTS file_size BIGINT;
+ALTER TABLE pretrial.pt_documents ADD COLUMN IF NOT EXISTS telegram_file_unique_id VARCHAR(255);
+
 -- Conferences table
 CREATE TABLE IF NOT EXISTS pretrial.pt_conferences (
     id SERIAL PRIMARY KEY,
@@ -65,16 +78,32 @@ CREATE TABLE IF NOT EXISTS pretrial.pt_conference_registrations (
     UNIQUE(conference_id, telegram_id)
 );
 
+-- Current OAuth access tokens, shared by all processes
+CREATE TABLE IF NOT EXISTS pretrial.pt_oauth_tokens (
+    name VARCHAR(50) PRIMARY KEY,
+    access_token TEXT,
+    expires_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Scheduled messages table
 CREATE TABLE IF NOT EXISTS pretrial.pt_scheduled_messages (
     id SERIAL PRIMARY KEY,
     telegram_id BIGINT NOT NULL,
     message_type VARCHAR(50) NOT NULL,
+    text TEXT,
     scheduled_for TIMESTAMP NOT NULL,
     sent BOOLEAN DEFAULT FALSE,
-    sent_at TIMESTAMP
+    sent_at TIMESTAMP,
+    attempts INTEGER DEFAULT 0,
+    claimed_at TIMESTAMP
 );
 
+-- Columns added for web -> bot notification handoff
+ALTER TABLE pretrial.pt_scheduled_messages ADD COLUMN IF NOT EXISTS text TEXT;
+ALTER TABLE pretrial.pt_scheduled_messages ADD COLUMN IF NOT EXISTS attempts INTEGER DEFAULT 0;
+ALTER TABLE pretrial.pt_scheduled_messages ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP;
+
 -- Admins table
 CREATE TABLE IF NOT EXISTS pretrial.pt_admins (
     telegram_id BIGINT PRIMARY KEY,
@@ -84,13 +113,72 @@ CREATE TABLE IF NOT EXISTS pretrial.pt_admins (
     is_active BOOLEAN DEFAULT TRUE
 );
 
+-- Pending CRM write-backs (drained by the background worker)
+CREATE TABLE IF NOT EXISTS pretrial.pt_crm_outbox (
+    id SERIAL PRIMARY KEY,
+    deal_id INTEGER NOT NULL,
+    fields JSON NOT NULL,
+    status VARCHAR(20) DEFAULT 'pending',
+    attempts INTEGER DEFAULT 0,
+    next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    claimed_at TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    processed_at TIMESTAMP
+);
+
+-- Pre-created client folders on Google Drive, claimed at registration
+CREATE TABLE IF NOT EXISTS pretrial.pt_drive_folder_pool (
+    id SERIAL PRIMARY KEY,
+    folder_id VARCHAR(255) UNIQUE NOT NULL,
+    documents_folder_id VARCHAR(255),
+    status VARCHAR(20) DEFAULT 'ready',
+    folder_name VARCHAR(255),
+    telegram_id BIGINT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    claimed_at TIMESTAMP,
+    assigned_at TIMESTAMP
+);
+
+-- Document uploads processed by worker processes
+CREATE TABLE IF NOT EXISTS pretrial.pt_upload_jobs (
+    id SERIAL PRIMARY KEY,
+    telegram_id BIGINT NOT NULL REFERENCES pretrial.pt_users(telegram_id) ON DELETE CASCADE,
+    telegram_file_id VARCHAR(255),
+    telegram_file_unique_id VARCHAR(255),
+    file_name VARCHAR(255) NOT NULL,
+    mime_type VARCHAR(255),
+    folder_id VARCHAR(255) NOT NULL,
+    document_type VARCHAR(255),
+    bundle_job_id INTEGER REFERENCES pretrial.pt_upload_jobs(id) ON DELETE SET NULL,
+    status VARCHAR(20) DEFAULT 'pending',
+    attempts INTEGER DEFAULT 0,
+    next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    claimed_at TIMESTAMP,
+    resumable_uri TEXT,
+    bytes_uploaded BIGINT DEFAULT 0,
+    content_hash VARCHAR(64),
+    file_size BIGINT,
+    google_drive_file_id VARCHAR(255),
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
 -- Indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_pt_users_phone ON pretrial.pt_users(phone_number);
 CREATE INDEX IF NOT EXISTS idx_pt_users_category ON pretrial.pt_users(client_category);
+CREATE INDEX IF NOT EXISTS idx_pt_users_bitrix_deal ON pretrial.pt_users(bitrix_deal_id);
 CREATE INDEX IF NOT EXISTS idx_pt_questionnaire_user ON pretrial.pt_questionnaire_answers(telegram_id);
 CREATE INDEX IF NOT EXISTS idx_pt_documents_user ON pretrial.pt_documents(telegram_id);
+CREATE INDEX IF NOT EXISTS idx_pt_documents_hash ON pretrial.pt_documents(telegram_id, content_hash);
+CREATE INDEX IF NOT EXISTS idx_pt_documents_unique_id ON pretrial.pt_documents(telegram_id, telegram_file_unique_id);
 CREATE INDEX IF NOT EXISTS idx_pt_conferences_datetime ON pretrial.pt_conferences(date_time);
 CREATE INDEX IF NOT EXISTS idx_pt_conference_regs_conf ON pretrial.pt_conference_registrations(conference_id);
+CREATE INDEX IF NOT EXISTS idx_pt_crm_outbox_pending ON pretrial.pt_crm_outbox(status, id);
+CREATE INDEX IF NOT EXISTS idx_pt_drive_folder_pool_status ON pretrial.pt_drive_folder_pool(status, id);
+CREATE INDEX IF NOT EXISTS idx_pt_upload_jobs_status ON pretrial.pt_upload_jobs(status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_pt_upload_jobs_bundle ON pretrial.pt_upload_jobs(bundle_job_id);
 CREATE INDEX IF NOT EXISTS idx_pt_scheduled_msgs_sent ON pretrial.pt_scheduled_messages(sent, scheduled_for);
 
 -- Grant permissions (adjust as needed)
@@ -0,0 +1,30 @@
+"""
+Regenerate questionnaire files (anketa_{phone}.txt) on Google Drive, e.g. after the template changed.
+Existing files are updated in place.
+
+    python export_questionnaires.py                   # every user with answers
+    python export_questionnaires.py 123456 789012     # selected Telegram IDs
+    python export_questionnaires.py --workers 8
+"""
+import argparse
+import logging
+
+from config import DEBUG, DRIVE_MAX_WORKERS, setup_logging
+from services.questionnaire_service import questionnaire_service
+
+setup_logging(DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Regenerate questionnaire files on Google Drive')
+    parser.add_argument('telegram_ids', nargs='*', type=int, help='users to export (default: all)')
+    parser.add_argument('--workers', type=int, default=DRIVE_MAX_WORKERS, help='concurrent Drive requests')
+    args = parser.parse_args()
+
+    report = questionnaire_service.export_questionnaires(args.telegram_ids or None, args.workers)
+    print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,15 @@
-from .bitrix import bitrix_client, BitrixClient
+from .bitrix import bitrix_client, BitrixClient, async_bitrix_client, AsyncBitrixClient, BitrixError
+from .bitrix import BitrixBatch, BatchResult, bitrix_rate_limiter, BitrixRateLimiter
+from .bitrix import bitrix_lookup_cache, BitrixLookupCache
+from .google_auth import google_token_manager, GoogleTokenManager
 from .google_drive import google_drive_client, GoogleDriveClient
+from .google_drive import async_google_drive_client, AsyncGoogleDriveClient
 
-__all__ = ['bitrix_client', 'BitrixClient', 'google_drive_client', 'GoogleDriveClient']
+__all__ = [
+    'bitrix_client', 'BitrixClient', 'async_bitrix_client', 'AsyncBitrixClient', 'BitrixError',
+    'BitrixBatch', 'BatchResult', 'bitrix_rate_limiter', 'BitrixRateLimiter',
+    'bitrix_lookup_cache', 'BitrixLookupCache',
+    'google_token_manager', 'GoogleTokenManager',
+    'google_drive_client', 'GoogleDriveClient',
+    'async_google_drive_client', 'AsyncGoogleDriveClient'
+]
@@ -1,44 +1,652 @@
+import asyncio
+import heapq
+import itertools
 import requests
+import httpx
 import logging
-from typing import Optional, Dict, List
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List, Any, Tuple, Iterator
+from urllib.parse import quote
+from requests.adapters import HTTPAdapter
 from config import BITRIX_WEBHOOK_URL, BITRIX_CATEGORY_ID
+from config import BITRIX_POOL_SIZE, BITRIX_MAX_RETRIES, BITRIX_TIMEOUT
+from config import BITRIX_RATE_LIMIT, BITRIX_RATE_BURST, BITRIX_RATE_SHARE
+from config import BITRIX_CACHE_SIZE, BITRIX_CACHE_TTL, BITRIX_CACHE_NEGATIVE_TTL
 
 logger = logging.getLogger(__name__)
 
+# Bitrix returns at most 50 rows per list call and accepts up to 50 IDs per filter
+BITRIX_PAGE_SIZE = 50
+# Maximum number of commands in one `batch` call
+BATCH_MAX_COMMANDS = 50
+
+# Error codes worth retrying. QUERY_LIMIT_EXCEEDED means the call was not executed,
+# so it is retried for any method; the rest only for read-only methods
+THROTTLE_ERRORS = {'QUERY_LIMIT_EXCEEDED'}
+TRANSIENT_ERRORS = {'INTERNAL_SERVER_ERROR', 'OPERATION_TIME_LIMIT'}
+READ_ONLY_SUFFIXES = ('.list', '.get', '.fields')
+
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_MAX = 8.0
+
+# Priority classes for the rate limiter, lower is served first
+PRIORITY_INTERACTIVE = 0  # user is waiting for the answer (registration)
+PRIORITY_WRITE = 1        # CRM write-backs
+PRIORITY_BACKGROUND = 2   # sweeps and other bulk jobs
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_WRITE: 'write',
+    PRIORITY_BACKGROUND: 'background',
+}
+
+
+class BitrixError(Exception):
+    def __init__(self, code: str, description: str = '', status: int = None):
+        super().__init__(f"{code}: {description}" if description else code)
+        self.code = code
+        self.status = status
+
+
+# Stands for QUERY_LIMIT_EXCEEDED errors of single commands inside a batch response
+BATCH_THROTTLED = BitrixError('QUERY_LIMIT_EXCEEDED', 'Batch commands throttled')
+
+
+class BitrixRateLimiter:
+    """
+    Token bucket shared by all Bitrix calls of the process.
+    When calls have to wait, higher priority classes get tokens first.
+    """
+
+    def __init__(self, rate: float = BITRIX_RATE_LIMIT, burst: int = BITRIX_RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._stats = {
+            priority: {'acquired': 0, 'waiting': 0, 'max_waiting': 0, 'total_wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+            for priority in PRIORITY_NAMES
+        }
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _join(self, priority: int) -> Optional[tuple]:
+        """Queue up for a token; None if limiting is disabled. Call with _cond held"""
+        stats = self._stats[priority]
+        if self.rate <= 0:
+            # Limiting disabled (e.g. benchmarks against a local fake portal)
+            stats['acquired'] += 1
+            return None
+
+        ticket = (priority, next(self._seq))
+        heapq.heappush(self._waiters, ticket)
+        stats['waiting'] += 1
+        stats['max_waiting'] = max(stats['max_waiting'], stats['waiting'])
+        return ticket
+
+    def _take(self, ticket: tuple) -> float:
+        """Take a token if it is ticket's turn; otherwise seconds to wait. Call with _cond held"""
+        self._refill()
+        if self._waiters[0] == ticket and self._tokens >= 1:
+            heapq.heappop(self._waiters)
+            self._tokens -= 1
+            return 0.0
+        return max(0.01, (1 - self._tokens) / self.rate)
+
+    def _leave(self, ticket: tuple, started: float, acquired: bool):
+        """Update stats and let the next waiter re-check the bucket. Call with _cond held"""
+        stats = self._stats[ticket[0]]
+        stats['waiting'] -= 1
+        if not acquired:
+            # Cancelled while waiting
+            self._waiters.remove(ticket)
+            heapq.heapify(self._waiters)
+        self._cond.notify_all()
+
+        if acquired:
+            waited = time.monotonic() - started
+            stats['acquired'] += 1
+            stats['total_wait_seconds'] += waited
+            stats['max_wait_seconds'] = max(stats['max_wait_seconds'], waited)
+
+    def acquire(self, priority: int = PRIORITY_BACKGROUND):
+        """Block until a token is available for this priority"""
+        started = time.monotonic()
+
+        with self._cond:
+            ticket = self._join(priority)
+            if ticket is None:
+                return
+
+            acquired = False
+            try:
+                while True:
+                    delay = self._take(ticket)
+                    if not delay:
+                        acquired = True
+                        break
+                    self._cond.wait(delay)
+            finally:
+                self._leave(ticket, started, acquired)
+
+    async def acquire_async(self, priority: int = PRIORITY_BACKGROUND):
+        """Wait for a token without blocking the event loop or tying up executor threads"""
+        started = time.monotonic()
+
+        with self._cond:
+            ticket = self._join(priority)
+            if ticket is None:
+                return
+
+        acquired = False
+        try:
+            while True:
+                with self._cond:
+                    delay = self._take(ticket)
+                if not delay:
+                    acquired = True
+                    break
+                await asyncio.sleep(delay)
+        finally:
+            with self._cond:
+                self._leave(ticket, started, acquired)
+
+    def get_stats(self) -> Dict:
+        """Queue depth and wait time per priority class"""
+        with self._cond:
+            self._refill()
+            result = {'rate': self.rate, 'burst': self.burst, 'tokens': round(self._tokens, 2)}
+            for priority, stats in self._stats.items():
+                acquired = stats['acquired']
+                result[PRIORITY_NAMES[priority]] = dict(
+                    stats, avg_wait_seconds=stats['total_wait_seconds'] / acquired if acquired else 0.0
+                )
+            return result
+
+
+def normalize_phone(phone: str) -> str:
+    return phone.replace('+', '').replace(' ', '').replace('-', '')
+
+
+class BitrixLookupCache:
+    """
+    Bounded LRU cache with TTL for contact-by-phone and deals-by-contact lookups.
+    "Not found" answers are cached too, for a shorter negative_ttl.
+    """
+
+    def __init__(self, maxsize: int = BITRIX_CACHE_SIZE, ttl: float = BITRIX_CACHE_TTL,
+                 negative_ttl: float = BITRIX_CACHE_NEGATIVE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._deal_contacts = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def _drop(self, key: tuple, entry: tuple):
+        """Forget deal -> contact links of a removed deals entry. Call with _lock held"""
+        if key[0] != 'deals':
+            return
+        for deal in entry[1] or []:
+            deal_id = str(deal['ID'])
+            if self._deal_contacts.get(deal_id) == key[1]:
+                del self._deal_contacts[deal_id]
+
+    def _get(self, key: tuple) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                    self._drop(key, entry)
+                self._stats['misses'] += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self._stats['negative_hits' if not entry[1] else 'hits'] += 1
+            return True, entry[1]
+
+    def _set(self, key: tuple, value: Any):
+        ttl = self.ttl if value else self.negative_ttl
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._drop(key, previous)
+
+            self._entries[key] = (time.monotonic() + ttl, value)
+            while len(self._entries) > self.maxsize:
+                self._drop(*self._entries.popitem(last=False))
+                self._stats['evictions'] += 1
+
+    def get_contact(self, phone: str) -> Tuple[bool, Optional[Dict]]:
+        return self._get(('phone', normalize_phone(phone)))
+
+    def set_contact(self, phone: str, contacts: Optional[List[Dict]]):
+        """Cache crm.contact.list result; None (failed call) is not cached"""
+        if contacts is not None:
+            self._set(('phone', normalize_phone(phone)), contacts[0] if contacts else None)
+
+    def get_deals(self, contact_id) -> Tuple[bool, Optional[List[Dict]]]:
+        return self._get(('deals', str(contact_id)))
+
+    def set_deals(self, contact_id, deals: Optional[List[Dict]]):
+        """Cache crm.deal.list result for contact; None (failed call) is not cached"""
+        if deals is None:
+            return
+
+        self._set(('deals', str(contact_id)), deals)
+        with self._lock:
+            for deal in deals:
+                self._deal_contacts[str(deal['ID'])] = str(contact_id)
+
+    def invalidate_deal(self, deal_id):
+        """
+        Drop cached deals of the contact that owns deal (called on deal webhooks).
+        Only reaches the cache of the process receiving webhooks; elsewhere (the bot process)
+        entries expire after their TTL, and "not found" answers after the short negative_ttl.
+        """
+        with self._lock:
+            contact_id = self._deal_contacts.get(str(deal_id))
+            if contact_id is None:
+                return
+            key = ('deals', contact_id)
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._drop(key, entry)
+                self._stats['invalidations'] += 1
+            self._deal_contacts.pop(str(deal_id), None)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+            stats['deal_links'] = len(self._deal_contacts)
+        lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['hits'] + stats['negative_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+# One bucket and one lookup cache per process, shared by sync and async clients.
+# The portal limit applies to all processes together, so each takes its share of it
+bitrix_rate_limiter = BitrixRateLimiter(BITRIX_RATE_LIMIT * BITRIX_RATE_SHARE,
+                                        max(1, round(BITRIX_RATE_BURST * BITRIX_RATE_SHARE)))
+bitrix_lookup_cache = BitrixLookupCache()
+
+
+def parse_response(status: int, body: str, json_loader) -> Dict:
+    """Turn HTTP response into Bitrix payload or raise BitrixError"""
+    try:
+        data = json_loader()
+    except ValueError:
+        raise BitrixError('INVALID_RESPONSE' if status < 400 else f'HTTP_{status}', body[:200], status)
+
+    if 'error' in data:
+        raise BitrixError(data['error'], data.get('error_description', ''), status)
+
+    if status >= 400:
+        raise BitrixError(f'HTTP_{status}', '', status)
+
+    return data
+
+
+def build_query(params: Dict) -> str:
+    """Encode params like PHP http_build_query (filter[ID]=1&select[0]=ID), as batch commands expect"""
+    pairs = []
+
+    def walk(key: str, value: Any):
+        if isinstance(value, dict):
+            for k, v in value.items():
+                walk(f"{key}[{k}]", v)
+        elif isinstance(value, (list, tuple)):
+            for i, v in enumerate(value):
+                walk(f"{key}[{i}]", v)
+        else:
+            if value is None:
+                value = ''
+            elif isinstance(value, bool):
+                value = int(value)
+            pairs.append(f"{quote(key, safe='[]')}={quote(str(value), safe='')}")
+
+    for key, value in (params or {}).items():
+        walk(str(key), value)
+
+    return '&'.join(pairs)
+
+
+class BatchResult:
+    """Per-command results and errors of an executed batch"""
 
-class BitrixClient:
     def __init__(self):
+        self.results = {}
+        self.errors = {}
+        self.totals = {}
+
+    def get(self, name: str, default=None):
+        return self.results.get(name, default)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def error(self, name: str) -> Optional[str]:
+        """Error of a command as "CODE: description", None if it succeeded"""
+        if name in self.results and name not in self.errors:
+            return None
+        error = self.errors.get(name)
+        if not isinstance(error, dict):
+            return 'No result'
+        code, description = error.get('error', 'UNKNOWN'), error.get('error_description')
+        return f"{code}: {description}" if description else code
+
+    def _merge(self, names: List[str], data: Optional[Dict]):
+        # Commands run again replace the errors of their previous attempt
+        for name in names:
+            self.errors.pop(name, None)
+
+        if data is None:
+            # The whole batch request failed
+            for name in names:
+                self.errors[name] = {'error': 'BATCH_FAILED', 'error_description': 'Batch request failed'}
+            return
+
+        # PHP serializes empty maps as lists
+        for attr, key in ((self.results, 'result'), (self.errors, 'result_error'), (self.totals, 'result_total')):
+            value = data.get(key) or {}
+            if isinstance(value, list):
+                value = dict(enumerate(value))
+            attr.update(value)
+
+
+# $result[name] in batch command params
+REFERENCE_PATTERN = re.compile(r'\$result\[(\w+)\]')
+
+
+class BitrixBatch:
+    """
+    Builder for the Bitrix `batch` method.
+    Commands can reference earlier results with BitrixBatch.ref(name, '[0][ID]').
+    More than 50 commands are split into several calls; references only work within one call.
+    """
+
+    def __init__(self, halt: bool = False):
+        self.halt = halt
+        self.commands = {}
+
+    def add(self, name: str, method: str, params: Dict = None) -> 'BitrixBatch':
+        if name in self.commands:
+            raise ValueError(f"Duplicate batch command name: {name}")
+        self.commands[name] = (method, params or {})
+        return self
+
+    @staticmethod
+    def ref(name: str, path: str = '') -> str:
+        """Reference to the result of another command, e.g. ref('contact', '[0][ID]')"""
+        return f"$result[{name}]{path}"
+
+    def __len__(self):
+        return len(self.commands)
+
+    @property
+    def read_only(self) -> bool:
+        """Batches of read-only commands are safe to retry"""
+        return all(method.endswith(READ_ONLY_SUFFIXES) for method, _ in self.commands.values())
+
+    def _params(self, names: List[str]) -> Dict:
+        cmd = {}
+        for name in names:
+            method, params = self.commands[name]
+            cmd[name] = f"{method}?{build_query(params)}" if params else method
+        return {'halt': int(self.halt), 'cmd': cmd}
+
+    def chunks(self) -> List[tuple]:
+        """List of (command names, batch params) for each request"""
+        names = list(self.commands)
+        return [(names[i:i + BATCH_MAX_COMMANDS], self._params(names[i:i + BATCH_MAX_COMMANDS]))
+                for i in range(0, len(names), BATCH_MAX_COMMANDS)]
+
+    def retry_chunk(self, names: List[str]) -> tuple:
+        """(command names, batch params) to run names again, with the commands they reference"""
+        selected = set()
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name not in selected and name in self.commands:
+                selected.add(name)
+                pending.extend(REFERENCE_PATTERN.findall(str(self.commands[name][1])))
+
+        chunk = [name for name in self.commands if name in selected]
+        return chunk, self._params(chunk)
+
+
+class BaseBitrixClient:
+    """Request building, retry policy and stats shared by sync and async clients"""
+
+    # Network-level exceptions of the underlying HTTP library
+    transport_errors = ()
+    # The subset worth retrying; the rest (bad URL, missing schema...) will never succeed
+    retryable_transport_errors = ()
+
+    def __init__(self, pool_size: int = BITRIX_POOL_SIZE, max_retries: int = BITRIX_MAX_RETRIES,
+                 limiter: BitrixRateLimiter = None, cache: BitrixLookupCache = None):
         self.webhook_url = BITRIX_WEBHOOK_URL
         self.category_id = BITRIX_CATEGORY_ID
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.limiter = limiter or bitrix_rate_limiter
+        self.cache = cache or bitrix_lookup_cache
 
-    def _make_request(self, method: str, params: Dict = None) -> Optional[Dict]:
-        """Make request to Bitrix24 API"""
-        try:
-            url = f"{self.webhook_url}{method}"
-            response = requests.post(url, json=params or {}, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+        self._stats_lock = threading.Lock()
+        self._stats = {}
 
-            if 'error' in data:
-                logger.error(f"Bitrix API error: {data['error']}")
-                return None
+    def _retry_delay(self, method: str, error: Exception, retries: int, read_only: bool) -> Optional[float]:
+        """Backoff before next attempt, or None if the call must not be retried"""
+        if retries >= self.max_retries:
+            return None
+
+        if isinstance(error, BitrixError):
+            if error.code in THROTTLE_ERRORS or error.status == 429:
+                retryable = True
+            else:
+                transient = error.code in TRANSIENT_ERRORS or (error.status or 0) >= 500
+                retryable = transient and read_only
+        else:
+            retryable = read_only and isinstance(error, self.retryable_transport_errors)
 
-            return data.get('result')
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Bitrix request error: {e}")
+        if not retryable:
             return None
 
-    def find_contact_by_phone(self, phone: str) -> Optional[Dict]:
-        """Find contact in Bitrix24 by phone number"""
-        # Clean phone number
-        phone_clean = phone.replace('+', '').replace(' ', '').replace('-', '')
+        # Jittered exponential backoff
+        delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** retries) * random.uniform(0.5, 1.0)
+        logger.warning(f"Bitrix {method} failed ({error}), retry {retries + 1}/{self.max_retries} in {delay:.1f}s")
+        return delay
 
-        params = {
-            'filter': {'PHONE': phone_clean},
+    def _log_failure(self, error: Exception):
+        if isinstance(error, BitrixError):
+            logger.error(f"Bitrix API error: {error}")
+        else:
+            logger.error(f"Bitrix request error: {error}")
+
+    def _record(self, method: str, started: float, retries: int, failed: bool):
+        elapsed = time.monotonic() - started
+        with self._stats_lock:
+            stats = self._stats.setdefault(method, {
+                'calls': 0, 'errors': 0, 'retries': 0, 'total_seconds': 0.0, 'max_seconds': 0.0
+            })
+            stats['calls'] += 1
+            stats['errors'] += int(failed)
+            stats['retries'] += retries
+            stats['total_seconds'] += elapsed
+            stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+
+    def get_stats(self) -> Dict:
+        """Per-method latency stats"""
+        with self._stats_lock:
+            result = {}
+            for method, stats in self._stats.items():
+                result[method] = dict(stats, avg_seconds=stats['total_seconds'] / stats['calls'])
+            return result
+
+    @staticmethod
+    def _contact_by_phone_params(phone: str) -> Dict:
+        return {
+            'filter': {'PHONE': normalize_phone(phone)},
             'select': ['ID', 'NAME', 'LAST_NAME', 'PHONE']
         }
 
-        result = self._make_request('crm.contact.list', params)
+    def _deals_by_contact_params(self, contact_id: int) -> Dict:
+        return {
+            'filter': {
+                'CONTACT_ID': contact_id,
+                'CATEGORY_ID': self.category_id
+            },
+            'select': ['ID', 'TITLE', 'STAGE_ID', 'OPPORTUNITY', 'CURRENCY_ID', 'CONTACT_ID']
+        }
+
+    def _funnel_batch(self, phone: str) -> BitrixBatch:
+        """Contact lookup and its deals in category in one round trip"""
+        return BitrixBatch() \
+            .add('contact', 'crm.contact.list', self._contact_by_phone_params(phone)) \
+            .add('deals', 'crm.deal.list', self._deals_by_contact_params(BitrixBatch.ref('contact', '[0][ID]')))
+
+    @staticmethod
+    def _deal_stages_batch(deal_ids: List[int]) -> BitrixBatch:
+        """One crm.deal.list command per 50 IDs"""
+        batch = BitrixBatch()
+        for i in range(0, len(deal_ids), BITRIX_PAGE_SIZE):
+            batch.add(f"stages_{i}", 'crm.deal.list', {
+                'filter': {'@ID': deal_ids[i:i + BITRIX_PAGE_SIZE]},
+                'select': ['ID', 'STAGE_ID']
+            })
+        return batch
+
+    @staticmethod
+    def _deal_updates_batch(updates: Dict[int, Dict]) -> BitrixBatch:
+        batch = BitrixBatch()
+        for deal_id, fields in updates.items():
+            batch.add(f"deal_{deal_id}", 'crm.deal.update', {'id': deal_id, 'fields': fields})
+        return batch
+
+    def _store_funnel(self, phone: str, result: BatchResult) -> Tuple[Optional[Dict], List[Dict]]:
+        """Cache funnel batch results (failed commands are not cached) and unpack them"""
+        contacts = result.get('contact') if 'contact' not in result.errors else None
+        self.cache.set_contact(phone, contacts)
+
+        # A batch cannot skip a command: with no contact the deals filter reference resolves
+        # to nothing and Bitrix lists the whole category, so those deals are discarded
+        contact = contacts[0] if contacts else None
+        if not contact:
+            return None, []
+
+        deals = result.get('deals') if 'deals' not in result.errors else None
+        if deals is not None:
+            deals = [deal for deal in deals if str(deal.get('CONTACT_ID')) == str(contact['ID'])]
+        self.cache.set_deals(contact['ID'], deals)
+        return contact, deals or []
+
+    @staticmethod
+    def _throttled_commands(data: Optional[Dict]) -> List[str]:
+        """Commands of a batch response rejected by the rate limit (they were not executed)"""
+        errors = (data or {}).get('result_error') or {}
+        if isinstance(errors, list):
+            errors = dict(enumerate(errors))
+        return [name for name, error in errors.items()
+                if isinstance(error, dict) and error.get('error') in THROTTLE_ERRORS]
+
+    def _funnel_result(self, phone: str, contact: Optional[Dict], deals: List[Dict]) -> Optional[Dict]:
+        if not contact:
+            logger.info(f"Contact not found for phone: {phone}")
+            return None
+
+        contact_id = contact['ID']
+        logger.info(f"Found contact ID: {contact_id}")
+
+        if not deals:
+            logger.info(f"No deals found in category {self.category_id} for contact {contact_id}")
+            return None
+
+        # Take first active deal
+        deal = deals[0]
+        logger.info(f"Found deal ID: {deal['ID']} with stage: {deal['STAGE_ID']}")
+
+        return {
+            'contact_id': contact_id,
+            'deal_id': deal['ID'],
+            'current_stage': deal['STAGE_ID'],
+            'contact_name': f"{contact.get('NAME', '')} {contact.get('LAST_NAME', '')}".strip()
+        }
+
+
+class BitrixClient(BaseBitrixClient):
+    transport_errors = (requests.exceptions.RequestException,)
+    retryable_transport_errors = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+    def __init__(self, pool_size: int = BITRIX_POOL_SIZE, max_retries: int = BITRIX_MAX_RETRIES,
+                 limiter: BitrixRateLimiter = None, cache: BitrixLookupCache = None):
+        super().__init__(pool_size, max_retries, limiter, cache)
+
+        # One keep-alive connection pool shared by per-thread sessions
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._local = threading.local()
+
+    def _get_session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', self._adapter)
+            session.mount('http://', self._adapter)
+            self._local.session = session
+        return session
+
+    def _post(self, method: str, params: Dict) -> Dict:
+        """Single HTTP call. Raises BitrixError or requests.RequestException"""
+        response = self._get_session().post(f"{self.webhook_url}{method}", json=params, timeout=BITRIX_TIMEOUT)
+        return parse_response(response.status_code, response.text, response.json)
+
+    def _make_request(self, method: str, params: Dict = None, full_response: bool = False,
+                      read_only: bool = None, priority: int = PRIORITY_INTERACTIVE) -> Optional[Dict]:
+        """Make request to Bitrix24 API. With full_response returns paging info (next, total) too"""
+        if read_only is None:
+            read_only = method.endswith(READ_ONLY_SUFFIXES)
+
+        started = time.monotonic()
+        retries = 0
+
+        while True:
+            self.limiter.acquire(priority)
+            try:
+                data = self._post(method, params or {})
+                self._record(method, started, retries, failed=False)
+                return data if full_response else data.get('result')
+            except (BitrixError,) + self.transport_errors as e:
+                delay = self._retry_delay(method, e, retries, read_only)
+                if delay is not None:
+                    retries += 1
+                    time.sleep(delay)
+                    continue
+
+                self._record(method, started, retries, failed=True)
+                self._log_failure(e)
+                return None
+
+    def find_contact_by_phone(self, phone: str) -> Optional[Dict]:
+        """Find contact in Bitrix24 by phone number"""
+        hit, contact = self.cache.get_contact(phone)
+        if hit:
+            return contact
+
+        result = self._make_request('crm.contact.list', self._contact_by_phone_params(phone))
+        self.cache.set_contact(phone, result)
 
         if result and len(result) > 0:
             return result[0]
@@ -47,24 +655,131 @@ class BitrixClient:
 
     def get_deals_by_contact(self, contact_id: int) -> List[Dict]:
         """Get all deals for contact in specific category"""
-        params = {
-            'filter': {
-                'CONTACT_ID': contact_id,
-                'CATEGORY_ID': self.category_id
-            },
-            'select': ['ID', 'TITLE', 'STAGE_ID', 'OPPORTUNITY', 'CURRENCY_ID']
-        }
+        hit, deals = self.cache.get_deals(contact_id)
+        if hit:
+            return deals
 
-        result = self._make_request('crm.deal.list', params)
+        result = self._make_request('crm.deal.list', self._deals_by_contact_params(contact_id))
+        self.cache.set_deals(contact_id, result)
 
         return result if result else []
 
+    def iter_list(self, method: str, filter: Dict = None, select: List[str] = None, order: Dict = None,
+                  prefetch: bool = False, keyset: bool = False,
+                  priority: int = PRIORITY_BACKGROUND) -> Iterator[Dict]:
+        """
+        Lazily yield rows of a crm.*.list method across all pages.
+        prefetch - fetch the next page in background while the caller processes the current one.
+        keyset - page by ID > last seen ID with start=-1 instead of start/next offsets;
+        Bitrix skips counting rows then, which is much faster on large sets (ignores order).
+        Raises BitrixError if a page cannot be fetched, so results are never silently truncated.
+        """
+        params = {'filter': dict(filter or {})}
+        if select:
+            params['select'] = list(select)
+        if keyset:
+            params['order'] = {'ID': 'ASC'}
+            params['start'] = -1
+        else:
+            params['order'] = order or {}
+            params['start'] = 0
+
+        def fetch(page_params: Dict) -> Dict:
+            data = self._make_request(method, page_params, full_response=True, priority=priority)
+            if data is None:
+                raise BitrixError('PAGE_FETCH_FAILED', f"{method} start={page_params.get('start')}")
+            return data
+
+        def next_params(page: Dict) -> Optional[Dict]:
+            rows = page.get('result') or []
+            if keyset:
+                if len(rows) < BITRIX_PAGE_SIZE:
+                    return None
+                return dict(params, filter=dict(params['filter'], **{'>ID': rows[-1]['ID']}))
+            if page.get('next') is None:
+                return None
+            return dict(params, start=page['next'])
+
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='bitrix-prefetch') if prefetch else None
+        try:
+            page = fetch(params)
+            while page is not None:
+                following = next_params(page)
+                pending = executor.submit(fetch, following) if executor and following else None
+
+                yield from page.get('result') or []
+
+                if following is None:
+                    break
+                page = pending.result() if pending else fetch(following)
+        finally:
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def iter_contacts(self, filter: Dict = None, select: List[str] = None, **kwargs) -> Iterator[Dict]:
+        """Lazily iterate contacts matching filter"""
+        return self.iter_list('crm.contact.list', filter, select, **kwargs)
+
+    def iter_deals(self, filter: Dict = None, select: List[str] = None, **kwargs) -> Iterator[Dict]:
+        """Lazily iterate deals matching filter"""
+        return self.iter_list('crm.deal.list', filter, select, **kwargs)
+
+    def iter_category_deals(self, select: List[str] = None, **kwargs) -> Iterator[Dict]:
+        """Lazily iterate all deals of the bot's funnel (category)"""
+        kwargs.setdefault('keyset', True)
+        return self.iter_deals({'CATEGORY_ID': self.category_id}, select or ['ID', 'STAGE_ID'], **kwargs)
+
     def get_deal(self, deal_id: int) -> Optional[Dict]:
         """Get deal by ID"""
         params = {'id': deal_id}
         result = self._make_request('crm.deal.get', params)
         return result
 
+    def execute_batch(self, batch: BitrixBatch, priority: int = PRIORITY_BACKGROUND) -> BatchResult:
+        """Execute batch, 50 commands per request"""
+        result = BatchResult()
+
+        for names, params in batch.chunks():
+            retries = 0
+            while True:
+                data = self._make_request('batch', params, read_only=batch.read_only, priority=priority)
+                result._merge(names, data)
+
+                throttled = self._throttled_commands(data)
+                delay = self._retry_delay('batch', BATCH_THROTTLED, retries, batch.read_only) if throttled else None
+                if delay is None:
+                    break
+                retries += 1
+                time.sleep(delay)
+                names, params = batch.retry_chunk(throttled)
+
+        if result.errors:
+            logger.warning(f"Bitrix batch errors: {result.errors}")
+
+        return result
+
+    def batch(self) -> BitrixBatch:
+        return BitrixBatch()
+
+    def get_deal_stages(self, deal_ids: List[int]) -> Dict[int, str]:
+        """
+        Get STAGE_ID for many deals: crm.deal.list with 50 IDs per command, 50 commands per batch.
+        Deals that could not be fetched are missing from the result.
+        """
+        result = self.execute_batch(self._deal_stages_batch(deal_ids))
+
+        stages = {}
+        for deals in result.results.values():
+            for deal in deals or []:
+                stages[int(deal['ID'])] = deal['STAGE_ID']
+
+        return stages
+
+    def update_deals(self, updates: Dict[int, Dict]) -> Dict[int, Optional[str]]:
+        """Update fields of many deals via batch. Returns error per deal_id, None if it was updated"""
+        result = self.execute_batch(self._deal_updates_batch(updates), PRIORITY_WRITE)
+        return {deal_id: result.error(f"deal_{deal_id}") for deal_id in updates}
+
     def update_deal_field(self, deal_id: int, field_name: str, value: str) -> bool:
         """Update specific field in deal"""
         params = {
@@ -72,7 +787,7 @@ class BitrixClient:
             'fields': {field_name: value}
         }
 
-        result = self._make_request('crm.deal.update', params)
+        result = self._make_request('crm.deal.update', params, priority=PRIORITY_WRITE)
         return result is not None
 
     def update_deal_custom_field(self, deal_id: int, field_code: str, value: str) -> bool:
@@ -84,32 +799,169 @@ class BitrixClient:
         Find client in Bitrix24 by phone and check if they have deal in category 7
         Returns dict with contact_id, deal_id, and current_stage or None
         """
-        # Find contact
-        contact = self.find_contact_by_phone(phone)
-        if not contact:
-            logger.info(f"Contact not found for phone: {phone}")
-            return None
+        hit, contact = self.cache.get_contact(phone)
+        if hit:
+            deals = self.get_deals_by_contact(contact['ID']) if contact else []
+            return self._funnel_result(phone, contact, deals)
 
-        contact_id = contact['ID']
-        logger.info(f"Found contact ID: {contact_id}")
+        result = self.execute_batch(self._funnel_batch(phone), PRIORITY_INTERACTIVE)
+        contact, deals = self._store_funnel(phone, result)
+        return self._funnel_result(phone, contact, deals)
 
-        # Get deals in category 7
-        deals = self.get_deals_by_contact(contact_id)
-        if not deals:
-            logger.info(f"No deals found in category {self.category_id} for contact {contact_id}")
-            return None
 
-        # Take first active deal
-        deal = deals[0]
-        logger.info(f"Found deal ID: {deal['ID']} with stage: {deal['STAGE_ID']}")
+class AsyncBitrixClient(BaseBitrixClient):
+    """Asyncio counterpart of BitrixClient for use inside bot handlers"""
 
-        return {
-            'contact_id': contact_id,
-            'deal_id': deal['ID'],
-            'current_stage': deal['STAGE_ID'],
-            'contact_name': f"{contact.get('NAME', '')} {contact.get('LAST_NAME', '')}".strip()
+    transport_errors = (httpx.HTTPError,)
+    retryable_transport_errors = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+
+    def __init__(self, pool_size: int = BITRIX_POOL_SIZE, max_retries: int = BITRIX_MAX_RETRIES,
+                 limiter: BitrixRateLimiter = None, cache: BitrixLookupCache = None):
+        super().__init__(pool_size, max_retries, limiter, cache)
+        self._client = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created lazily so the pool belongs to the running (bot) event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=BITRIX_TIMEOUT,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _post(self, method: str, params: Dict) -> Dict:
+        """Single HTTP call. Raises BitrixError or httpx.HTTPError"""
+        response = await self._get_client().post(f"{self.webhook_url}{method}", json=params)
+        return parse_response(response.status_code, response.text, response.json)
+
+    async def _make_request(self, method: str, params: Dict = None, full_response: bool = False,
+                            read_only: bool = None, priority: int = PRIORITY_INTERACTIVE) -> Optional[Dict]:
+        """Make request to Bitrix24 API. With full_response returns paging info (next, total) too"""
+        if read_only is None:
+            read_only = method.endswith(READ_ONLY_SUFFIXES)
+
+        started = time.monotonic()
+        retries = 0
+
+        while True:
+            await self.limiter.acquire_async(priority)
+            try:
+                data = await self._post(method, params or {})
+                self._record(method, started, retries, failed=False)
+                return data if full_response else data.get('result')
+            except (BitrixError,) + self.transport_errors as e:
+                delay = self._retry_delay(method, e, retries, read_only)
+                if delay is not None:
+                    retries += 1
+                    await asyncio.sleep(delay)
+                    continue
+
+                self._record(method, started, retries, failed=True)
+                self._log_failure(e)
+                return None
+
+    async def find_contact_by_phone(self, phone: str) -> Optional[Dict]:
+        """Find contact in Bitrix24 by phone number"""
+        hit, contact = self.cache.get_contact(phone)
+        if hit:
+            return contact
+
+        result = await self._make_request('crm.contact.list', self._contact_by_phone_params(phone))
+        self.cache.set_contact(phone, result)
+
+        if result and len(result) > 0:
+            return result[0]
+
+        return None
+
+    async def get_deals_by_contact(self, contact_id: int) -> List[Dict]:
+        """Get all deals for contact in specific category"""
+        hit, deals = self.cache.get_deals(contact_id)
+        if hit:
+            return deals
+
+        result = await self._make_request('crm.deal.list', self._deals_by_contact_params(contact_id))
+        self.cache.set_deals(contact_id, result)
+
+        return result if result else []
+
+    async def get_deal(self, deal_id: int) -> Optional[Dict]:
+        """Get deal by ID"""
+        return await self._make_request('crm.deal.get', {'id': deal_id})
+
+    async def execute_batch(self, batch: BitrixBatch, priority: int = PRIORITY_BACKGROUND) -> BatchResult:
+        """Execute batch, 50 commands per request"""
+        result = BatchResult()
+
+        for names, params in batch.chunks():
+            retries = 0
+            while True:
+                data = await self._make_request('batch', params, read_only=batch.read_only, priority=priority)
+                result._merge(names, data)
+
+                throttled = self._throttled_commands(data)
+                delay = self._retry_delay('batch', BATCH_THROTTLED, retries, batch.read_only) if throttled else None
+                if delay is None:
+                    break
+                retries += 1
+                await asyncio.sleep(delay)
+                names, params = batch.retry_chunk(throttled)
+
+        if result.errors:
+            logger.warning(f"Bitrix batch errors: {result.errors}")
+
+        return result
+
+    def batch(self) -> BitrixBatch:
+        return BitrixBatch()
+
+    async def get_deal_stages(self, deal_ids: List[int]) -> Dict[int, str]:
+        """Get STAGE_ID for many deals via batched crm.deal.list"""
+        result = await self.execute_batch(self._deal_stages_batch(deal_ids))
+
+        stages = {}
+        for deals in result.results.values():
+            for deal in deals or []:
+                stages[int(deal['ID'])] = deal['STAGE_ID']
+
+        return stages
+
+    async def update_deals(self, updates: Dict[int, Dict]) -> Dict[int, Optional[str]]:
+        """Update fields of many deals via batch. Returns error per deal_id, None if it was updated"""
+        result = await self.execute_batch(self._deal_updates_batch(updates), PRIORITY_WRITE)
+        return {deal_id: result.error(f"deal_{deal_id}") for deal_id in updates}
+
+    async def update_deal_field(self, deal_id: int, field_name: str, value: str) -> bool:
+        """Update specific field in deal"""
+        params = {
+            'id': deal_id,
+            'fields': {field_name: value}
         }
 
+        result = await self._make_request('crm.deal.update', params, priority=PRIORITY_WRITE)
+        return result is not None
+
+    async def update_deal_custom_field(self, deal_id: int, field_code: str, value: str) -> bool:
+        """Update custom field (UF_*) in deal"""
+        return await self.update_deal_field(deal_id, field_code, value)
+
+    async def find_client_in_funnel(self, phone: str) -> Optional[Dict]:
+        """Find client in Bitrix24 by phone and check if they have deal in category 7"""
+        hit, contact = self.cache.get_contact(phone)
+        if hit:
+            deals = await self.get_deals_by_contact(contact['ID']) if contact else []
+            return self._funnel_result(phone, contact, deals)
+
+        result = await self.execute_batch(self._funnel_batch(phone), PRIORITY_INTERACTIVE)
+        contact, deals = self._store_funnel(phone, result)
+        return self._funnel_result(phone, contact, deals)
+
 
-# Singleton instance
+# Singleton instances
 bitrix_client = BitrixClient()
+async_bitrix_client = AsyncBitrixClient()
@@ -0,0 +1,202 @@
+import os
+import json
+import random
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from google.auth import credentials as google_credentials
+from google.oauth2.credentials import Credentials
+from google.auth.transport.requests import Request
+from config import GOOGLE_TOKEN_REFRESH_MARGIN
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ['https://www.googleapis.com/auth/drive.file']
+
+# A token this close to expiry is not handed out any more
+EXPIRY_SKEW = timedelta(seconds=60)
+# Background refresh is spread over this many seconds so processes do not all wake at once
+REFRESH_JITTER = 30
+# Delay before the background refresher retries after an error, seconds
+RETRY_DELAY = 30
+# 401 responses right after a refresh do not trigger another one
+FORCED_REFRESH_INTERVAL = 30
+
+
+class GoogleTokenManager:
+    """
+    Keeps a valid Google OAuth access token for all threads of the process.
+    A background thread refreshes it GOOGLE_TOKEN_REFRESH_MARGIN seconds before expiry.
+    The token is shared through pt_oauth_tokens: the row is locked while refreshing,
+    so one process calls Google and the others pick up its token.
+    """
+
+    def __init__(self, name: str = 'google_drive', refresh_margin: int = GOOGLE_TOKEN_REFRESH_MARGIN):
+        self.name = name
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self._lock = threading.Lock()
+        self._oauth = None
+        self._token = None
+        self._expiry = None
+        self._updated = 0.0
+        self._refresher = None
+        self._stop = threading.Event()
+
+    def _load_credentials(self) -> Credentials:
+        """OAuth client credentials with refresh token from environment or token.json"""
+        # ПРИОРИТЕТ 1: OAuth токен из переменной окружения (для production на Render.com)
+        oauth_token = os.getenv('GOOGLE_OAUTH_TOKEN')
+
+        if oauth_token:
+            logger.info("Using OAuth token from environment variable")
+            try:
+                token_data = json.loads(oauth_token)
+            except json.JSONDecodeError as e:
+                logger.error(f"Invalid JSON in GOOGLE_OAUTH_TOKEN: {e}")
+                raise
+
+            return Credentials(
+                token=token_data.get('token'),
+                refresh_token=token_data.get('refresh_token'),
+                token_uri=token_data.get('token_uri'),
+                client_id=token_data.get('client_id'),
+                client_secret=token_data.get('client_secret'),
+                scopes=token_data.get('scopes', SCOPES)
+            )
+
+        # ПРИОРИТЕТ 2: Файл token.json (для локальной разработки)
+        if os.path.exists('token.json'):
+            logger.info("Using token.json file for local development")
+            return Credentials.from_authorized_user_file('token.json', SCOPES)
+
+        logger.error(
+            "Google Drive credentials not found!\n"
+            "For production: Set GOOGLE_OAUTH_TOKEN environment variable\n"
+            "For local development: Run 'python generate_oauth_token.py' to create token.json"
+        )
+        raise ValueError("Google Drive credentials not configured")
+
+    def _usable(self, token: Optional[str], expiry: Optional[datetime], margin: timedelta) -> bool:
+        return bool(token) and expiry is not None and expiry - datetime.utcnow() > margin
+
+    def _adopt(self, token: str, expiry: datetime):
+        self._token, self._expiry = token, expiry
+        self._updated = time.monotonic()
+
+    def _refresh_from_google(self):
+        if self._oauth is None:
+            self._oauth = self._load_credentials()
+
+        if self._oauth.refresh_token:
+            self._oauth.refresh(Request())
+            logger.info("Google OAuth token refreshed")
+        elif not self._oauth.token:
+            raise ValueError("Google OAuth token has neither access nor refresh token")
+
+        # A static token without expiry is used as is and re-checked hourly
+        self._adopt(self._oauth.token, self._oauth.expiry or datetime.utcnow() + timedelta(hours=1))
+
+    def _sync(self, force: bool = False):
+        """
+        Take the shared token, or refresh it under the row lock if it is about to expire.
+        force skips a shared token equal to ours (it was just rejected).
+        Falls back to a process-local refresh if the database is unavailable.
+        """
+        from database import OAuthToken, get_session
+
+        try:
+            with get_session() as session:
+                row = session.query(OAuthToken).filter(
+                    OAuthToken.name == self.name
+                ).with_for_update().first()
+
+                if row and self._usable(row.access_token, row.expires_at, self.refresh_margin) \
+                        and not (force and row.access_token == self._token):
+                    self._adopt(row.access_token, row.expires_at)
+                    return
+
+                self._refresh_from_google()
+
+                if row is None:
+                    row = OAuthToken(name=self.name)
+                    session.add(row)
+                row.access_token = self._token
+                row.expires_at = self._expiry
+                row.updated_at = datetime.utcnow()
+        except Exception as e:
+            logger.error(f"Error syncing shared Google OAuth token: {e}")
+            if force or not self._usable(self._token, self._expiry, EXPIRY_SKEW):
+                self._refresh_from_google()
+
+    def get_token(self) -> str:
+        """Current access token; only blocks if the background refresh has not kept up"""
+        token, expiry = self._token, self._expiry
+        if self._usable(token, expiry, EXPIRY_SKEW):
+            return token
+
+        with self._lock:
+            if not self._usable(self._token, self._expiry, EXPIRY_SKEW):
+                self._sync()
+            self._start_refresher()
+            return self._token
+
+    def token_rejected(self):
+        """Called after a 401: take a newer shared token or refresh"""
+        with self._lock:
+            if time.monotonic() - self._updated < FORCED_REFRESH_INTERVAL:
+                return
+            self._sync(force=True)
+
+    def _start_refresher(self):
+        if self._refresher is None or not self._refresher.is_alive():
+            self._refresher = threading.Thread(target=self._run_refresher, name='google-token-refresh',
+                                               daemon=True)
+            self._refresher.start()
+
+    def _run_refresher(self):
+        while True:
+            delay = RETRY_DELAY
+            if self._expiry is not None:
+                delay = (self._expiry - self.refresh_margin - datetime.utcnow()).total_seconds()
+                delay = max(delay + random.uniform(0, REFRESH_JITTER), RETRY_DELAY)
+
+            if self._stop.wait(delay):
+                return
+
+            try:
+                with self._lock:
+                    if not self._usable(self._token, self._expiry, self.refresh_margin):
+                        self._sync()
+            except Exception as e:
+                logger.error(f"Error refreshing Google OAuth token in background: {e}")
+
+    def stop(self):
+        self._stop.set()
+
+
+class ManagedCredentials(google_credentials.Credentials):
+    """Credentials that take the token from GoogleTokenManager; one instance can serve all threads"""
+
+    def __init__(self, manager: GoogleTokenManager):
+        super().__init__()
+        self._manager = manager
+
+    @property
+    def valid(self) -> bool:
+        # The manager never hands out an expired token
+        return True
+
+    def refresh(self, request):
+        # Called by the HTTP layer when Drive answers 401
+        self._manager.token_rejected()
+
+    def apply(self, headers, token=None):
+        headers['authorization'] = f"Bearer {token or self._manager.get_token()}"
+
+    def before_request(self, request, method, url, headers):
+        self.apply(headers)
+
+
+google_token_manager = GoogleTokenManager()
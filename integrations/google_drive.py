@@ -1,91 +1,83 @@
-import os
 import io
 import json
+import asyncio
+import functools
 import logging
-from typing import Optional, Dict, List
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload, MediaFileUpload
-from config import GOOGLE_DRIVE_FOLDER_ID
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List, BinaryIO, Callable
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
+from config import GOOGLE_DRIVE_FOLDER_ID, DRIVE_MAX_WORKERS, FILE_TRANSFER_CHUNK_SIZE
+from .telegram_files import spool_telegram_file
+from .google_auth import google_token_manager, GoogleTokenManager, ManagedCredentials
 
 logger = logging.getLogger(__name__)
 
-SCOPES = ['https://www.googleapis.com/auth/drive.file']
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
 
+# Retries of a single chunk on 5xx / connection errors
+UPLOAD_CHUNK_RETRIES = 3
 
-class GoogleDriveClient:
-    def __init__(self):
-        self.creds = None
-        self.service = None
-        self.main_folder_id = GOOGLE_DRIVE_FOLDER_ID
-        self._authenticate()
+# File IDs fetched per files().generateIds call and kept for folder provisioning
+GENERATED_IDS_BATCH = 50
 
-    def _authenticate(self):
-        """Authenticate with Google Drive API using OAuth token from environment"""
-        try:
-            # ПРИОРИТЕТ 1: OAuth токен из переменной окружения (для production на Render.com)
-            oauth_token = os.getenv('GOOGLE_OAUTH_TOKEN')
-
-            if oauth_token:
-                logger.info("Using OAuth token from environment variable")
-                token_data = json.loads(oauth_token)
-
-                self.creds = Credentials(
-                    token=token_data.get('token'),
-                    refresh_token=token_data.get('refresh_token'),
-                    token_uri=token_data.get('token_uri'),
-                    client_id=token_data.get('client_id'),
-                    client_secret=token_data.get('client_secret'),
-                    scopes=token_data.get('scopes', SCOPES)
-                )
-
-            # ПРИОРИТЕТ 2: Файл token.json (для локальной разработки)
-            elif os.path.exists('token.json'):
-                logger.info("Using token.json file for local development")
-                self.creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-
-            else:
-                logger.error(
-                    "Google Drive credentials not found!\n"
-                    "For production: Set GOOGLE_OAUTH_TOKEN environment variable\n"
-                    "For local development: Run 'python generate_oauth_token.py' to create token.json"
-                )
-                raise ValueError("Google Drive credentials not configured")
-
-            # Обновление токена если истёк
-            if self.creds.expired and self.creds.refresh_token:
-                logger.info("Refreshing expired OAuth token")
-                self.creds.refresh(Request())
-
-                # Если токен из файла, сохраняем обновлённый
-                if os.path.exists('token.json') and not oauth_token:
-                    with open('token.json', 'w') as token:
-                        token.write(self.creds.to_json())
-
-            # Создание API сервиса
-            self.service = build('drive', 'v3', credentials=self.creds)
-            logger.info("Google Drive authenticated successfully")
-
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON in GOOGLE_OAUTH_TOKEN: {e}")
-            raise
-        except Exception as e:
-            logger.error(f"Error authenticating with Google Drive: {e}")
-            raise
 
-    def create_folder(self, folder_name: str, parent_folder_id: str = None) -> Optional[str]:
-        """Create folder in Google Drive"""
-        try:
-            file_metadata = {
-                'name': folder_name,
-                'mimeType': 'application/vnd.google-apps.folder',
-                'parents': [parent_folder_id or self.main_folder_id]
-            }
+@functools.lru_cache(maxsize=None)
+def drive_discovery_document() -> Dict:
+    """Drive v3 discovery document bundled with google-api-python-client, parsed once per process"""
+    return json.loads(discovery_cache.get_static_doc('drive', 'v3'))
+
 
+class GoogleDriveClient:
+    """Credentials and services are created on first use, so importing this module is cheap"""
+
+    def __init__(self, token_manager: GoogleTokenManager = google_token_manager):
+        # Token is refreshed by the manager, never inline in a Drive call
+        self.creds = ManagedCredentials(token_manager)
+        self.main_folder_id = GOOGLE_DRIVE_FOLDER_ID
+        # httplib2 is not thread-safe, so every thread gets its own service object
+        self._local = threading.local()
+        self._ids = deque()
+        self._ids_lock = threading.Lock()
+
+    @property
+    def service(self):
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = build_from_document(drive_discovery_document(), credentials=self.creds)
+            self._local.service = service
+        return service
+
+    def _folder_metadata(self, folder_name: str, parent_folder_id: str = None, folder_id: str = None) -> Dict:
+        metadata = {
+            'name': folder_name,
+            'mimeType': FOLDER_MIME_TYPE,
+            'parents': [parent_folder_id or self.main_folder_id]
+        }
+        if folder_id:
+            metadata['id'] = folder_id
+        return metadata
+
+    def generate_ids(self, count: int) -> List[str]:
+        """Take pre-generated file IDs, refilling from files().generateIds when the stock runs out"""
+        with self._ids_lock:
+            if len(self._ids) < count:
+                response = self.service.files().generateIds(
+                    count=max(count, GENERATED_IDS_BATCH),
+                    space='drive'
+                ).execute()
+                self._ids.extend(response.get('ids', []))
+            return [self._ids.popleft() for _ in range(count)]
+
+    def create_folder(self, folder_name: str, parent_folder_id: str = None, folder_id: str = None) -> Optional[str]:
+        """Create folder in Google Drive, optionally with a pre-generated ID"""
+        try:
             folder = self.service.files().create(
-                body=file_metadata,
+                body=self._folder_metadata(folder_name, parent_folder_id, folder_id),
                 fields='id'
             ).execute()
 
@@ -97,24 +89,50 @@ class GoogleDriveClient:
             logger.error(f"Error creating folder: {e}")
             return None
 
+    @staticmethod
+    def client_folder_name(full_name: str, phone_number: str) -> str:
+        return f"{full_name}_{phone_number}"
+
     def create_client_folder_structure(self, full_name: str, phone_number: str) -> Optional[Dict]:
         """
         Create folder structure for client:
         {ФИО}_{телефон}/
         └── documents/
         """
+        return self.create_folder_structure(self.client_folder_name(full_name, phone_number))
+
+    def create_folder_structure(self, folder_name: str) -> Optional[Dict]:
+        """
+        Create folder_name/documents/ under the main folder.
+        Both folders get pre-generated IDs and are created in one batch request.
+        Batch parts may run in any order, so a child created before its parent is retried on its own.
+        """
         try:
-            # Create main client folder
-            folder_name = f"{full_name}_{phone_number}"
-            main_folder_id = self.create_folder(folder_name)
+            main_folder_id, docs_folder_id = self.generate_ids(2)
 
-            if not main_folder_id:
+            responses = {}
+
+            def collect(request_id, response, exception):
+                responses[request_id] = exception or response
+
+            batch = self.service.new_batch_http_request(callback=collect)
+            batch.add(self.service.files().create(
+                body=self._folder_metadata(folder_name, folder_id=main_folder_id), fields='id'
+            ), request_id='main')
+            batch.add(self.service.files().create(
+                body=self._folder_metadata('documents', main_folder_id, docs_folder_id), fields='id'
+            ), request_id='documents')
+            batch.execute()
+
+            if not isinstance(responses.get('main'), dict):
+                logger.error(f"Error creating folder '{folder_name}': {responses.get('main')}")
                 return None
 
-            # Create documents subfolder
-            docs_folder_id = self.create_folder('documents', main_folder_id)
+            if not isinstance(responses.get('documents'), dict):
+                logger.warning(f"Retrying documents subfolder of '{folder_name}': {responses.get('documents')}")
+                docs_folder_id = self.create_folder('documents', main_folder_id, docs_folder_id)
 
-            logger.info(f"Created folder structure for client: {folder_name}")
+            logger.info(f"Created folder structure: {folder_name}")
 
             return {
                 'main_folder_id': main_folder_id,
@@ -126,33 +144,133 @@ class GoogleDriveClient:
             logger.error(f"Error creating client folder structure: {e}")
             return None
 
+    def rename_file(self, file_id: str, new_name: str) -> bool:
+        """Rename file or folder"""
+        try:
+            self.service.files().update(fileId=file_id, body={'name': new_name}, fields='id').execute()
+            logger.info(f"Renamed {file_id} to '{new_name}'")
+            return True
+        except Exception as e:
+            logger.error(f"Error renaming {file_id}: {e}")
+            return False
+
+    def delete_file(self, file_id: str) -> bool:
+        """Delete file or folder (with its contents)"""
+        try:
+            self.service.files().delete(fileId=file_id).execute()
+            logger.info(f"Deleted {file_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting {file_id}: {e}")
+            return False
+
     def upload_file(self, file_content: bytes, file_name: str, folder_id: str, mime_type: str = None) -> Optional[str]:
         """Upload file to Google Drive"""
         try:
-            file_metadata = {
-                'name': file_name,
-                'parents': [folder_id]
-            }
+            return self.upload_stream(io.BytesIO(file_content), file_name, folder_id, mime_type)
+        except Exception as e:
+            logger.error(f"Error uploading file: {e}")
+            return None
 
-            media = MediaIoBaseUpload(
-                io.BytesIO(file_content),
-                mimetype=mime_type or 'application/octet-stream',
-                resumable=True
-            )
+    def upload_stream(self, stream: BinaryIO, file_name: str, folder_id: str, mime_type: str = None,
+                      resumable_uri: str = None,
+                      on_progress: Callable[[Optional[str], int], None] = None) -> str:
+        """
+        Resumable upload from a seekable stream, one FILE_TRANSFER_CHUNK_SIZE chunk in memory at a time.
+        resumable_uri continues an earlier upload session from the last byte Drive acknowledged;
+        on_progress(session_uri, bytes_uploaded) is called after every chunk so the caller can persist it.
+        Returns file ID; raises on failure so callers can record the reason.
+        """
+        file_metadata = {
+            'name': file_name,
+            'parents': [folder_id]
+        }
+
+        media = MediaIoBaseUpload(
+            stream,
+            mimetype=mime_type or 'application/octet-stream',
+            chunksize=FILE_TRANSFER_CHUNK_SIZE,
+            resumable=True
+        )
+
+        request = self.service.files().create(
+            body=file_metadata,
+            media_body=media,
+            fields='id'
+        )
+
+        file = None
+        if resumable_uri:
+            file = self._resume_upload(request, resumable_uri, media.size())
+            if file is None and on_progress:
+                on_progress(request.resumable_uri, request.resumable_progress)
+
+        while file is None:
+            status, file = request.next_chunk(num_retries=UPLOAD_CHUNK_RETRIES)
+            if status and on_progress:
+                on_progress(request.resumable_uri, status.resumable_progress)
+
+        file_id = file.get('id')
+        logger.info(f"Uploaded file '{file_name}' with ID: {file_id}")
+        return file_id
+
+    @staticmethod
+    def _resume_upload(request, resumable_uri: str, size: int) -> Optional[Dict]:
+        """
+        Ask Drive how much of an earlier session it has and point request at it.
+        Returns the file resource if that upload had already completed.
+        An expired session (404/410) leaves request to start a new one.
+        """
+        resp, content = request.http.request(
+            resumable_uri, 'PUT', headers={'Content-Range': f'bytes */{size}', 'Content-Length': '0'}
+        )
+
+        if resp.status in (200, 201):
+            return json.loads(content)
+
+        if resp.status == 308:
+            # Range: bytes=0-N means N+1 bytes are stored; no header means none yet
+            byte_range = resp.get('range')
+            request.resumable_uri = resumable_uri
+            request.resumable_progress = int(byte_range.split('-')[1]) + 1 if byte_range else 0
+            logger.info(f"Resuming upload at byte {request.resumable_progress} of {size}")
+            return None
 
-            file = self.service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id'
-            ).execute()
+        if resp.status in (404, 410):
+            logger.warning("Upload session expired, starting over")
+            return None
 
-            file_id = file.get('id')
-            logger.info(f"Uploaded file '{file_name}' with ID: {file_id}")
-            return file_id
+        raise IOError(f"Upload session status check failed with HTTP {resp.status}")
 
+    def upload_telegram_file(self, file_path: str, file_name: str, folder_id: str, mime_type: str = None,
+                             is_duplicate: Callable[[str], bool] = None, resumable_uri: str = None,
+                             on_progress: Callable[[Optional[str], int], None] = None,
+                             transform: Callable[[BinaryIO], BinaryIO] = None) -> Dict:
+        """
+        Stream Telegram file (File.file_path) to Drive via a size-capped temp file.
+        is_duplicate(sha256) is checked after download; if it returns True the upload is skipped.
+        transform(stream) may replace the content before upload (hash and size stay of the original).
+        resumable_uri / on_progress are passed to upload_stream.
+        Returns {'file_id', 'content_hash', 'file_size', 'duplicate'}. Errors are logged and re-raised
+        (FileTooLargeError and the rest), so the caller can tell permanent failures from transient ones.
+        """
+        try:
+            spool, content_hash, file_size = spool_telegram_file(file_path)
+            with spool:
+                result = {'file_id': None, 'content_hash': content_hash, 'file_size': file_size, 'duplicate': False}
+
+                if is_duplicate and is_duplicate(content_hash):
+                    logger.info(f"Skipped upload of '{file_name}': same content already stored")
+                    result['duplicate'] = True
+                    return result
+
+                stream = transform(spool) if transform else spool
+                result['file_id'] = self.upload_stream(stream, file_name, folder_id, mime_type,
+                                                       resumable_uri, on_progress)
+                return result
         except Exception as e:
-            logger.error(f"Error uploading file: {e}")
-            return None
+            logger.error(f"Error transferring Telegram file '{file_name}': {e}")
+            raise
 
     def upload_text_file(self, content: str, file_name: str, folder_id: str) -> Optional[str]:
         """Upload text file to Google Drive"""
@@ -163,25 +281,48 @@ class GoogleDriveClient:
             logger.error(f"Error uploading text file: {e}")
             return None
 
-    def create_questionnaire_file(self, answers: List[tuple], phone: str, folder_id: str) -> Optional[str]:
+    def update_file(self, file_id: str, file_content: bytes, mime_type: str) -> Optional[str]:
+        """Replace content of an existing file, keeping its ID and link"""
+        media = MediaIoBaseUpload(io.BytesIO(file_content), mimetype=mime_type, resumable=False)
+        file = self.service.files().update(fileId=file_id, media_body=media, fields='id').execute()
+        logger.info(f"Updated file {file_id}")
+        return file.get('id')
+
+    @staticmethod
+    def render_questionnaire(answers: List[tuple], phone: str) -> str:
         """
-        Create anketa_{phone}.txt with questionnaire answers
+        Questionnaire text in one pass
         answers: list of (question_number, question_text, answer_text)
         """
-        try:
-            content = "АНКЕТА КЛІЄНТА\n"
-            content += "=" * 50 + "\n\n"
-
-            for q_num, q_text, answer in answers:
-                content += f"{q_num}. {q_text}\n"
-                content += f"Відповідь: {answer}\n\n"
-
-            content += "=" * 50 + "\n"
-            content += f"Телефон: {phone}\n"
-
-            file_name = f"anketa_{phone}.txt"
-            return self.upload_text_file(content, file_name, folder_id)
+        separator = "=" * 50
+        lines = ["АНКЕТА КЛІЄНТА", separator, ""]
+        for q_num, q_text, answer in answers:
+            lines.extend((f"{q_num}. {q_text}", f"Відповідь: {answer}", ""))
+        lines.extend((separator, f"Телефон: {phone}", ""))
+        return "\n".join(lines)
+
+    def save_questionnaire_file(self, answers: List[tuple], phone: str, folder_id: str,
+                                file_id: str = None) -> Optional[str]:
+        """
+        Write anketa_{phone}.txt: update file_id in place, or create the file if there is none
+        (or it was deleted). Returns file ID
+        """
+        content = self.render_questionnaire(answers, phone).encode('utf-8')
+
+        if file_id:
+            try:
+                return self.update_file(file_id, content, 'text/plain')
+            except HttpError as e:
+                if e.resp.status != 404:
+                    logger.error(f"Error updating questionnaire file {file_id}: {e}")
+                    return None
+                logger.warning(f"Questionnaire file {file_id} not found, creating a new one")
+            except Exception as e:
+                logger.error(f"Error updating questionnaire file {file_id}: {e}")
+                return None
 
+        try:
+            return self.upload_file(content, f"anketa_{phone}.txt", folder_id, 'text/plain')
         except Exception as e:
             logger.error(f"Error creating questionnaire file: {e}")
             return None
@@ -191,5 +332,53 @@ class GoogleDriveClient:
         return f"https://drive.google.com/drive/folders/{folder_id}"
 
 
-# Singleton instance
+class AsyncGoogleDriveClient:
+    """
+    Awaitable facade over GoogleDriveClient for bot handlers.
+    Blocking calls run on a bounded thread pool, which also caps concurrent Drive requests.
+    """
+
+    def __init__(self, client: GoogleDriveClient, max_workers: int = DRIVE_MAX_WORKERS):
+        self.client = client
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='drive')
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking function that calls Drive (e.g. a service's export) on this pool"""
+        return await self._run(func, *args, **kwargs)
+
+    async def create_folder(self, folder_name: str, parent_folder_id: str = None,
+                            folder_id: str = None) -> Optional[str]:
+        return await self._run(self.client.create_folder, folder_name, parent_folder_id, folder_id)
+
+    async def create_client_folder_structure(self, full_name: str, phone_number: str) -> Optional[Dict]:
+        return await self._run(self.client.create_client_folder_structure, full_name, phone_number)
+
+    async def create_folder_structure(self, folder_name: str) -> Optional[Dict]:
+        return await self._run(self.client.create_folder_structure, folder_name)
+
+    async def rename_file(self, file_id: str, new_name: str) -> bool:
+        return await self._run(self.client.rename_file, file_id, new_name)
+
+    async def upload_file(self, file_content: bytes, file_name: str, folder_id: str,
+                          mime_type: str = None) -> Optional[str]:
+        return await self._run(self.client.upload_file, file_content, file_name, folder_id, mime_type)
+
+    async def upload_telegram_file(self, file_path: str, file_name: str, folder_id: str, mime_type: str = None,
+                                   is_duplicate: Callable[[str], bool] = None) -> Dict:
+        return await self._run(self.client.upload_telegram_file, file_path, file_name, folder_id, mime_type,
+                               is_duplicate)
+
+    async def upload_text_file(self, content: str, file_name: str, folder_id: str) -> Optional[str]:
+        return await self._run(self.client.upload_text_file, content, file_name, folder_id)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+# Singleton instances
 google_drive_client = GoogleDriveClient()
+async_google_drive_client = AsyncGoogleDriveClient(google_drive_client)
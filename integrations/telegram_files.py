@@ -0,0 +1,84 @@
+import hashlib
+import logging
+from tempfile import SpooledTemporaryFile
+from typing import Tuple
+import requests
+from config import TELEGRAM_BOT_TOKEN, TELEGRAM_FILE_MAX_SIZE, FILE_TRANSFER_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_TIMEOUT = 60
+TELEGRAM_API_URL = 'https://api.telegram.org'
+
+
+class FileTooLargeError(Exception):
+    pass
+
+
+class FileUnavailableError(IOError):
+    """Telegram will never serve this file (invalid file_id, too big for the Bot API)"""
+
+
+def get_file_url(file_id: str) -> str:
+    """
+    Resolve Telegram file_id to a download URL via Bot API getFile, without a bot instance
+    (used by worker processes). The URL is valid for at least an hour.
+    Raises FileUnavailableError if Telegram rejects the file_id, IOError on other failures.
+    """
+    try:
+        response = requests.get(f"{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/getFile",
+                                params={'file_id': file_id}, timeout=DOWNLOAD_TIMEOUT)
+        data = response.json()
+    except (requests.RequestException, ValueError) as e:
+        raise IOError(f"Telegram getFile failed: {type(e).__name__}") from None
+
+    if not data.get('ok'):
+        error = FileUnavailableError if data.get('error_code') == 400 else IOError
+        raise error(f"Telegram getFile failed: {data.get('description', response.status_code)}")
+
+    return f"{TELEGRAM_API_URL}/file/bot{TELEGRAM_BOT_TOKEN}/{data['result']['file_path']}"
+
+
+def spool_telegram_file(file_path: str, max_size: int = TELEGRAM_FILE_MAX_SIZE,
+                        chunk_size: int = FILE_TRANSFER_CHUNK_SIZE) -> Tuple[SpooledTemporaryFile, str, int]:
+    """
+    Stream a Telegram file into a temp file, chunk by chunk, hashing it on the way.
+    file_path is File.file_path: a download URL, or a local path with a local Bot API server.
+    Up to chunk_size stays in memory, larger files roll over to disk.
+    Returns (file, sha256 hex digest, size); the caller closes the file.
+    Raises FileTooLargeError past max_size.
+    """
+    spool = SpooledTemporaryFile(max_size=chunk_size)
+    digest = hashlib.sha256()
+    size = 0
+
+    def write(chunk: bytes):
+        nonlocal size
+        size += len(chunk)
+        if size > max_size:
+            raise FileTooLargeError(f"File exceeds {max_size} bytes")
+        digest.update(chunk)
+        spool.write(chunk)
+
+    try:
+        if file_path.startswith(('http://', 'https://')):
+            # The URL contains the bot token, so it must not end up in error messages
+            try:
+                with requests.get(file_path, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                    if response.status_code != 200:
+                        raise IOError(f"Telegram file download failed with HTTP {response.status_code}")
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        write(chunk)
+            except requests.RequestException as e:
+                raise IOError(f"Telegram file download failed: {type(e).__name__}") from None
+        else:
+            with open(file_path, 'rb') as source:
+                for chunk in iter(lambda: source.read(chunk_size), b''):
+                    write(chunk)
+
+        spool.seek(0)
+        logger.debug(f"Spooled Telegram file: {size} bytes")
+        return spool, digest.hexdigest(), size
+    except Exception:
+        spool.close()
+        raise
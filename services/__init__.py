@@ -1,11 +1,29 @@
-from .user_service import user_service, UserService
+"""
+Services come in pairs: XService on the sync engine (web, worker, scripts) and AsyncXService
+on the async engine for bot handlers. A module builds its statements once, in private
+functions (_users(), _registration(), ...), and both classes of the pair run them on their own session.
+"""
+from .user_service import user_service, UserService, async_user_service, AsyncUserService
 from .questionnaire_service import questionnaire_service, QuestionnaireService
-from .document_service import document_service, DocumentService
+from .questionnaire_service import async_questionnaire_service, AsyncQuestionnaireService
+from .document_service import document_service, DocumentService, async_document_service, AsyncDocumentService
 from .conference_service import conference_service, ConferenceService
+from .conference_service import async_conference_service, AsyncConferenceService
+from .deal_index import deal_index, DealIndex
+from .notification_service import notification_service, NotificationService
+from .crm_outbox_service import crm_outbox_service, CrmOutboxService
+from .drive_folder_pool import drive_folder_pool, DriveFolderPool
+from .upload_job_service import upload_job_service, UploadJobService
 
 __all__ = [
-    'user_service', 'UserService',
+    'user_service', 'UserService', 'async_user_service', 'AsyncUserService',
     'questionnaire_service', 'QuestionnaireService',
-    'document_service', 'DocumentService',
-    'conference_service', 'ConferenceService',
+    'async_questionnaire_service', 'AsyncQuestionnaireService',
+    'document_service', 'DocumentService', 'async_document_service', 'AsyncDocumentService',
+    'conference_service', 'ConferenceService', 'async_conference_service', 'AsyncConferenceService',
+    'deal_index', 'DealIndex',
+    'notification_service', 'NotificationService',
+    'crm_outbox_service', 'CrmOutboxService',
+    'drive_folder_pool', 'DriveFolderPool',
+    'upload_job_service', 'UploadJobService',
 ]
@@ -1,12 +1,48 @@
 import logging
 from typing import Optional, List
 from datetime import datetime
-from database import Conference, ConferenceRegistration, get_session, ClientCategory
+from sqlalchemy import select, func
+from database import Conference, ConferenceRegistration, get_session, get_async_session, ClientCategory
 from services.user_service import user_service
 
 logger = logging.getLogger(__name__)
 
 
+def _new_conference(title: str, description: str, date_time: datetime, zoom_link: str,
+                    max_participants: int) -> Conference:
+    return Conference(
+        title=title,
+        description=description,
+        date_time=date_time,
+        zoom_link=zoom_link,
+        max_participants=max_participants
+    )
+
+
+def _active_conferences():
+    return select(Conference).where(
+        Conference.is_active == True,
+        Conference.date_time > datetime.utcnow()
+    ).order_by(Conference.date_time)
+
+
+def _registration(conference_id: int, telegram_id: int):
+    return select(ConferenceRegistration).where(
+        ConferenceRegistration.conference_id == conference_id,
+        ConferenceRegistration.telegram_id == telegram_id
+    ).limit(1)
+
+
+def _participants(conference_id: int):
+    return select(ConferenceRegistration).where(ConferenceRegistration.conference_id == conference_id)
+
+
+def _participants_count(conference_id: int):
+    return select(func.count(ConferenceRegistration.id)).where(
+        ConferenceRegistration.conference_id == conference_id
+    )
+
+
 class ConferenceService:
     @staticmethod
     def create_conference(title: str, description: str, date_time: datetime,
@@ -14,13 +50,7 @@ class ConferenceService:
         """Create new conference"""
         try:
             with get_session() as session:
-                conference = Conference(
-                    title=title,
-                    description=description,
-                    date_time=date_time,
-                    zoom_link=zoom_link,
-                    max_participants=max_participants
-                )
+                conference = _new_conference(title, description, date_time, zoom_link, max_participants)
                 session.add(conference)
                 session.commit()
                 session.refresh(conference)
@@ -35,10 +65,7 @@ class ConferenceService:
         """Get conference by ID"""
         try:
             with get_session() as session:
-                conference = session.query(Conference).filter(
-                    Conference.id == conference_id
-                ).first()
-                return conference
+                return session.get(Conference, conference_id)
         except Exception as e:
             logger.error(f"Error getting conference: {e}")
             return None
@@ -48,11 +75,7 @@ class ConferenceService:
         """Get all active conferences"""
         try:
             with get_session() as session:
-                conferences = session.query(Conference).filter(
-                    Conference.is_active == True,
-                    Conference.date_time > datetime.utcnow()
-                ).order_by(Conference.date_time).all()
-                return conferences
+                return session.scalars(_active_conferences()).all()
         except Exception as e:
             logger.error(f"Error getting active conferences: {e}")
             return []
@@ -63,21 +86,11 @@ class ConferenceService:
         try:
             with get_session() as session:
                 # Check if already registered
-                existing = session.query(ConferenceRegistration).filter(
-                    ConferenceRegistration.conference_id == conference_id,
-                    ConferenceRegistration.telegram_id == telegram_id
-                ).first()
-
-                if existing:
+                if session.scalar(_registration(conference_id, telegram_id)):
                     logger.info(f"User {telegram_id} already registered for conference {conference_id}")
                     return True
 
-                # Create registration
-                registration = ConferenceRegistration(
-                    conference_id=conference_id,
-                    telegram_id=telegram_id
-                )
-                session.add(registration)
+                session.add(ConferenceRegistration(conference_id=conference_id, telegram_id=telegram_id))
                 session.commit()
                 logger.info(f"Registered user {telegram_id} for conference {conference_id}")
                 return True
@@ -90,11 +103,7 @@ class ConferenceService:
         """Check if user is registered for conference"""
         try:
             with get_session() as session:
-                exists = session.query(ConferenceRegistration).filter(
-                    ConferenceRegistration.conference_id == conference_id,
-                    ConferenceRegistration.telegram_id == telegram_id
-                ).first() is not None
-                return exists
+                return session.scalar(_registration(conference_id, telegram_id)) is not None
         except Exception as e:
             logger.error(f"Error checking registration: {e}")
             return False
@@ -104,10 +113,7 @@ class ConferenceService:
         """Get all participants for conference"""
         try:
             with get_session() as session:
-                participants = session.query(ConferenceRegistration).filter(
-                    ConferenceRegistration.conference_id == conference_id
-                ).all()
-                return participants
+                return session.scalars(_participants(conference_id)).all()
         except Exception as e:
             logger.error(f"Error getting participants: {e}")
             return []
@@ -117,10 +123,7 @@ class ConferenceService:
         """Get count of participants for conference"""
         try:
             with get_session() as session:
-                count = session.query(ConferenceRegistration).filter(
-                    ConferenceRegistration.conference_id == conference_id
-                ).count()
-                return count
+                return session.scalar(_participants_count(conference_id))
         except Exception as e:
             logger.error(f"Error getting participants count: {e}")
             return 0
@@ -130,11 +133,7 @@ class ConferenceService:
         """Mark user as attended"""
         try:
             with get_session() as session:
-                registration = session.query(ConferenceRegistration).filter(
-                    ConferenceRegistration.conference_id == conference_id,
-                    ConferenceRegistration.telegram_id == telegram_id
-                ).first()
-
+                registration = session.scalar(_registration(conference_id, telegram_id))
                 if not registration:
                     return False
 
@@ -151,10 +150,7 @@ class ConferenceService:
         """Delete conference"""
         try:
             with get_session() as session:
-                conference = session.query(Conference).filter(
-                    Conference.id == conference_id
-                ).first()
-
+                conference = session.get(Conference, conference_id)
                 if not conference:
                     return False
 
@@ -167,4 +163,121 @@ class ConferenceService:
             return False
 
 
+class AsyncConferenceService:
+    """ConferenceService for bot handlers, on the async engine"""
+
+    @staticmethod
+    async def create_conference(title: str, description: str, date_time: datetime,
+                                zoom_link: str, max_participants: int = 100) -> Optional[Conference]:
+        """Create new conference"""
+        try:
+            async with get_async_session() as session:
+                conference = _new_conference(title, description, date_time, zoom_link, max_participants)
+                session.add(conference)
+            logger.info(f"Created conference: {title}")
+            return conference
+        except Exception as e:
+            logger.error(f"Error creating conference: {e}")
+            return None
+
+    @staticmethod
+    async def get_conference(conference_id: int) -> Optional[Conference]:
+        """Get conference by ID"""
+        try:
+            async with get_async_session() as session:
+                return await session.get(Conference, conference_id)
+        except Exception as e:
+            logger.error(f"Error getting conference: {e}")
+            return None
+
+    @staticmethod
+    async def get_active_conferences() -> List[Conference]:
+        """Get all active conferences"""
+        try:
+            async with get_async_session() as session:
+                return list(await session.scalars(_active_conferences()))
+        except Exception as e:
+            logger.error(f"Error getting active conferences: {e}")
+            return []
+
+    @staticmethod
+    async def register_user(conference_id: int, telegram_id: int) -> bool:
+        """Register user for conference"""
+        try:
+            async with get_async_session() as session:
+                if await session.scalar(_registration(conference_id, telegram_id)):
+                    logger.info(f"User {telegram_id} already registered for conference {conference_id}")
+                    return True
+
+                session.add(ConferenceRegistration(conference_id=conference_id, telegram_id=telegram_id))
+            logger.info(f"Registered user {telegram_id} for conference {conference_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Error registering user: {e}")
+            return False
+
+    @staticmethod
+    async def is_user_registered(conference_id: int, telegram_id: int) -> bool:
+        """Check if user is registered for conference"""
+        try:
+            async with get_async_session() as session:
+                return await session.scalar(_registration(conference_id, telegram_id)) is not None
+        except Exception as e:
+            logger.error(f"Error checking registration: {e}")
+            return False
+
+    @staticmethod
+    async def get_conference_participants(conference_id: int) -> List[ConferenceRegistration]:
+        """Get all participants for conference"""
+        try:
+            async with get_async_session() as session:
+                return list(await session.scalars(_participants(conference_id)))
+        except Exception as e:
+            logger.error(f"Error getting participants: {e}")
+            return []
+
+    @staticmethod
+    async def get_participants_count(conference_id: int) -> int:
+        """Get count of participants for conference"""
+        try:
+            async with get_async_session() as session:
+                return await session.scalar(_participants_count(conference_id))
+        except Exception as e:
+            logger.error(f"Error getting participants count: {e}")
+            return 0
+
+    @staticmethod
+    async def mark_attendance(conference_id: int, telegram_id: int) -> bool:
+        """Mark user as attended"""
+        try:
+            async with get_async_session() as session:
+                registration = await session.scalar(_registration(conference_id, telegram_id))
+                if not registration:
+                    return False
+
+                registration.attended = True
+            logger.info(f"Marked attendance for user {telegram_id} at conference {conference_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Error marking attendance: {e}")
+            return False
+
+    @staticmethod
+    async def delete_conference(conference_id: int) -> bool:
+        """Delete conference"""
+        try:
+            async with get_async_session() as session:
+                conference = await session.get(Conference, conference_id)
+                if not conference:
+                    return False
+
+                await session.delete(conference)
+            logger.info(f"Deleted conference {conference_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting conference: {e}")
+            return False
+
+
 conference_service = ConferenceService()
+async_conference_service = AsyncConferenceService()
@@ -0,0 +1,142 @@
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import select, update, or_
+from sqlalchemy.orm import Session as SASession
+from database import CrmOutbox, get_session
+from config import CRM_OUTBOX_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 10
+RETRY_BASE = timedelta(seconds=30)
+RETRY_MAX = timedelta(hours=1)
+# Rows of a drain that died while sending are picked up again after this delay
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+class CrmOutboxService:
+    """Durable queue of deal field updates written back to Bitrix24 by the worker"""
+
+    @staticmethod
+    def enqueue(session: SASession, deal_id: int, fields: Dict) -> CrmOutbox:
+        """Add write-back to caller's session so it commits together with the local change"""
+        entry = CrmOutbox(deal_id=deal_id, fields=fields, status='pending',
+                          next_attempt_at=datetime.utcnow())
+        session.add(entry)
+        return entry
+
+    @staticmethod
+    def _retry_delay(attempts: int) -> timedelta:
+        return min(RETRY_BASE * (2 ** (attempts - 1)), RETRY_MAX)
+
+    @staticmethod
+    def _claim(limit: int, now: datetime) -> List[Dict]:
+        """
+        Mark up to limit sendable rows as 'sending'. A deal with a row still backing off
+        or being sent is skipped entirely, so its updates reach Bitrix in creation order.
+        """
+        with get_session() as session:
+            # Rows of a drain that died mid-send go back to the queue
+            session.execute(
+                update(CrmOutbox)
+                .where(CrmOutbox.status == 'sending', CrmOutbox.claimed_at < now - CLAIM_TIMEOUT)
+                .values(status='pending')
+                .execution_options(synchronize_session=False)
+            )
+
+            blocked = select(CrmOutbox.deal_id).where(or_(
+                (CrmOutbox.status == 'pending') & (CrmOutbox.next_attempt_at > now),
+                CrmOutbox.status == 'sending'
+            ))
+            rows = session.execute(
+                select(CrmOutbox).where(
+                    CrmOutbox.status == 'pending',
+                    CrmOutbox.deal_id.not_in(blocked)
+                ).order_by(CrmOutbox.id).limit(limit).with_for_update(skip_locked=True)
+            ).scalars().all()
+
+            for row in rows:
+                row.status = 'sending'
+                row.claimed_at = now
+
+            return [{'id': row.id, 'deal_id': row.deal_id, 'fields': row.fields, 'attempts': row.attempts or 0}
+                    for row in rows]
+
+    @staticmethod
+    def _record(by_deal: Dict[int, List[Dict]], errors: Dict[int, Optional[str]], report: Dict):
+        """Store outcome of the sent rows (errors holds the Bitrix error per deal, None if it was updated)"""
+        now = datetime.utcnow()
+        with get_session() as session:
+            for deal_id, deal_rows in by_deal.items():
+                error = errors.get(deal_id, 'crm.deal.update failed')
+                for row in deal_rows:
+                    attempts = row['attempts'] + 1
+                    values = {'attempts': attempts}
+                    if error is None:
+                        values.update(status='done', processed_at=now, last_error=None)
+                        report['sent'] += 1
+                    elif attempts >= MAX_ATTEMPTS:
+                        values.update(status='failed', last_error=error)
+                        report['failed'] += 1
+                    else:
+                        values.update(status='pending', last_error=error,
+                                      next_attempt_at=now + CrmOutboxService._retry_delay(attempts))
+                        report['retried'] += 1
+
+                    session.execute(
+                        update(CrmOutbox)
+                        .where(CrmOutbox.id == row['id'])
+                        .values(**values)
+                        .execution_options(synchronize_session=False)
+                    )
+
+    @staticmethod
+    def drain(limit: int = CRM_OUTBOX_BATCH_SIZE) -> Dict:
+        """
+        Push due rows to Bitrix24 in one batch.
+        Rows of the same deal are merged in creation order. Rows are claimed in one short
+        transaction and their outcome written in another, so no locks are held during the HTTP call.
+        """
+        from integrations.bitrix import bitrix_client
+
+        started = time.monotonic()
+        report = {'fetched': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+
+        try:
+            rows = CrmOutboxService._claim(limit, datetime.utcnow())
+            report['fetched'] = len(rows)
+
+            by_deal = OrderedDict()
+            for row in rows:
+                by_deal.setdefault(row['deal_id'], []).append(row)
+
+            if by_deal:
+                updates = {}
+                for deal_id, deal_rows in by_deal.items():
+                    fields = {}
+                    for row in deal_rows:
+                        fields.update(row['fields'])
+                    updates[deal_id] = fields
+
+                try:
+                    errors = bitrix_client.update_deals(updates)
+                except Exception as e:
+                    logger.error(f"Error sending CRM outbox batch: {e}")
+                    errors = {deal_id: f"{type(e).__name__}: {e}" for deal_id in updates}
+
+                CrmOutboxService._record(by_deal, errors, report)
+        except Exception as e:
+            logger.error(f"Error draining CRM outbox: {e}")
+
+        report['duration_seconds'] = round(time.monotonic() - started, 3)
+        if report['fetched']:
+            logger.info(f"CRM outbox drained: {report}")
+        if report['failed']:
+            logger.error(f"CRM outbox gave up on {report['failed']} rows after {MAX_ATTEMPTS} attempts")
+        return report
+
+
+crm_outbox_service = CrmOutboxService()
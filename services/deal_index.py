@@ -0,0 +1,156 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Dict
+from sqlalchemy import select
+from database import User, get_session
+from config import DEAL_INDEX_NEGATIVE_TTL
+
+logger = logging.getLogger(__name__)
+
+# Deals assigned by other processes (the bot) are picked up this often, seconds,
+# before a deal is rejected as known missing
+NEW_USERS_SYNC_INTERVAL = 5
+# Deal changes are re-read with this overlap to allow for clock skew between hosts
+NEW_USERS_SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class DealIndex:
+    """In-process bitrix_deal_id -> telegram_id map used to route webhook events"""
+
+    def __init__(self, negative_ttl: float = 600):
+        self.negative_ttl = negative_ttl
+        self._deals = {}
+        self._missing = {}
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._synced_at = None
+        self._synced_monotonic = 0.0
+        self._stats = {'hits': 0, 'negative_hits': 0, 'db_lookups': 0, 'syncs': 0}
+        self.loaded = False
+
+    def load(self) -> int:
+        """Warm the index with every user that has a deal"""
+        started_at = datetime.utcnow()
+        try:
+            with get_session() as session:
+                rows = session.query(User.bitrix_deal_id, User.telegram_id).filter(
+                    User.bitrix_deal_id.isnot(None)
+                ).all()
+
+            with self._lock:
+                self._deals = {deal_id: telegram_id for deal_id, telegram_id in rows}
+                self._missing.clear()
+                self.loaded = True
+                self._synced_at = started_at
+                self._synced_monotonic = time.monotonic()
+
+            logger.info(f"Deal index loaded: {len(rows)} deals")
+            return len(rows)
+        except Exception as e:
+            logger.error(f"Error loading deal index: {e}")
+            return 0
+
+    def set(self, deal_id: int, telegram_id: int):
+        """Register deal owner"""
+        with self._lock:
+            self._deals[int(deal_id)] = telegram_id
+            self._missing.pop(int(deal_id), None)
+
+    def discard(self, deal_id: int):
+        """Forget deal (e.g. when user's deal changes)"""
+        with self._lock:
+            self._deals.pop(int(deal_id), None)
+
+    def sync_new_users(self):
+        """
+        Add deals assigned to users since the last sync (new registrations and changed deals),
+        clearing their negative entries and the users' previous deals.
+        These happen in the bot process, so deal_index.set() there does not reach this one.
+        """
+        if not self._sync_lock.acquire(blocking=False):
+            return
+
+        try:
+            started_at = datetime.utcnow()
+            query = select(User.bitrix_deal_id, User.telegram_id).where(User.bitrix_deal_id.isnot(None))
+            if self._synced_at is not None:
+                query = query.where(User.deal_updated_at >= self._synced_at - NEW_USERS_SYNC_OVERLAP)
+
+            with get_session() as session:
+                rows = session.execute(query).all()
+
+            with self._lock:
+                current = {telegram_id: deal_id for deal_id, telegram_id in rows}
+                if current:
+                    for deal_id in [deal_id for deal_id, telegram_id in self._deals.items()
+                                    if current.get(telegram_id, deal_id) != deal_id]:
+                        del self._deals[deal_id]
+                for deal_id, telegram_id in rows:
+                    self._deals[deal_id] = telegram_id
+                    self._missing.pop(deal_id, None)
+                self._synced_at = started_at
+                self._stats['syncs'] += 1
+        except Exception as e:
+            logger.error(f"Error syncing new users into deal index: {e}")
+        finally:
+            self._synced_monotonic = time.monotonic()
+            self._sync_lock.release()
+
+    def is_known_missing(self, deal_id: int) -> bool:
+        """True if deal was recently looked up and has no bot user"""
+        with self._lock:
+            if deal_id not in self._missing:
+                return False
+
+        if time.monotonic() - self._synced_monotonic >= NEW_USERS_SYNC_INTERVAL:
+            self.sync_new_users()
+
+        with self._lock:
+            expires_at = self._missing.get(deal_id)
+            if expires_at is None:
+                return False
+            if expires_at < time.monotonic():
+                del self._missing[deal_id]
+                return False
+            self._stats['negative_hits'] += 1
+            return True
+
+    def lookup(self, deal_id: int) -> Optional[int]:
+        """Get telegram_id for deal, falling back to the (indexed) DB on a cold miss"""
+        with self._lock:
+            telegram_id = self._deals.get(deal_id)
+            if telegram_id is not None:
+                self._stats['hits'] += 1
+                return telegram_id
+
+        if self.is_known_missing(deal_id):
+            return None
+
+        try:
+            with get_session() as session:
+                row = session.query(User.telegram_id).filter(User.bitrix_deal_id == deal_id).first()
+        except Exception as e:
+            logger.error(f"Error looking up deal {deal_id}: {e}")
+            return None
+
+        with self._lock:
+            self._stats['db_lookups'] += 1
+            if row:
+                self._deals[deal_id] = row[0]
+                return row[0]
+            self._missing[deal_id] = time.monotonic() + self.negative_ttl
+
+        return None
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['deals'] = len(self._deals)
+            stats['negative_entries'] = len(self._missing)
+        stats['loaded'] = self.loaded
+        return stats
+
+
+deal_index = DealIndex(negative_ttl=DEAL_INDEX_NEGATIVE_TTL)
@@ -1,23 +1,78 @@
 import logging
 from typing import Optional, List
-from database import Document, get_session
+from sqlalchemy import select, update, func
+from database import Document, get_session, get_async_session
 
 logger = logging.getLogger(__name__)
 
 
+def _new_document(telegram_id: int, document_type: str, file_name: str, google_drive_file_id: Optional[str],
+                  content_hash: Optional[str], file_size: Optional[int],
+                  telegram_file_unique_id: Optional[str]) -> Document:
+    return Document(
+        telegram_id=telegram_id,
+        document_type=document_type,
+        file_name=file_name,
+        google_drive_file_id=google_drive_file_id,
+        content_hash=content_hash,
+        file_size=file_size,
+        telegram_file_unique_id=telegram_file_unique_id
+    )
+
+
+def _user_documents(telegram_id: int):
+    return select(Document).where(Document.telegram_id == telegram_id).order_by(Document.upload_date)
+
+
+def _document_count(telegram_id: int):
+    return select(func.count(Document.id)).where(Document.telegram_id == telegram_id)
+
+
+def _document_of_type(telegram_id: int, document_type: str):
+    return select(Document.id).where(
+        Document.telegram_id == telegram_id,
+        Document.document_type == document_type
+    ).limit(1)
+
+
+def _duplicate(telegram_id: int, content_hash: Optional[str], telegram_file_unique_id: Optional[str]):
+    """None if there is nothing to compare"""
+    if not content_hash and not telegram_file_unique_id:
+        return None
+
+    query = select(Document.file_name).where(Document.telegram_id == telegram_id)
+    if content_hash:
+        query = query.where(Document.content_hash == content_hash)
+    else:
+        query = query.where(Document.telegram_file_unique_id == telegram_file_unique_id)
+    return query.limit(1)
+
+
+def _link_telegram_file(telegram_id: int, content_hash: Optional[str], telegram_file_unique_id: Optional[str]):
+    """None if there is nothing to link. Only fills documents that have no Telegram file yet"""
+    if not content_hash or not telegram_file_unique_id:
+        return None
+
+    return (
+        update(Document)
+        .where(Document.telegram_id == telegram_id,
+               Document.content_hash == content_hash,
+               Document.telegram_file_unique_id.is_(None))
+        .values(telegram_file_unique_id=telegram_file_unique_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
 class DocumentService:
     @staticmethod
     def save_document(telegram_id: int, document_type: str, file_name: str,
-                      google_drive_file_id: str = None) -> Optional[Document]:
+                      google_drive_file_id: str = None, content_hash: str = None,
+                      file_size: int = None, telegram_file_unique_id: str = None) -> Optional[Document]:
         """Save document record"""
         try:
             with get_session() as session:
-                document = Document(
-                    telegram_id=telegram_id,
-                    document_type=document_type,
-                    file_name=file_name,
-                    google_drive_file_id=google_drive_file_id
-                )
+                document = _new_document(telegram_id, document_type, file_name, google_drive_file_id,
+                                         content_hash, file_size, telegram_file_unique_id)
                 session.add(document)
                 session.commit()
                 session.refresh(document)
@@ -32,10 +87,7 @@ class DocumentService:
         """Get all documents for user"""
         try:
             with get_session() as session:
-                documents = session.query(Document).filter(
-                    Document.telegram_id == telegram_id
-                ).order_by(Document.upload_date).all()
-                return documents
+                return session.scalars(_user_documents(telegram_id)).all()
         except Exception as e:
             logger.error(f"Error getting documents: {e}")
             return []
@@ -45,10 +97,7 @@ class DocumentService:
         """Get count of uploaded documents for user"""
         try:
             with get_session() as session:
-                count = session.query(Document).filter(
-                    Document.telegram_id == telegram_id
-                ).count()
-                return count
+                return session.scalar(_document_count(telegram_id))
         except Exception as e:
             logger.error(f"Error getting document count: {e}")
             return 0
@@ -58,14 +107,125 @@ class DocumentService:
         """Check if specific document type already uploaded"""
         try:
             with get_session() as session:
-                exists = session.query(Document).filter(
-                    Document.telegram_id == telegram_id,
-                    Document.document_type == document_type
-                ).first() is not None
-                return exists
+                return session.scalar(_document_of_type(telegram_id, document_type)) is not None
         except Exception as e:
             logger.error(f"Error checking document existence: {e}")
             return False
 
+    @staticmethod
+    def find_duplicate(telegram_id: int, content_hash: str = None,
+                       telegram_file_unique_id: str = None) -> Optional[str]:
+        """File name of user's document with the same content or Telegram file, if any"""
+        query = _duplicate(telegram_id, content_hash, telegram_file_unique_id)
+        if query is None:
+            return None
+
+        try:
+            with get_session() as session:
+                return session.scalar(query)
+        except Exception as e:
+            logger.error(f"Error checking duplicate document: {e}")
+            return None
+
+    @staticmethod
+    def link_telegram_file(telegram_id: int, content_hash: str, telegram_file_unique_id: str) -> bool:
+        """
+        Remember a Telegram file found to duplicate a stored document, so sending it again is
+        recognized without a download
+        """
+        statement = _link_telegram_file(telegram_id, content_hash, telegram_file_unique_id)
+        if statement is None:
+            return False
+
+        try:
+            with get_session() as session:
+                return session.execute(statement).rowcount > 0
+        except Exception as e:
+            logger.error(f"Error linking Telegram file to document: {e}")
+            return False
+
+
+class AsyncDocumentService:
+    """DocumentService for bot handlers, on the async engine"""
+
+    @staticmethod
+    async def save_document(telegram_id: int, document_type: str, file_name: str,
+                            google_drive_file_id: str = None, content_hash: str = None,
+                            file_size: int = None, telegram_file_unique_id: str = None) -> Optional[Document]:
+        """Save document record"""
+        try:
+            async with get_async_session() as session:
+                document = _new_document(telegram_id, document_type, file_name, google_drive_file_id,
+                                         content_hash, file_size, telegram_file_unique_id)
+                session.add(document)
+            logger.info(f"Saved document for user {telegram_id}: {document_type}")
+            return document
+        except Exception as e:
+            logger.error(f"Error saving document: {e}")
+            return None
+
+    @staticmethod
+    async def get_user_documents(telegram_id: int) -> List[Document]:
+        """Get all documents for user"""
+        try:
+            async with get_async_session() as session:
+                return list(await session.scalars(_user_documents(telegram_id)))
+        except Exception as e:
+            logger.error(f"Error getting documents: {e}")
+            return []
+
+    @staticmethod
+    async def get_document_count(telegram_id: int) -> int:
+        """Get count of uploaded documents for user"""
+        try:
+            async with get_async_session() as session:
+                return await session.scalar(_document_count(telegram_id))
+        except Exception as e:
+            logger.error(f"Error getting document count: {e}")
+            return 0
+
+    @staticmethod
+    async def document_exists(telegram_id: int, document_type: str) -> bool:
+        """Check if specific document type already uploaded"""
+        try:
+            async with get_async_session() as session:
+                return await session.scalar(_document_of_type(telegram_id, document_type)) is not None
+        except Exception as e:
+            logger.error(f"Error checking document existence: {e}")
+            return False
+
+    @staticmethod
+    async def find_duplicate(telegram_id: int, content_hash: str = None,
+                             telegram_file_unique_id: str = None) -> Optional[str]:
+        """File name of user's document with the same content or Telegram file, if any"""
+        query = _duplicate(telegram_id, content_hash, telegram_file_unique_id)
+        if query is None:
+            return None
+
+        try:
+            async with get_async_session() as session:
+                return await session.scalar(query)
+        except Exception as e:
+            logger.error(f"Error checking duplicate document: {e}")
+            return None
+
+    @staticmethod
+    async def link_telegram_file(telegram_id: int, content_hash: str, telegram_file_unique_id: str) -> bool:
+        """
+        Remember a Telegram file found to duplicate a stored document, so sending it again is
+        recognized without a download
+        """
+        statement = _link_telegram_file(telegram_id, content_hash, telegram_file_unique_id)
+        if statement is None:
+            return False
+
+        try:
+            async with get_async_session() as session:
+                return (await session.execute(statement)).rowcount > 0
+        except Exception as e:
+            logger.error(f"Error linking Telegram file to document: {e}")
+            return False
+
 
 document_service = DocumentService()
+async_document_service = AsyncDocumentService()
@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, Dict
+from sqlalchemy import select, update, func
+from database import PooledDriveFolder, get_session
+from config import DRIVE_FOLDER_POOL_SIZE, DRIVE_FOLDER_POOL_MIN
+
+logger = logging.getLogger(__name__)
+
+POOL_FOLDER_PREFIX = '_pool_'
+# Claimed folders still not renamed after this delay are renamed by the refill job
+RENAME_TIMEOUT = timedelta(minutes=5)
+
+
+class DriveFolderPool:
+    """
+    Spare client folders created in background, so registration only needs a DB update.
+    Rows go ready -> claimed (renamed asynchronously) -> assigned.
+    """
+
+    def __init__(self, size: int = DRIVE_FOLDER_POOL_SIZE, min_ready: int = DRIVE_FOLDER_POOL_MIN):
+        self.size = size
+        self.min_ready = min_ready
+        self._lock = threading.Lock()
+        self._stats = {
+            'claims': 0, 'misses': 0, 'total_claim_seconds': 0.0, 'max_claim_seconds': 0.0,
+            'created': 0, 'renamed': 0
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def _record_claim(self, started: float, hit: bool):
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._stats['claims' if hit else 'misses'] += 1
+            self._stats['total_claim_seconds'] += elapsed
+            self._stats['max_claim_seconds'] = max(self._stats['max_claim_seconds'], elapsed)
+
+    def claim(self, telegram_id: int, folder_name: str) -> Optional[Dict]:
+        """
+        Atomically take a ready folder for user. Returns {'folder_id', 'documents_folder_id'}
+        or None if the pool is empty; the caller renames it and calls mark_assigned().
+        """
+        if not self.enabled:
+            return None
+
+        started = time.monotonic()
+        try:
+            with get_session() as session:
+                ready = select(PooledDriveFolder.id).where(
+                    PooledDriveFolder.status == 'ready'
+                ).order_by(PooledDriveFolder.id).limit(1).with_for_update(skip_locked=True)
+
+                row = session.execute(
+                    update(PooledDriveFolder)
+                    .where(PooledDriveFolder.id == ready.scalar_subquery())
+                    .values(status='claimed', telegram_id=telegram_id, folder_name=folder_name,
+                            claimed_at=datetime.utcnow())
+                    .returning(PooledDriveFolder.folder_id, PooledDriveFolder.documents_folder_id)
+                    .execution_options(synchronize_session=False)
+                ).first()
+
+            self._record_claim(started, row is not None)
+            if row is None:
+                logger.warning("Drive folder pool is empty, creating folder on demand")
+                return None
+
+            return {'folder_id': row[0], 'documents_folder_id': row[1]}
+        except Exception as e:
+            self._record_claim(started, False)
+            logger.error(f"Error claiming pooled Drive folder: {e}")
+            return None
+
+    def mark_assigned(self, folder_id: str) -> bool:
+        """Folder got its final name"""
+        try:
+            with get_session() as session:
+                session.execute(
+                    update(PooledDriveFolder)
+                    .where(PooledDriveFolder.folder_id == folder_id)
+                    .values(status='assigned', assigned_at=datetime.utcnow())
+                    .execution_options(synchronize_session=False)
+                )
+            with self._lock:
+                self._stats['renamed'] += 1
+            return True
+        except Exception as e:
+            logger.error(f"Error marking pooled folder {folder_id} as assigned: {e}")
+            return False
+
+    def count_ready(self) -> int:
+        with get_session() as session:
+            return session.query(func.count(PooledDriveFolder.id)).filter(
+                PooledDriveFolder.status == 'ready'
+            ).scalar()
+
+    def _rename_stale_claims(self, drive) -> int:
+        """Finish renames lost to a restart or a Drive error"""
+        with get_session() as session:
+            stale = session.query(PooledDriveFolder.folder_id, PooledDriveFolder.folder_name).filter(
+                PooledDriveFolder.status == 'claimed',
+                PooledDriveFolder.claimed_at < datetime.utcnow() - RENAME_TIMEOUT
+            ).all()
+
+        renamed = 0
+        for folder_id, folder_name in stale:
+            if drive.rename_file(folder_id, folder_name) and self.mark_assigned(folder_id):
+                renamed += 1
+        return renamed
+
+    def refill(self) -> Dict:
+        """Top the pool up to `size` once fewer than `min_ready` folders are left"""
+        from integrations.google_drive import google_drive_client
+
+        report = {'ready': None, 'created': 0, 'renamed': 0}
+        if not self.enabled:
+            return report
+
+        try:
+            report['renamed'] = self._rename_stale_claims(google_drive_client)
+
+            ready = self.count_ready()
+            if ready < self.min_ready:
+                for _ in range(self.size - ready):
+                    structure = google_drive_client.create_folder_structure(
+                        f"{POOL_FOLDER_PREFIX}{uuid.uuid4().hex[:12]}"
+                    )
+                    if not structure:
+                        break
+
+                    try:
+                        with get_session() as session:
+                            session.add(PooledDriveFolder(
+                                folder_id=structure['main_folder_id'],
+                                documents_folder_id=structure['documents_folder_id'],
+                                status='ready'
+                            ))
+                    except Exception:
+                        # A folder the pool does not know about would never be used
+                        google_drive_client.delete_file(structure['main_folder_id'])
+                        raise
+                    report['created'] += 1
+
+            report['ready'] = ready + report['created']
+            with self._lock:
+                self._stats['created'] += report['created']
+
+            if report['created'] or report['renamed']:
+                logger.info(f"Drive folder pool refilled: {report}")
+        except Exception as e:
+            logger.error(f"Error refilling Drive folder pool: {e}")
+
+        return report
+
+    def count_by_status(self) -> Dict[str, int]:
+        """Folders in pt_drive_folder_pool per status, as seen by all processes"""
+        with get_session() as session:
+            rows = session.query(PooledDriveFolder.status, func.count(PooledDriveFolder.id)).group_by(
+                PooledDriveFolder.status
+            ).all()
+        return {status: count for status, count in rows}
+
+    def get_stats(self) -> Dict:
+        """Pool size from the database; claim latency and counters of this process"""
+        with self._lock:
+            stats = dict(self._stats)
+        attempts = stats['claims'] + stats['misses']
+        stats['avg_claim_seconds'] = stats['total_claim_seconds'] / attempts if attempts else 0.0
+
+        try:
+            stats['folders'] = self.count_by_status()
+            stats['ready'] = stats['folders'].get('ready', 0)
+        except Exception as e:
+            logger.error(f"Error counting pooled Drive folders: {e}")
+            stats['folders'] = stats['ready'] = None
+        return stats
+
+
+drive_folder_pool = DriveFolderPool()
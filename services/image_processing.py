@@ -0,0 +1,159 @@
+import io
+import logging
+from datetime import datetime
+from typing import BinaryIO, Iterable, Optional
+from config import IMAGE_PROCESSING_ENABLED, IMAGE_TARGET_DPI, IMAGE_JPEG_QUALITY
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional, photos are then uploaded as sent
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# A4 in inches
+PAGE_SIZE = (8.27, 11.69)
+EXIF_ORIENTATION = 0x0112
+# Formats Pillow decodes out of the box; other images (HEIC, TIFF, ...) are uploaded as sent
+BUNDLE_MIME_TYPES = frozenset({'image/jpeg', 'image/png', 'image/webp'})
+
+
+class ImageProcessingService:
+    """Downscale/recompress document photos and merge them into PDFs"""
+
+    def __init__(self, dpi: int = IMAGE_TARGET_DPI, quality: int = IMAGE_JPEG_QUALITY):
+        self.dpi = dpi
+        self.quality = quality
+
+    @property
+    def enabled(self) -> bool:
+        return IMAGE_PROCESSING_ENABLED and Image is not None
+
+    @staticmethod
+    def can_bundle(mime_type: Optional[str]) -> bool:
+        """Image can become a page of a PDF bundle"""
+        return mime_type in BUNDLE_MIME_TYPES
+
+    def _page_limits(self, width: int, height: int):
+        short, long = (round(side * self.dpi) for side in PAGE_SIZE)
+        return (short, long) if width <= height else (long, short)
+
+    def _load(self, stream: BinaryIO) -> 'Image.Image':
+        """Open image upright, downscaled to fit the page at target DPI"""
+        image = ImageOps.exif_transpose(Image.open(stream))
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.thumbnail(self._page_limits(*image.size), Image.LANCZOS)
+        return image
+
+    def normalize(self, stream: BinaryIO) -> BinaryIO:
+        """
+        Recompress image as JPEG at target DPI. Returns the original stream
+        if that would not make it smaller or it cannot be decoded.
+        """
+        try:
+            original_size = stream.seek(0, io.SEEK_END)
+            stream.seek(0)
+
+            output = io.BytesIO()
+            self._load(stream).save(output, 'JPEG', quality=self.quality, optimize=True,
+                                    dpi=(self.dpi, self.dpi))
+
+            if output.tell() >= original_size:
+                stream.seek(0)
+                return stream
+
+            logger.debug(f"Image normalized: {original_size} -> {output.tell()} bytes")
+            output.seek(0)
+            return output
+        except Exception as e:
+            logger.error(f"Error normalizing image: {e}")
+            stream.seek(0)
+            return stream
+
+    def to_pdf_page(self, stream: BinaryIO) -> bytes:
+        """
+        JPEG of the image (upright, RGB or grayscale, fitting the page at target DPI) that can be
+        embedded in a PDF as is. Raises if the image cannot be decoded.
+        """
+        page = self.normalize(stream)
+        # Only the header is read here
+        with Image.open(page) as image:
+            max_width, max_height = self._page_limits(*image.size)
+            embeddable = image.format == 'JPEG' and image.mode in ('RGB', 'L') \
+                and image.width <= max_width and image.height <= max_height \
+                and image.getexif().get(EXIF_ORIENTATION, 1) == 1
+
+        page.seek(0)
+        if embeddable:
+            return page.read()
+
+        output = io.BytesIO()
+        self._load(page).save(output, 'JPEG', quality=self.quality, optimize=True, dpi=(self.dpi, self.dpi))
+        return output.getvalue()
+
+    def build_pdf(self, pages: Iterable[bytes], created_at: datetime = None) -> BinaryIO:
+        """
+        Write a PDF with one page per JPEG, embedding the JPEG data as is (DCTDecode).
+        pages may be a generator: each page is written out before the next one is taken,
+        so no decoded bitmaps are kept. created_at is written as the PDF creation date,
+        so rebuilding the same pages gives the same bytes (needed to resume an interrupted upload).
+        """
+        output = io.BytesIO()
+        offsets = {}
+
+        def write_object(number: int, body: str, stream: bytes = None):
+            offsets[number] = output.tell()
+            output.write(f"{number} 0 obj\n{body}".encode('ascii'))
+            if stream is not None:
+                output.write(b"\nstream\n")
+                output.write(stream)
+                output.write(b"\nendstream")
+            output.write(b"\nendobj\n")
+
+        output.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+        # 1 - catalog, 2 - page tree, then image, content and page objects of each page, info last
+        kids = []
+        number = 3
+        for jpeg in pages:
+            with Image.open(io.BytesIO(jpeg)) as image:
+                (width, height), mode = image.size, image.mode
+            page_width, page_height = (round(side * 72 / self.dpi, 2) for side in (width, height))
+            color_space = 'DeviceGray' if mode == 'L' else 'DeviceRGB'
+            content = f"q {page_width} 0 0 {page_height} 0 0 cm /Im0 Do Q".encode('ascii')
+
+            write_object(number, f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                                 f"/ColorSpace /{color_space} /BitsPerComponent 8 /Filter /DCTDecode "
+                                 f"/Length {len(jpeg)} >>", jpeg)
+            write_object(number + 1, f"<< /Length {len(content)} >>", content)
+            write_object(number + 2, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width} {page_height}] "
+                                     f"/Resources << /XObject << /Im0 {number} 0 R >> >> /Contents {number + 1} 0 R >>")
+            kids.append(number + 2)
+            number += 3
+
+        if not kids:
+            raise ValueError("PDF needs at least one page")
+
+        write_object(2, f"<< /Type /Pages /Kids [{' '.join(f'{kid} 0 R' for kid in kids)}] /Count {len(kids)} >>")
+        write_object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+        date = (created_at or datetime.utcnow()).strftime("D:%Y%m%d%H%M%SZ")
+        write_object(number, f"<< /CreationDate ({date}) /ModDate ({date}) >>")
+
+        xref_offset = output.tell()
+        output.write(f"xref\n0 {number + 1}\n0000000000 65535 f \n".encode('ascii'))
+        for obj in range(1, number + 1):
+            output.write(f"{offsets[obj]:010d} 00000 n \n".encode('ascii'))
+        output.write(f"trailer\n<< /Size {number + 1} /Root 1 0 R /Info {number} 0 R >>\n"
+                     f"startxref\n{xref_offset}\n%%EOF\n".encode('ascii'))
+
+        logger.debug(f"Built PDF of {len(kids)} pages, {output.tell()} bytes")
+        output.seek(0)
+        return output
+
+    def images_to_pdf(self, streams: Iterable[BinaryIO], created_at: datetime = None) -> BinaryIO:
+        """Merge images into a multi-page PDF, one page per image, decoding one image at a time"""
+        return self.build_pdf((self.to_pdf_page(stream) for stream in streams), created_at)
+
+
+image_processing_service = ImageProcessingService()
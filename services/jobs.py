@@ -0,0 +1,60 @@
+import logging
+from datetime import datetime, timezone
+from apscheduler.schedulers.base import BaseScheduler
+from config import STAGE_RECONCILE_INTERVAL, CRM_OUTBOX_INTERVAL, DRIVE_FOLDER_POOL_INTERVAL, UPLOAD_JOB_INTERVAL
+from services.user_service import user_service
+from services.crm_outbox_service import crm_outbox_service
+from services.drive_folder_pool import drive_folder_pool
+from services.upload_job_service import upload_job_service
+
+logger = logging.getLogger(__name__)
+
+
+def register_jobs(scheduler: BaseScheduler) -> BaseScheduler:
+    """Register periodic background jobs on scheduler"""
+    if STAGE_RECONCILE_INTERVAL > 0:
+        scheduler.add_job(
+            user_service.reconcile_stages,
+            'interval',
+            seconds=STAGE_RECONCILE_INTERVAL,
+            id='reconcile_stages',
+            max_instances=1,
+            coalesce=True
+        )
+        logger.info(f"Stage reconciliation scheduled every {STAGE_RECONCILE_INTERVAL}s")
+
+    if CRM_OUTBOX_INTERVAL > 0:
+        scheduler.add_job(
+            crm_outbox_service.drain,
+            'interval',
+            seconds=CRM_OUTBOX_INTERVAL,
+            id='drain_crm_outbox',
+            max_instances=1,
+            coalesce=True
+        )
+        logger.info(f"CRM outbox drained every {CRM_OUTBOX_INTERVAL}s")
+
+    if drive_folder_pool.enabled and DRIVE_FOLDER_POOL_INTERVAL > 0:
+        scheduler.add_job(
+            drive_folder_pool.refill,
+            'interval',
+            seconds=DRIVE_FOLDER_POOL_INTERVAL,
+            id='refill_drive_folder_pool',
+            max_instances=1,
+            coalesce=True,
+            next_run_time=datetime.now(timezone.utc)
+        )
+        logger.info(f"Drive folder pool checked every {DRIVE_FOLDER_POOL_INTERVAL}s")
+
+    if UPLOAD_JOB_INTERVAL > 0:
+        scheduler.add_job(
+            upload_job_service.run_pending,
+            'interval',
+            seconds=UPLOAD_JOB_INTERVAL,
+            id='process_upload_jobs',
+            max_instances=1,
+            coalesce=True
+        )
+        logger.info(f"Document upload jobs processed every {UPLOAD_JOB_INTERVAL}s")
+
+    return scheduler
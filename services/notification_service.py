@@ -0,0 +1,81 @@
+import logging
+from datetime import datetime, timedelta
+from typing import List, Tuple
+from sqlalchemy import select, update
+from database import ScheduledMessage, get_session
+
+logger = logging.getLogger(__name__)
+
+# Claimed but unconfirmed messages are retried after this delay
+CLAIM_TIMEOUT = timedelta(minutes=1)
+MAX_ATTEMPTS = 5
+
+
+class NotificationService:
+    """Hands messages from web/worker processes over to the bot process via pt_scheduled_messages"""
+
+    @staticmethod
+    def schedule_message(telegram_id: int, text: str, message_type: str = 'notification',
+                         scheduled_for: datetime = None) -> bool:
+        """Queue message for delivery by the bot process"""
+        try:
+            with get_session() as session:
+                session.add(ScheduledMessage(
+                    telegram_id=telegram_id,
+                    message_type=message_type,
+                    text=text,
+                    scheduled_for=scheduled_for or datetime.utcnow()
+                ))
+            return True
+        except Exception as e:
+            logger.error(f"Error scheduling message for {telegram_id}: {e}")
+            return False
+
+    @staticmethod
+    def claim_due_messages(limit: int = 50) -> List[Tuple[int, int, str]]:
+        """Atomically claim due messages. Returns list of (id, telegram_id, text)"""
+        try:
+            now = datetime.utcnow()
+            with get_session() as session:
+                due = select(ScheduledMessage.id).where(
+                    ScheduledMessage.sent == False,
+                    ScheduledMessage.text.isnot(None),
+                    ScheduledMessage.scheduled_for <= now,
+                    ScheduledMessage.attempts < MAX_ATTEMPTS,
+                    (ScheduledMessage.claimed_at.is_(None)) | (ScheduledMessage.claimed_at < now - CLAIM_TIMEOUT)
+                ).order_by(ScheduledMessage.id).limit(limit).with_for_update(skip_locked=True)
+
+                rows = session.execute(
+                    update(ScheduledMessage)
+                    .where(ScheduledMessage.id.in_(due.scalar_subquery()))
+                    .values(claimed_at=now, attempts=ScheduledMessage.attempts + 1)
+                    .returning(ScheduledMessage.id, ScheduledMessage.telegram_id, ScheduledMessage.text)
+                    .execution_options(synchronize_session=False)
+                ).all()
+
+            return [tuple(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error claiming scheduled messages: {e}")
+            return []
+
+    @staticmethod
+    def mark_sent(message_ids: List[int]) -> bool:
+        """Mark messages as delivered"""
+        if not message_ids:
+            return True
+
+        try:
+            with get_session() as session:
+                session.execute(
+                    update(ScheduledMessage)
+                    .where(ScheduledMessage.id.in_(message_ids))
+                    .values(sent=True, sent_at=datetime.utcnow())
+                    .execution_options(synchronize_session=False)
+                )
+            return True
+        except Exception as e:
+            logger.error(f"Error marking messages as sent: {e}")
+            return False
+
+
+notification_service = NotificationService()
@@ -1,32 +1,75 @@
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List, Dict
-from database import QuestionnaireAnswer, get_session, ClientCategory
+from sqlalchemy import select
+from database import QuestionnaireAnswer, User, get_session, get_async_session, ClientCategory
+from config import DRIVE_MAX_WORKERS
 from bot.utils.messages import QUESTIONNAIRE_QUESTIONS
+from services.crm_outbox_service import crm_outbox_service
+from services.user_service import user_service
 
 logger = logging.getLogger(__name__)
 
 
+def _answer(telegram_id: int, question_number: int):
+    return select(QuestionnaireAnswer).where(
+        QuestionnaireAnswer.telegram_id == telegram_id,
+        QuestionnaireAnswer.question_number == question_number
+    )
+
+
+def _answer_text(telegram_id: int, question_number: int):
+    return select(QuestionnaireAnswer.answer_text).where(
+        QuestionnaireAnswer.telegram_id == telegram_id,
+        QuestionnaireAnswer.question_number == question_number
+    )
+
+
+def _answers(telegram_id: int):
+    return select(QuestionnaireAnswer.question_number, QuestionnaireAnswer.answer_text).where(
+        QuestionnaireAnswer.telegram_id == telegram_id
+    ).order_by(QuestionnaireAnswer.question_number)
+
+
+def _deal_id(telegram_id: int):
+    return select(User.bitrix_deal_id).where(User.telegram_id == telegram_id)
+
+
+def _store_answer(session, existing: Optional[QuestionnaireAnswer], telegram_id: int, question_number: int,
+                  answer_text: str):
+    if existing:
+        existing.answer_text = answer_text
+    else:
+        session.add(QuestionnaireAnswer(
+            telegram_id=telegram_id,
+            question_number=question_number,
+            answer_text=answer_text
+        ))
+
+
+def _with_questions(answers: Dict[int, str]) -> List[tuple]:
+    return [
+        (q_num, QUESTIONNAIRE_QUESTIONS[q_num - 1], answer_text)
+        for q_num, answer_text in answers.items()
+        if q_num <= len(QUESTIONNAIRE_QUESTIONS)
+    ]
+
+
 class QuestionnaireService:
     @staticmethod
-    def save_answer(telegram_id: int, question_number: int, answer_text: str) -> bool:
-        """Save questionnaire answer"""
+    def save_answer(telegram_id: int, question_number: int, answer_text: str,
+                    crm_fields: Optional[Dict] = None) -> bool:
+        """Save questionnaire answer, queueing crm_fields for the user's deal in the same transaction"""
         try:
             with get_session() as session:
-                # Check if answer already exists
-                existing = session.query(QuestionnaireAnswer).filter(
-                    QuestionnaireAnswer.telegram_id == telegram_id,
-                    QuestionnaireAnswer.question_number == question_number
-                ).first()
-
-                if existing:
-                    existing.answer_text = answer_text
-                else:
-                    answer = QuestionnaireAnswer(
-                        telegram_id=telegram_id,
-                        question_number=question_number,
-                        answer_text=answer_text
-                    )
-                    session.add(answer)
+                existing = session.scalar(_answer(telegram_id, question_number))
+                _store_answer(session, existing, telegram_id, question_number, answer_text)
+
+                if crm_fields:
+                    deal_id = session.scalar(_deal_id(telegram_id))
+                    if deal_id:
+                        crm_outbox_service.enqueue(session, deal_id, crm_fields)
 
                 session.commit()
                 logger.info(f"Saved answer for user {telegram_id}, question {question_number}")
@@ -40,11 +83,7 @@ class QuestionnaireService:
         """Get all answers for user as dict {question_number: answer_text}"""
         try:
             with get_session() as session:
-                answers = session.query(QuestionnaireAnswer).filter(
-                    QuestionnaireAnswer.telegram_id == telegram_id
-                ).order_by(QuestionnaireAnswer.question_number).all()
-
-                return {answer.question_number: answer.answer_text for answer in answers}
+                return {q_num: answer_text for q_num, answer_text in session.execute(_answers(telegram_id))}
         except Exception as e:
             logger.error(f"Error getting answers: {e}")
             return {}
@@ -52,19 +91,7 @@ class QuestionnaireService:
     @staticmethod
     def get_answers_with_questions(telegram_id: int) -> List[tuple]:
         """Get answers with questions as list of (q_number, q_text, answer_text)"""
-        try:
-            answers_dict = QuestionnaireService.get_answers(telegram_id)
-            result = []
-
-            for q_num, answer_text in answers_dict.items():
-                if q_num <= len(QUESTIONNAIRE_QUESTIONS):
-                    q_text = QUESTIONNAIRE_QUESTIONS[q_num - 1]
-                    result.append((q_num, q_text, answer_text))
-
-            return result
-        except Exception as e:
-            logger.error(f"Error getting answers with questions: {e}")
-            return []
+        return _with_questions(QuestionnaireService.get_answers(telegram_id))
 
     @staticmethod
     def determine_client_category(answers: Dict[int, str]) -> ClientCategory:
@@ -91,27 +118,141 @@ class QuestionnaireService:
     @staticmethod
     def is_questionnaire_complete(telegram_id: int) -> bool:
         """Check if user has completed questionnaire (all 15 questions)"""
-        try:
-            answers = QuestionnaireService.get_answers(telegram_id)
-            return len(answers) >= 15
-        except Exception as e:
-            logger.error(f"Error checking questionnaire completion: {e}")
-            return False
+        return len(QuestionnaireService.get_answers(telegram_id)) >= 15
 
     @staticmethod
     def get_answer(telegram_id: int, question_number: int) -> Optional[str]:
         """Get specific answer"""
         try:
             with get_session() as session:
-                answer = session.query(QuestionnaireAnswer).filter(
-                    QuestionnaireAnswer.telegram_id == telegram_id,
-                    QuestionnaireAnswer.question_number == question_number
-                ).first()
+                return session.scalar(_answer_text(telegram_id, question_number))
+        except Exception as e:
+            logger.error(f"Error getting answer: {e}")
+            return None
+
+    @staticmethod
+    def export_questionnaire(telegram_id: int, only_existing: bool = False) -> Optional[str]:
+        """
+        Write user's answers to the questionnaire file on Drive, in place if it exists. Returns file ID.
+        With only_existing=True a user without the file is skipped.
+        """
+        from integrations.google_drive import google_drive_client
+
+        try:
+            with get_session() as session:
+                user = session.query(
+                    User.phone_number, User.google_drive_folder_id, User.questionnaire_file_id
+                ).filter(User.telegram_id == telegram_id).first()
+
+            if not user or not user.google_drive_folder_id:
+                return None
+            if only_existing and not user.questionnaire_file_id:
+                return None
+
+            answers = QuestionnaireService.get_answers_with_questions(telegram_id)
+            if not answers:
+                return None
+
+            file_id = google_drive_client.save_questionnaire_file(
+                answers, user.phone_number, user.google_drive_folder_id, user.questionnaire_file_id
+            )
+
+            if file_id and file_id != user.questionnaire_file_id:
+                user_service.set_questionnaire_file(telegram_id, file_id)
+
+            return file_id
+        except Exception as e:
+            logger.error(f"Error exporting questionnaire of user {telegram_id}: {e}")
+            return None
 
-                return answer.answer_text if answer else None
+    @staticmethod
+    def export_questionnaires(telegram_ids: List[int] = None, max_workers: int = DRIVE_MAX_WORKERS) -> Dict:
+        """
+        Regenerate questionnaire files concurrently, e.g. after the template changed.
+        Without telegram_ids: every user with a Drive folder and answers
+        """
+        started = time.monotonic()
+
+        if telegram_ids is None:
+            with get_session() as session:
+                telegram_ids = [row[0] for row in session.query(User.telegram_id).filter(
+                    User.google_drive_folder_id.isnot(None),
+                    User.questionnaire_answers.any()
+                ).order_by(User.telegram_id).all()]
+
+        report = {'total': len(telegram_ids), 'exported': 0, 'failed': 0}
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='questionnaire') as executor:
+            for file_id in executor.map(QuestionnaireService.export_questionnaire, telegram_ids):
+                report['exported' if file_id else 'failed'] += 1
+
+        report['duration_seconds'] = round(time.monotonic() - started, 3)
+        logger.info(f"Questionnaires exported: {report}")
+        return report
+
+
+class AsyncQuestionnaireService:
+    """QuestionnaireService for bot handlers, on the async engine (Drive exports run QuestionnaireService's on the Drive pool)"""
+
+    determine_client_category = staticmethod(QuestionnaireService.determine_client_category)
+
+    @staticmethod
+    async def export_questionnaire(telegram_id: int, only_existing: bool = False) -> Optional[str]:
+        """QuestionnaireService.export_questionnaire on the Drive thread pool"""
+        from integrations.google_drive import async_google_drive_client
+        return await async_google_drive_client.run(QuestionnaireService.export_questionnaire,
+                                                   telegram_id, only_existing)
+
+    @staticmethod
+    async def save_answer(telegram_id: int, question_number: int, answer_text: str,
+                          crm_fields: Optional[Dict] = None) -> bool:
+        """Save questionnaire answer, queueing crm_fields for the user's deal in the same transaction"""
+        try:
+            async with get_async_session() as session:
+                existing = await session.scalar(_answer(telegram_id, question_number))
+                _store_answer(session, existing, telegram_id, question_number, answer_text)
+
+                if crm_fields:
+                    deal_id = await session.scalar(_deal_id(telegram_id))
+                    if deal_id:
+                        crm_outbox_service.enqueue(session, deal_id, crm_fields)
+
+            logger.info(f"Saved answer for user {telegram_id}, question {question_number}")
+            return True
+        except Exception as e:
+            logger.error(f"Error saving answer: {e}")
+            return False
+
+    @staticmethod
+    async def get_answers(telegram_id: int) -> Dict[int, str]:
+        """Get all answers for user as dict {question_number: answer_text}"""
+        try:
+            async with get_async_session() as session:
+                rows = await session.execute(_answers(telegram_id))
+                return {q_num: answer_text for q_num, answer_text in rows}
+        except Exception as e:
+            logger.error(f"Error getting answers: {e}")
+            return {}
+
+    @staticmethod
+    async def get_answers_with_questions(telegram_id: int) -> List[tuple]:
+        """Get answers with questions as list of (q_number, q_text, answer_text)"""
+        return _with_questions(await AsyncQuestionnaireService.get_answers(telegram_id))
+
+    @staticmethod
+    async def is_questionnaire_complete(telegram_id: int) -> bool:
+        """Check if user has completed questionnaire (all 15 questions)"""
+        return len(await AsyncQuestionnaireService.get_answers(telegram_id)) >= 15
+
+    @staticmethod
+    async def get_answer(telegram_id: int, question_number: int) -> Optional[str]:
+        """Get specific answer"""
+        try:
+            async with get_async_session() as session:
+                return await session.scalar(_answer_text(telegram_id, question_number))
         except Exception as e:
             logger.error(f"Error getting answer: {e}")
             return None
 
 
 questionnaire_service = QuestionnaireService()
+async_questionnaire_service = AsyncQuestionnaireService()
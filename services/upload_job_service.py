@@ -0,0 +1,425 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional, Dict, List
+from sqlalchemy import select, update, or_, func
+from database import UploadJob, get_session
+from config import UPLOAD_WORKERS, DOCUMENT_BUNDLE_IDLE_SECONDS, DOCUMENT_BUNDLE_MAX_PAGES, TELEGRAM_FILE_MAX_SIZE
+from bot.utils import messages
+from services.document_service import document_service
+from services.notification_service import notification_service
+from services.image_processing import image_processing_service
+from integrations.telegram_files import FileTooLargeError, FileUnavailableError
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 8
+RETRY_BASE = timedelta(seconds=30)
+RETRY_MAX = timedelta(hours=1)
+# Jobs of a worker that died mid-upload are picked up again after this delay
+CLAIM_TIMEOUT = timedelta(minutes=15)
+# Failures no retry can fix
+PERMANENT_ERRORS = (FileTooLargeError, FileUnavailableError)
+
+
+class UploadJobService:
+    """Durable queue of Telegram -> Google Drive document uploads, processed by worker processes"""
+
+    def __init__(self, workers: int = UPLOAD_WORKERS):
+        self.workers = workers
+        self._executor = None
+
+    @staticmethod
+    def enqueue(telegram_id: int, telegram_file_id: str, file_name: str, folder_id: str,
+                mime_type: str = None, telegram_file_unique_id: str = None,
+                document_type: str = None, bundle: bool = False) -> Optional[int]:
+        """
+        Record upload job. Returns job id.
+        With bundle=True the file is held as a page of document_type until flush_bundles().
+        """
+        try:
+            with get_session() as session:
+                job = UploadJob(
+                    telegram_id=telegram_id,
+                    telegram_file_id=telegram_file_id,
+                    telegram_file_unique_id=telegram_file_unique_id,
+                    file_name=file_name,
+                    mime_type=mime_type,
+                    folder_id=folder_id,
+                    document_type=document_type,
+                    status='collecting' if bundle else 'pending',
+                    next_attempt_at=datetime.utcnow()
+                )
+                session.add(job)
+                session.flush()
+                job_id = job.id
+            logger.info(f"Queued upload job {job_id} for user {telegram_id}: {file_name}")
+            return job_id
+        except Exception as e:
+            logger.error(f"Error queueing upload job: {e}")
+            return None
+
+    @staticmethod
+    def find_queued(telegram_id: int, telegram_file_unique_id: str) -> Optional[str]:
+        """File name of a not failed job for the same Telegram file, if any"""
+        try:
+            with get_session() as session:
+                return session.query(UploadJob.file_name).filter(
+                    UploadJob.telegram_id == telegram_id,
+                    UploadJob.telegram_file_unique_id == telegram_file_unique_id,
+                    UploadJob.status != 'failed'
+                ).limit(1).scalar()
+        except Exception as e:
+            logger.error(f"Error looking up queued upload: {e}")
+            return None
+
+    @staticmethod
+    def _bundle_name(document_type: str, part: int, parts: int) -> str:
+        name = document_type[:200]
+        return f"{name} ({part}).pdf" if parts > 1 else f"{name}.pdf"
+
+    def flush_bundles(self, telegram_id: int = None, document_type: str = None) -> int:
+        """
+        Turn collected pages into PDF bundle jobs: those of telegram_id/document_type right away,
+        or, without telegram_id, those of documents idle for DOCUMENT_BUNDLE_IDLE_SECONDS.
+        A single page is uploaded as is. Returns number of jobs released.
+        """
+        now = datetime.utcnow()
+        idle_before = now - timedelta(seconds=DOCUMENT_BUNDLE_IDLE_SECONDS)
+        released = 0
+
+        try:
+            with get_session() as session:
+                query = select(UploadJob).where(UploadJob.status == 'collecting')
+                if telegram_id is not None:
+                    query = query.where(UploadJob.telegram_id == telegram_id,
+                                        UploadJob.document_type == document_type)
+                pages = session.execute(
+                    query.order_by(UploadJob.id).with_for_update(skip_locked=True)
+                ).scalars().all()
+
+                groups = OrderedDict()
+                for page in pages:
+                    groups.setdefault((page.telegram_id, page.document_type), []).append(page)
+
+                for (user_id, doc_type), group in groups.items():
+                    if telegram_id is None and group[-1].created_at > idle_before:
+                        continue
+
+                    if len(group) == 1 or not image_processing_service.enabled:
+                        for page in group:
+                            page.status = 'pending'
+                            page.next_attempt_at = now
+                        released += len(group)
+                        continue
+
+                    parts = range(0, len(group), DOCUMENT_BUNDLE_MAX_PAGES)
+                    for part, start in enumerate(parts, 1):
+                        bundle = UploadJob(
+                            telegram_id=user_id,
+                            file_name=self._bundle_name(doc_type, part, len(parts)),
+                            mime_type='application/pdf',
+                            folder_id=group[0].folder_id,
+                            document_type=doc_type,
+                            status='pending',
+                            next_attempt_at=now
+                        )
+                        session.add(bundle)
+                        session.flush()
+
+                        for page in group[start:start + DOCUMENT_BUNDLE_MAX_PAGES]:
+                            page.status = 'bundled'
+                            page.bundle_job_id = bundle.id
+                        released += 1
+
+            if released:
+                logger.info(f"Released {released} upload jobs from collected pages")
+            return released
+        except Exception as e:
+            logger.error(f"Error flushing document bundles: {e}")
+            return 0
+
+    @staticmethod
+    def claim_jobs(limit: int) -> List[Dict]:
+        """
+        Atomically claim due jobs, including ones abandoned by a dead worker.
+        Abandoned jobs that already used up MAX_ATTEMPTS are failed instead.
+        """
+        now = datetime.utcnow()
+        with get_session() as session:
+            exhausted = session.execute(
+                update(UploadJob)
+                .where(UploadJob.status == 'uploading',
+                       UploadJob.claimed_at < now - CLAIM_TIMEOUT,
+                       UploadJob.attempts >= MAX_ATTEMPTS)
+                .values(status='failed', last_error='Worker stopped during the last attempt', finished_at=now)
+                .returning(UploadJob.id, UploadJob.telegram_id, UploadJob.file_name)
+                .execution_options(synchronize_session=False)
+            ).all()
+
+            due = select(UploadJob.id).where(
+                or_(
+                    (UploadJob.status == 'pending') & (UploadJob.next_attempt_at <= now),
+                    (UploadJob.status == 'uploading') & (UploadJob.claimed_at < now - CLAIM_TIMEOUT)
+                )
+            ).order_by(UploadJob.id).limit(limit).with_for_update(skip_locked=True)
+
+            rows = session.execute(
+                update(UploadJob)
+                .where(UploadJob.id.in_(due.scalar_subquery()))
+                .values(status='uploading', claimed_at=now, attempts=UploadJob.attempts + 1)
+                .returning(UploadJob.id, UploadJob.telegram_id, UploadJob.telegram_file_id,
+                           UploadJob.telegram_file_unique_id, UploadJob.file_name, UploadJob.mime_type,
+                           UploadJob.folder_id, UploadJob.document_type, UploadJob.resumable_uri,
+                           UploadJob.attempts, UploadJob.created_at)
+                .execution_options(synchronize_session=False)
+            ).mappings().all()
+
+        for job_id, telegram_id, file_name in exhausted:
+            UploadJobService._notify_failed(job_id, telegram_id, messages.DOCUMENT_UPLOAD_FAILED.format(file_name))
+            logger.error(f"Upload job {job_id} failed: worker stopped during attempt {MAX_ATTEMPTS}")
+
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def _update(job_id: int, **values):
+        with get_session() as session:
+            session.execute(
+                update(UploadJob)
+                .where(UploadJob.id == job_id)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+
+    @staticmethod
+    def _retry_delay(attempts: int) -> timedelta:
+        return min(RETRY_BASE * (2 ** (attempts - 1)), RETRY_MAX)
+
+    @staticmethod
+    def _release_pages(page_ids: List[int]):
+        """Pages that cannot go into a PDF are uploaded as sent, each as its own job"""
+        with get_session() as session:
+            session.execute(
+                update(UploadJob)
+                .where(UploadJob.id.in_(page_ids))
+                .values(status='pending', bundle_job_id=None, next_attempt_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+
+    @staticmethod
+    def _upload_bundle(job: Dict, on_progress) -> Optional[Dict]:
+        """
+        Download the bundle's pages, merge them into one PDF and upload it.
+        Pages that cannot be decoded are released as separate jobs; returns None if none is left.
+        """
+        from integrations.google_drive import google_drive_client
+        from integrations.telegram_files import get_file_url, spool_telegram_file
+
+        with get_session() as session:
+            pages = session.query(UploadJob.id, UploadJob.telegram_file_id).filter(
+                UploadJob.bundle_job_id == job['id']
+            ).order_by(UploadJob.id).all()
+
+        # Compressed JPEG pages; only one page is decoded at a time
+        jpegs, undecodable = [], []
+        for page_id, file_id in pages:
+            spool, _, _ = spool_telegram_file(get_file_url(file_id))
+            try:
+                jpegs.append(image_processing_service.to_pdf_page(spool))
+            except Exception as e:
+                logger.warning(f"Page {page_id} of upload job {job['id']} cannot be decoded, "
+                               f"uploading it separately: {e}")
+                undecodable.append(page_id)
+            finally:
+                spool.close()
+
+        # Before the upload starts, so a retry builds the same PDF from the remaining pages
+        if undecodable:
+            UploadJobService._release_pages(undecodable)
+        if not jpegs:
+            return None
+
+        pdf = image_processing_service.build_pdf(jpegs, job['created_at'])
+        file_id = google_drive_client.upload_stream(pdf, job['file_name'], job['folder_id'], 'application/pdf',
+                                                    job['resumable_uri'], on_progress)
+        content = pdf.getbuffer()
+        return {'file_id': file_id, 'content_hash': hashlib.sha256(content).hexdigest(),
+                'file_size': content.nbytes, 'duplicate': False}
+
+    def process_job(self, job: Dict) -> str:
+        """Download from Telegram and upload to Drive, resuming the saved session. Returns final status"""
+        from integrations.google_drive import google_drive_client
+        from integrations.telegram_files import get_file_url
+
+        job_id, telegram_id = job['id'], job['telegram_id']
+
+        def save_progress(resumable_uri: Optional[str], bytes_uploaded: int):
+            self._update(job_id, resumable_uri=resumable_uri, bytes_uploaded=bytes_uploaded,
+                         claimed_at=datetime.utcnow())
+
+        # Photos are recompressed; other files go as sent
+        normalize = image_processing_service.normalize if (
+            image_processing_service.enabled and job['mime_type'] == 'image/jpeg'
+        ) else None
+
+        # Name of the stored document with the same content, if any
+        duplicate_of = []
+
+        def is_duplicate(content_hash: str) -> bool:
+            name = document_service.find_duplicate(telegram_id, content_hash=content_hash)
+            if name:
+                duplicate_of.append(name)
+            return name is not None
+
+        error = None
+        try:
+            if job['telegram_file_id'] is None:
+                upload = self._upload_bundle(job, save_progress)
+                if upload is None:
+                    # Every page went out as a job of its own
+                    self._update(job_id, status='split', finished_at=datetime.utcnow())
+                    logger.info(f"Upload job {job_id} split: none of its pages can be decoded")
+                    return 'split'
+            else:
+                upload = google_drive_client.upload_telegram_file(
+                    get_file_url(job['telegram_file_id']),
+                    job['file_name'],
+                    job['folder_id'],
+                    job['mime_type'],
+                    is_duplicate=is_duplicate,
+                    resumable_uri=job['resumable_uri'],
+                    on_progress=save_progress,
+                    transform=normalize
+                )
+        except PERMANENT_ERRORS as e:
+            # Retrying will not help: fail at once so the user hears about it now
+            self._update(job_id, status='failed', last_error=str(e), finished_at=datetime.utcnow())
+            text = messages.DOCUMENT_TOO_LARGE.format(job['file_name'], TELEGRAM_FILE_MAX_SIZE // (1024 * 1024)) \
+                if isinstance(e, FileTooLargeError) else messages.DOCUMENT_UPLOAD_FAILED.format(job['file_name'])
+            self._notify_failed(job_id, telegram_id, text)
+            logger.error(f"Upload job {job_id} failed permanently: {e}")
+            return 'failed'
+        except Exception as e:
+            upload, error = None, f"{type(e).__name__}: {e}"
+
+        now = datetime.utcnow()
+
+        if upload and upload['duplicate']:
+            stored_name = duplicate_of[0]
+            document_service.link_telegram_file(telegram_id, upload['content_hash'], job['telegram_file_unique_id'])
+            # The job keeps this Telegram file's unique ID, and now the stored document's name,
+            # so find_queued() answers for the same file sent again
+            self._update(job_id, status='duplicate', file_name=stored_name, content_hash=upload['content_hash'],
+                         file_size=upload['file_size'], finished_at=now)
+            notification_service.schedule_message(
+                telegram_id, messages.DOCUMENT_ALREADY_RECEIVED.format(stored_name), 'document_duplicate'
+            )
+            return 'duplicate'
+
+        if upload:
+            document_service.save_document(
+                telegram_id=telegram_id,
+                document_type=job['document_type'] or job['file_name'],
+                file_name=job['file_name'],
+                google_drive_file_id=upload['file_id'],
+                content_hash=upload['content_hash'],
+                file_size=upload['file_size'],
+                telegram_file_unique_id=job['telegram_file_unique_id']
+            )
+            self._update(job_id, status='done', google_drive_file_id=upload['file_id'],
+                         content_hash=upload['content_hash'], file_size=upload['file_size'],
+                         resumable_uri=None, last_error=None, finished_at=now)
+            notification_service.schedule_message(
+                telegram_id, messages.DOCUMENT_UPLOADED.format(job['file_name']), 'document_uploaded'
+            )
+            return 'done'
+
+        return self._retry_or_fail(job, error or 'Upload failed')
+
+    def _retry_or_fail(self, job: Dict, error: str) -> str:
+        """Schedule the next attempt with backoff, or fail the job once MAX_ATTEMPTS are used up"""
+        job_id, now = job['id'], datetime.utcnow()
+
+        if job['attempts'] >= MAX_ATTEMPTS:
+            self._update(job_id, status='failed', last_error=error, finished_at=now)
+            self._notify_failed(job_id, job['telegram_id'], messages.DOCUMENT_UPLOAD_FAILED.format(job['file_name']))
+            logger.error(f"Upload job {job_id} failed after {job['attempts']} attempts: {error}")
+            return 'failed'
+
+        self._update(job_id, status='pending', last_error=error,
+                     next_attempt_at=now + self._retry_delay(job['attempts']))
+        logger.warning(f"Upload job {job_id} attempt {job['attempts']} failed, will retry: {error}")
+        return 'retry'
+
+    @staticmethod
+    def _notify_failed(job_id: int, telegram_id: int, text: str):
+        """Release pages of a failed bundle and tell the user"""
+        UploadJobService._fail_pages(job_id)
+        notification_service.schedule_message(telegram_id, text, 'document_failed')
+
+    @staticmethod
+    def _fail_pages(job_id: int):
+        """Pages of a failed bundle may be sent again"""
+        with get_session() as session:
+            session.execute(
+                update(UploadJob)
+                .where(UploadJob.bundle_job_id == job_id)
+                .values(status='failed')
+                .execution_options(synchronize_session=False)
+            )
+
+    def run_pending(self) -> Dict:
+        """Release idle bundles, then claim up to `workers` jobs and process them in parallel"""
+        started = time.monotonic()
+        report = {'claimed': 0, 'done': 0, 'duplicate': 0, 'split': 0, 'retry': 0, 'failed': 0}
+
+        self.flush_bundles()
+
+        try:
+            jobs = self.claim_jobs(self.workers)
+        except Exception as e:
+            logger.error(f"Error claiming upload jobs: {e}")
+            return report
+
+        if not jobs:
+            return report
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='upload')
+
+        report['claimed'] = len(jobs)
+        for status in self._executor.map(self._process_safely, jobs):
+            report[status] += 1
+
+        report['duration_seconds'] = round(time.monotonic() - started, 3)
+        logger.info(f"Upload jobs processed: {report}")
+        return report
+
+    def _process_safely(self, job: Dict) -> str:
+        try:
+            return self.process_job(job)
+        except Exception as e:
+            logger.error(f"Error processing upload job {job['id']}: {e}", exc_info=True)
+            try:
+                return self._retry_or_fail(job, f"{type(e).__name__}: {e}")
+            except Exception as update_error:
+                # Left claimed; it is picked up again after CLAIM_TIMEOUT
+                logger.error(f"Error rescheduling upload job {job['id']}: {update_error}")
+                return 'retry'
+
+    @staticmethod
+    def get_queue_stats() -> Dict[str, int]:
+        """Number of jobs per status"""
+        try:
+            with get_session() as session:
+                rows = session.query(UploadJob.status, func.count(UploadJob.id)).group_by(UploadJob.status).all()
+            return {status: count for status, count in rows}
+        except Exception as e:
+            logger.error(f"Error getting upload job stats: {e}")
+            return {}
+
+
+upload_job_service = UploadJobService()
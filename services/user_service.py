@@ -1,12 +1,100 @@
 import logging
-from typing import Optional
-from database import User, get_session, ClientCategory
+import time
+from typing import Optional, Dict
+from sqlalchemy import update, case, select, func
+from database import User, get_session, get_async_session, ClientCategory
+from services.deal_index import deal_index
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 
-class UserService:
+def _new_user(telegram_id: int, full_name: str, phone_number: str, bitrix_contact_id: Optional[int],
+              bitrix_deal_id: Optional[int], current_stage: Optional[str]) -> User:
+    now = datetime.utcnow()
+    return User(
+        telegram_id=telegram_id,
+        full_name=full_name,
+        phone_number=phone_number,
+        bitrix_contact_id=bitrix_contact_id,
+        bitrix_deal_id=bitrix_deal_id,
+        current_stage=current_stage,
+        registration_date=now,
+        deal_updated_at=now if bitrix_deal_id else None
+    )
+
+
+def _user_by_phone(phone_number: str):
+    return select(User).where(User.phone_number == phone_number)
+
+
+def _users(category: ClientCategory = None, conferences_only: bool = False):
+    query = select(User)
+    if conferences_only:
+        query = query.where(User.conference_disabled == False)
+    if category:
+        query = query.where(User.client_category == category)
+    return query
+
+
+def _user_count():
+    return select(func.count()).select_from(User)
+
+
+def _apply_update(user: User, fields: Dict) -> Optional[int]:
+    """Set known fields on user. Returns the deal ID it had before"""
+    old_deal_id = user.bitrix_deal_id
+    for key, value in fields.items():
+        if hasattr(user, key):
+            setattr(user, key, value)
+    if user.bitrix_deal_id != old_deal_id:
+        user.deal_updated_at = datetime.utcnow()
+    return old_deal_id
+
+
+def _index_deal_change(telegram_id: int, fields: Dict, old_deal_id: Optional[int]):
+    if 'bitrix_deal_id' in fields and fields['bitrix_deal_id'] != old_deal_id:
+        if old_deal_id:
+            deal_index.discard(old_deal_id)
+        if fields['bitrix_deal_id']:
+            deal_index.set(fields['bitrix_deal_id'], telegram_id)
+
+
+class _UserFieldSetters:
+    """Single-field updates through the class's update_user (awaitable in AsyncUserService)"""
+
+    @classmethod
+    def update_stage(cls, telegram_id: int, new_stage: str):
+        """Update user's current stage"""
+        return cls.update_user(telegram_id, current_stage=new_stage)
+
+    @classmethod
+    def set_client_category(cls, telegram_id: int, category: ClientCategory):
+        """Set client category (CRYPTO, MFO, BANK)"""
+        return cls.update_user(telegram_id, client_category=category)
+
+    @classmethod
+    def set_google_folder(cls, telegram_id: int, folder_id: str):
+        """Set Google Drive folder ID for user"""
+        return cls.update_user(telegram_id, google_drive_folder_id=folder_id)
+
+    @classmethod
+    def set_questionnaire_file(cls, telegram_id: int, file_id: str):
+        """Set Google Drive ID of user's questionnaire file"""
+        return cls.update_user(telegram_id, questionnaire_file_id=file_id)
+
+    @classmethod
+    def toggle_conference_disabled(cls, telegram_id: int, disabled: bool):
+        """Enable/disable conference invitations for user"""
+        return cls.update_user(telegram_id, conference_disabled=disabled)
+
+    @classmethod
+    def toggle_financial_push(cls, telegram_id: int, enabled: bool):
+        """Enable/disable financial push notifications for user"""
+        return cls.update_user(telegram_id, financial_push_enabled=enabled)
+
+
+class UserService(_UserFieldSetters):
     @staticmethod
     def create_user(telegram_id: int, full_name: str, phone_number: str,
                     bitrix_contact_id: int = None, bitrix_deal_id: int = None,
@@ -14,20 +102,17 @@ class UserService:
         """Create new user"""
         try:
             with get_session() as session:
-                user = User(
-                    telegram_id=telegram_id,
-                    full_name=full_name,
-                    phone_number=phone_number,
-                    bitrix_contact_id=bitrix_contact_id,
-                    bitrix_deal_id=bitrix_deal_id,
-                    current_stage=current_stage,
-                    registration_date=datetime.utcnow()
-                )
+                user = _new_user(telegram_id, full_name, phone_number, bitrix_contact_id, bitrix_deal_id,
+                                 current_stage)
                 session.add(user)
                 session.commit()
                 session.refresh(user)
                 logger.info(f"Created user: {telegram_id}")
-                return user
+
+            if bitrix_deal_id:
+                deal_index.set(bitrix_deal_id, telegram_id)
+
+            return user
         except Exception as e:
             logger.error(f"Error creating user: {e}")
             return None
@@ -37,8 +122,7 @@ class UserService:
         """Get user by telegram_id"""
         try:
             with get_session() as session:
-                user = session.query(User).filter(User.telegram_id == telegram_id).first()
-                return user
+                return session.get(User, telegram_id)
         except Exception as e:
             logger.error(f"Error getting user: {e}")
             return None
@@ -48,8 +132,7 @@ class UserService:
         """Get user by phone number"""
         try:
             with get_session() as session:
-                user = session.query(User).filter(User.phone_number == phone_number).first()
-                return user
+                return session.scalar(_user_by_phone(phone_number))
         except Exception as e:
             logger.error(f"Error getting user by phone: {e}")
             return None
@@ -59,93 +142,198 @@ class UserService:
         """Update user fields"""
         try:
             with get_session() as session:
-                user = session.query(User).filter(User.telegram_id == telegram_id).first()
+                user = session.get(User, telegram_id)
                 if not user:
                     return False
 
-                for key, value in kwargs.items():
-                    if hasattr(user, key):
-                        setattr(user, key, value)
-
+                old_deal_id = _apply_update(user, kwargs)
                 session.commit()
                 logger.info(f"Updated user {telegram_id}: {kwargs}")
-                return True
+
+            _index_deal_change(telegram_id, kwargs, old_deal_id)
+            return True
         except Exception as e:
             logger.error(f"Error updating user: {e}")
             return False
 
     @staticmethod
-    def update_stage(telegram_id: int, new_stage: str) -> bool:
-        """Update user's current stage"""
-        return UserService.update_user(telegram_id, current_stage=new_stage)
+    def get_all_users(category: ClientCategory = None) -> list:
+        """Get all users, optionally filtered by category"""
+        try:
+            with get_session() as session:
+                return session.scalars(_users(category)).all()
+        except Exception as e:
+            logger.error(f"Error getting all users: {e}")
+            return []
 
     @staticmethod
-    def set_client_category(telegram_id: int, category: ClientCategory) -> bool:
-        """Set client category (CRYPTO, MFO, BANK)"""
-        return UserService.update_user(telegram_id, client_category=category)
+    def get_users_for_conferences(category: ClientCategory = None) -> list:
+        """Get users eligible for conference invitations"""
+        try:
+            with get_session() as session:
+                return session.scalars(_users(category, conferences_only=True)).all()
+        except Exception as e:
+            logger.error(f"Error getting users for conferences: {e}")
+            return []
 
     @staticmethod
-    def set_google_folder(telegram_id: int, folder_id: str) -> bool:
-        """Set Google Drive folder ID for user"""
-        return UserService.update_user(telegram_id, google_drive_folder_id=folder_id)
+    def get_user_count() -> int:
+        """Get total user count"""
+        try:
+            with get_session() as session:
+                return session.scalar(_user_count())
+        except Exception as e:
+            logger.error(f"Error getting user count: {e}")
+            return 0
 
     @staticmethod
-    def toggle_conference_disabled(telegram_id: int, disabled: bool) -> bool:
-        """Enable/disable conference invitations for user"""
-        return UserService.update_user(telegram_id, conference_disabled=disabled)
+    def reconcile_stages() -> Dict:
+        """
+        Re-sync current_stage of all users with Bitrix24 deals.
+        Only changed stages are written, in a single UPDATE.
+        """
+        from integrations.bitrix import bitrix_client
+
+        started = time.monotonic()
+
+        try:
+            with get_session() as session:
+                rows = session.query(User.telegram_id, User.bitrix_deal_id, User.current_stage).filter(
+                    User.bitrix_deal_id.isnot(None)
+                ).all()
+
+            known = {deal_id: (telegram_id, stage) for telegram_id, deal_id, stage in rows}
+            stages = bitrix_client.get_deal_stages(list(known))
+
+            changes = {}
+            for deal_id, new_stage in stages.items():
+                telegram_id, current_stage = known[deal_id]
+                if new_stage != current_stage:
+                    changes[telegram_id] = new_stage
+
+            if changes:
+                with get_session() as session:
+                    session.execute(
+                        update(User)
+                        .where(User.telegram_id.in_(list(changes)))
+                        .values(current_stage=case(changes, value=User.telegram_id))
+                        .execution_options(synchronize_session=False)
+                    )
+
+            report = {
+                'checked': len(stages),
+                'changed': len(changes),
+                'failed': len(known) - len(stages),
+                'duration_seconds': round(time.monotonic() - started, 2)
+            }
+            logger.info(f"Stage reconciliation finished: {report}")
+            return report
+        except Exception as e:
+            logger.error(f"Error reconciling stages: {e}")
+            return {}
 
     @staticmethod
-    def toggle_financial_push(telegram_id: int, enabled: bool) -> bool:
-        """Enable/disable financial push notifications for user"""
-        return UserService.update_user(telegram_id, financial_push_enabled=enabled)
+    def user_exists(telegram_id: int) -> bool:
+        """Check if user exists"""
+        return UserService.get_user(telegram_id) is not None
+
+
+class AsyncUserService(_UserFieldSetters):
+    """UserService for bot handlers, on the async engine (stage reconciliation stays in UserService)"""
 
     @staticmethod
-    def get_all_users(category: ClientCategory = None) -> list:
-        """Get all users, optionally filtered by category"""
+    async def create_user(telegram_id: int, full_name: str, phone_number: str,
+                          bitrix_contact_id: int = None, bitrix_deal_id: int = None,
+                          current_stage: str = None) -> Optional[User]:
+        """Create new user"""
         try:
-            with get_session() as session:
-                query = session.query(User)
+            async with get_async_session() as session:
+                user = _new_user(telegram_id, full_name, phone_number, bitrix_contact_id, bitrix_deal_id,
+                                 current_stage)
+                session.add(user)
+            logger.info(f"Created user: {telegram_id}")
 
-                if category:
-                    query = query.filter(User.client_category == category)
+            if bitrix_deal_id:
+                deal_index.set(bitrix_deal_id, telegram_id)
 
-                users = query.all()
-                return users
+            return user
+        except Exception as e:
+            logger.error(f"Error creating user: {e}")
+            return None
+
+    @staticmethod
+    async def get_user(telegram_id: int) -> Optional[User]:
+        """Get user by telegram_id"""
+        try:
+            async with get_async_session() as session:
+                return await session.get(User, telegram_id)
+        except Exception as e:
+            logger.error(f"Error getting user: {e}")
+            return None
+
+    @staticmethod
+    async def get_user_by_phone(phone_number: str) -> Optional[User]:
+        """Get user by phone number"""
+        try:
+            async with get_async_session() as session:
+                return await session.scalar(_user_by_phone(phone_number))
+        except Exception as e:
+            logger.error(f"Error getting user by phone: {e}")
+            return None
+
+    @staticmethod
+    async def update_user(telegram_id: int, **kwargs) -> bool:
+        """Update user fields"""
+        try:
+            async with get_async_session() as session:
+                user = await session.get(User, telegram_id)
+                if not user:
+                    return False
+
+                old_deal_id = _apply_update(user, kwargs)
+            logger.info(f"Updated user {telegram_id}: {kwargs}")
+
+            _index_deal_change(telegram_id, kwargs, old_deal_id)
+            return True
+        except Exception as e:
+            logger.error(f"Error updating user: {e}")
+            return False
+
+    @staticmethod
+    async def get_all_users(category: ClientCategory = None) -> list:
+        """Get all users, optionally filtered by category"""
+        try:
+            async with get_async_session() as session:
+                return list(await session.scalars(_users(category)))
         except Exception as e:
             logger.error(f"Error getting all users: {e}")
             return []
 
     @staticmethod
-    def get_users_for_conferences(category: ClientCategory = None) -> list:
+    async def get_users_for_conferences(category: ClientCategory = None) -> list:
         """Get users eligible for conference invitations"""
         try:
-            with get_session() as session:
-                query = session.query(User).filter(User.conference_disabled == False)
-
-                if category:
-                    query = query.filter(User.client_category == category)
-
-                users = query.all()
-                return users
+            async with get_async_session() as session:
+                return list(await session.scalars(_users(category, conferences_only=True)))
         except Exception as e:
             logger.error(f"Error getting users for conferences: {e}")
             return []
 
     @staticmethod
-    def get_user_count() -> int:
+    async def get_user_count() -> int:
         """Get total user count"""
         try:
-            with get_session() as session:
-                count = session.query(User).count()
-                return count
+            async with get_async_session() as session:
+                return await session.scalar(_user_count())
         except Exception as e:
             logger.error(f"Error getting user count: {e}")
             return 0
 
     @staticmethod
-    def user_exists(telegram_id: int) -> bool:
+    async def user_exists(telegram_id: int) -> bool:
         """Check if user exists"""
-        return UserService.get_user(telegram_id) is not None
+        return await AsyncUserService.get_user(telegram_id) is not None
 
 
 user_service = UserService()
+async_user_service = AsyncUserService()
@@ -0,0 +1,161 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('reject', 'drop_oldest')
+
+
+class WebhookQueue:
+    """Bounded in-process queue between the webhook endpoint and its consumer thread"""
+
+    def __init__(self, handler: Callable[[Dict], None], maxsize: int = 1000,
+                 overflow_policy: str = 'reject', coalesce_key: Optional[str] = None,
+                 coalesce_window: float = 0.0):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown webhook queue overflow policy: {overflow_policy}")
+
+        self.handler = handler
+        self.maxsize = maxsize
+        self.overflow_policy = overflow_policy
+        # Events sharing coalesce_key within coalesce_window collapse into the latest one
+        self.coalesce_key = coalesce_key
+        self.coalesce_window = coalesce_window
+        # Held for coalescing; counts towards maxsize together with the queue
+        self._pending = OrderedDict()
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._consumer = None
+        self._stats = {
+            'enqueued': 0,
+            'processed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'dropped': 0,
+            'coalesced': 0,
+            'max_depth': 0,
+            'total_wait_seconds': 0.0,
+            'max_wait_seconds': 0.0,
+        }
+
+    def put(self, event: Dict) -> bool:
+        """Enqueue event without blocking. Returns False if it was rejected"""
+        item = (time.monotonic(), event)
+
+        with self._lock:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                if self.overflow_policy == 'reject':
+                    self._stats['rejected'] += 1
+                    logger.warning("Webhook queue is full, rejecting event")
+                    return False
+
+                # drop_oldest: make room for the newest event
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                    self._stats['dropped'] += 1
+                except queue.Empty:
+                    pass
+                self._queue.put_nowait(item)
+
+            self._stats['enqueued'] += 1
+            self._stats['max_depth'] = max(self._stats['max_depth'], self._queue.qsize() + len(self._pending))
+
+        return True
+
+    def start(self):
+        """Start consumer thread (idempotent)"""
+        if self._consumer and self._consumer.is_alive():
+            return
+
+        self._consumer = threading.Thread(target=self._run, name='webhook-consumer', daemon=True)
+        self._consumer.start()
+        logger.info(f"Webhook queue consumer started (maxsize={self.maxsize}, overflow={self.overflow_policy})")
+
+    def _run(self):
+        coalescing = self.coalesce_key is not None and self.coalesce_window > 0
+
+        while True:
+            if not coalescing:
+                self._handle(*self._queue.get())
+                self._queue.task_done()
+                continue
+
+            # Wait for new events only until the oldest pending window closes
+            timeout = None
+            if self._pending:
+                first_deadline = next(iter(self._pending.values()))[0]
+                timeout = max(0.0, first_deadline - time.monotonic())
+
+            # Coalescing backlog is full: leave new events in the queue, so once it fills up
+            # too the overflow policy applies to them (maxsize <= 0 means unbounded, as in queue.Queue)
+            if 0 < self.maxsize <= len(self._pending):
+                time.sleep(timeout)
+                self._flush_due()
+                continue
+
+            try:
+                enqueued_at, event = self._queue.get(timeout=timeout)
+                self._queue.task_done()
+                self._coalesce(enqueued_at, event)
+            except queue.Empty:
+                pass
+
+            self._flush_due()
+
+    def _coalesce(self, enqueued_at: float, event: Dict):
+        """Keep only the latest event per key, preserving the window of the first one"""
+        key = event.get(self.coalesce_key)
+        pending = self._pending.get(key)
+
+        if pending:
+            self._pending[key] = (pending[0], pending[1], event)
+            with self._lock:
+                self._stats['coalesced'] += 1
+        else:
+            self._pending[key] = (enqueued_at + self.coalesce_window, enqueued_at, event)
+
+    def _flush_due(self):
+        now = time.monotonic()
+        while self._pending:
+            key, (deadline, enqueued_at, event) = next(iter(self._pending.items()))
+            if deadline > now:
+                break
+            del self._pending[key]
+            self._handle(enqueued_at, event)
+
+    def _handle(self, enqueued_at: float, event: Dict):
+        waited = time.monotonic() - enqueued_at
+
+        try:
+            self.handler(event)
+            failed = False
+        except Exception as e:
+            logger.error(f"Error handling webhook event {event}: {e}", exc_info=True)
+            failed = True
+
+        with self._lock:
+            self._stats['failed' if failed else 'processed'] += 1
+            self._stats['total_wait_seconds'] += waited
+            self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], waited)
+
+    def get_stats(self) -> Dict:
+        """Backpressure metrics for health checks"""
+        with self._lock:
+            stats = dict(self._stats)
+
+        handled = stats['processed'] + stats['failed']
+        stats['pending_coalesced'] = len(self._pending)
+        stats['depth'] = self._queue.qsize() + stats['pending_coalesced']
+        stats['coalesce_window'] = self.coalesce_window
+        stats['maxsize'] = self.maxsize
+        stats['overflow_policy'] = self.overflow_policy
+        stats['avg_wait_seconds'] = stats['total_wait_seconds'] / handled if handled else 0.0
+        stats['consumer_alive'] = bool(self._consumer and self._consumer.is_alive())
+        return stats
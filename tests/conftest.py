@@ -0,0 +1,5 @@
+import os
+
+# Modules under test import the database package; the engine is never connected here
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite://'
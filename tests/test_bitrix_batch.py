@@ -0,0 +1,134 @@
+import pytest
+
+import integrations.bitrix as bitrix
+from integrations.bitrix import BitrixBatch, BitrixClient, BitrixLookupCache, BatchResult, build_query
+
+
+def test_build_query_encodes_nested_params():
+    query = build_query({'filter': {'PHONE': '+380 50', 'CATEGORY_ID': 7}, 'select': ['ID', 'NAME']})
+    assert query == 'filter[PHONE]=%2B380%2050&filter[CATEGORY_ID]=7&select[0]=ID&select[1]=NAME'
+
+
+def test_chunks_split_at_batch_limit():
+    batch = BitrixBatch()
+    for i in range(bitrix.BATCH_MAX_COMMANDS * 2 + 5):
+        batch.add(f"deal_{i}", 'crm.deal.get', {'id': i})
+
+    chunks = batch.chunks()
+    assert [len(names) for names, _ in chunks] == [bitrix.BATCH_MAX_COMMANDS, bitrix.BATCH_MAX_COMMANDS, 5]
+    names, params = chunks[-1]
+    assert params['halt'] == 0
+    assert list(params['cmd']) == names
+    assert params['cmd'][names[0]] == f"crm.deal.get?id={bitrix.BATCH_MAX_COMMANDS * 2}"
+
+
+def test_commands_without_params_and_duplicate_names():
+    batch = BitrixBatch(halt=True).add('fields', 'crm.deal.fields')
+    assert batch.chunks() == [(['fields'], {'halt': 1, 'cmd': {'fields': 'crm.deal.fields'}})]
+
+    with pytest.raises(ValueError):
+        batch.add('fields', 'crm.deal.fields')
+
+
+def test_read_only():
+    assert BitrixBatch().add('a', 'crm.deal.get', {'id': 1}).read_only
+    assert not BitrixBatch().add('a', 'crm.deal.get', {'id': 1}).add('b', 'crm.deal.update', {'id': 1}).read_only
+
+
+def test_retry_chunk_includes_referenced_commands():
+    batch = BitrixBatch() \
+        .add('contact', 'crm.contact.list', {'filter': {'PHONE': '1'}}) \
+        .add('deals', 'crm.deal.list', {'filter': {'CONTACT_ID': BitrixBatch.ref('contact', '[0][ID]')}}) \
+        .add('other', 'crm.deal.get', {'id': 5})
+
+    names, params = batch.retry_chunk(['deals'])
+    assert names == ['contact', 'deals']
+    assert params['cmd']['deals'] == 'crm.deal.list?filter[CONTACT_ID]=%24result%5Bcontact%5D%5B0%5D%5BID%5D'
+    assert batch.retry_chunk(['other'])[0] == ['other']
+
+
+def test_merge_results_and_errors():
+    result = BatchResult()
+    result._merge(['a', 'b'], {
+        'result': {'a': [{'ID': '1'}]},
+        'result_error': {'b': {'error': 'ACCESS_DENIED', 'error_description': 'No rights'}},
+        'result_total': {'a': 1},
+    })
+    # PHP serializes empty maps as lists
+    result._merge(['c'], {'result': {'c': True}, 'result_error': [], 'result_total': []})
+
+    assert result.get('a') == [{'ID': '1'}]
+    assert result.totals == {'a': 1}
+    assert result.error('a') is None
+    assert result.error('b') == 'ACCESS_DENIED: No rights'
+    assert result.error('c') is None
+    assert result.error('missing') == 'No result'
+
+
+def test_merge_failed_request_and_retry():
+    result = BatchResult()
+    result._merge(['a'], None)
+    assert result.errors['a']['error'] == 'BATCH_FAILED'
+
+    result._merge(['a'], {'result': {'a': True}})
+    assert result.errors == {}
+    assert result.error('a') is None
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(bitrix.time, 'sleep', lambda seconds: None)
+    return BitrixClient(max_retries=2, cache=BitrixLookupCache())
+
+
+def test_execute_batch_retries_throttled_commands(client):
+    calls = []
+
+    def make_request(method, params, read_only=False, priority=None):
+        calls.append(list(params['cmd']))
+        if len(calls) == 1:
+            return {'result': {'contact': [{'ID': '5'}], 'other': {'ID': '7'}},
+                    'result_error': {'deals': {'error': 'QUERY_LIMIT_EXCEEDED'}}}
+        return {'result': {'contact': [{'ID': '5'}], 'deals': [{'ID': '1', 'CONTACT_ID': '5'}]}}
+
+    client._make_request = make_request
+    batch = BitrixBatch() \
+        .add('contact', 'crm.contact.list', {'filter': {'PHONE': '1'}}) \
+        .add('deals', 'crm.deal.list', {'filter': {'CONTACT_ID': BitrixBatch.ref('contact', '[0][ID]')}}) \
+        .add('other', 'crm.deal.get', {'id': 7})
+
+    result = client.execute_batch(batch)
+
+    assert calls == [['contact', 'deals', 'other'], ['contact', 'deals']]
+    assert result.errors == {}
+    assert result.get('deals') == [{'ID': '1', 'CONTACT_ID': '5'}]
+    assert result.get('other') == {'ID': '7'}
+
+
+def test_execute_batch_gives_up_after_max_retries(client):
+    calls = []
+
+    def make_request(method, params, read_only=False, priority=None):
+        calls.append(method)
+        return {'result': {}, 'result_error': {'deal_1': {'error': 'QUERY_LIMIT_EXCEEDED'}}}
+
+    client._make_request = make_request
+    errors = client.update_deals({1: {'TITLE': 'x'}})
+
+    assert len(calls) == client.max_retries + 1
+    assert errors == {1: 'QUERY_LIMIT_EXCEEDED'}
+
+
+def test_funnel_ignores_deals_of_unmatched_contact(client):
+    result = BatchResult()
+    result._merge(['contact', 'deals'], {'result': {'contact': [], 'deals': [{'ID': '1', 'CONTACT_ID': '9'}]}})
+    assert client._store_funnel('+380501234567', result) == (None, [])
+
+    result = BatchResult()
+    result._merge(['contact', 'deals'], {'result': {
+        'contact': [{'ID': '5'}],
+        'deals': [{'ID': '1', 'CONTACT_ID': '5'}, {'ID': '2', 'CONTACT_ID': '9'}],
+    }})
+    contact, deals = client._store_funnel('+380501234568', result)
+    assert contact == {'ID': '5'}
+    assert deals == [{'ID': '1', 'CONTACT_ID': '5'}]
@@ -0,0 +1,84 @@
+import pytest
+
+import integrations.bitrix as bitrix
+from integrations.bitrix import BitrixLookupCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(bitrix.time, 'monotonic', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def cache(clock):
+    return BitrixLookupCache(maxsize=3, ttl=60, negative_ttl=5)
+
+
+def test_contact_expires_after_ttl(cache, clock):
+    cache.set_contact('+380501234567', [{'ID': '1'}])
+    assert cache.get_contact('380501234567') == (True, {'ID': '1'})
+
+    clock[0] += 61
+    assert cache.get_contact('+380501234567') == (False, None)
+
+
+def test_not_found_is_cached_for_negative_ttl(cache, clock):
+    cache.set_contact('+380501234567', [])
+    assert cache.get_contact('+380501234567') == (True, None)
+
+    clock[0] += 6
+    assert cache.get_contact('+380501234567') == (False, None)
+
+    stats = cache.get_stats()
+    assert stats['negative_hits'] == 1
+    assert stats['misses'] == 1
+
+
+def test_failed_calls_are_not_cached(cache):
+    cache.set_contact('+380501234567', None)
+    cache.set_deals(5, None)
+
+    assert cache.get_contact('+380501234567') == (False, None)
+    assert cache.get_deals(5) == (False, None)
+
+
+def test_invalidate_deal_drops_deals_of_its_contact(cache):
+    cache.set_deals(5, [{'ID': '10'}, {'ID': '11'}])
+    cache.set_deals(6, [{'ID': '12'}])
+
+    cache.invalidate_deal(11)
+
+    assert cache.get_deals(5) == (False, None)
+    assert cache.get_deals(6) == (True, [{'ID': '12'}])
+    stats = cache.get_stats()
+    assert stats['invalidations'] == 1
+    assert stats['deal_links'] == 1
+
+
+def test_invalidate_unknown_deal(cache):
+    cache.set_deals(5, [{'ID': '10'}])
+    cache.invalidate_deal(99)
+    assert cache.get_deals(5) == (True, [{'ID': '10'}])
+
+
+def test_lru_eviction_prunes_deal_links(cache):
+    cache.set_deals(1, [{'ID': '10'}])
+    cache.set_contact('+380501111111', [{'ID': '1'}])
+    cache.set_contact('+380502222222', [{'ID': '2'}])
+    # Recently used entries survive eviction
+    cache.get_deals(1)
+    cache.set_contact('+380503333333', [{'ID': '3'}])
+
+    assert cache.get_contact('+380501111111') == (False, None)
+    assert cache.get_deals(1) == (True, [{'ID': '10'}])
+
+    for phone in ('+380504444444', '+380505555555', '+380506666666'):
+        cache.set_contact(phone, [{'ID': phone}])
+    assert cache.get_deals(1) == (False, None)
+
+    stats = cache.get_stats()
+    assert stats['size'] == 3
+    assert stats['deal_links'] == 0
+    assert stats['evictions'] == 4
@@ -0,0 +1,74 @@
+import io
+import re
+from datetime import datetime
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+from services.image_processing import ImageProcessingService
+
+CREATED_AT = datetime(2024, 5, 1, 12, 30, 0)
+
+
+def jpeg(size, mode='RGB'):
+    output = io.BytesIO()
+    Image.new(mode, size, 128).save(output, 'JPEG')
+    return output.getvalue()
+
+
+def png(size):
+    output = io.BytesIO()
+    Image.new('RGBA', size, (255, 0, 0, 128)).save(output, 'PNG')
+    return io.BytesIO(output.getvalue())
+
+
+@pytest.fixture
+def service():
+    return ImageProcessingService(dpi=100, quality=80)
+
+
+def test_build_pdf_structure(service):
+    pages = [jpeg((827, 1169)), jpeg((1169, 827), mode='L')]
+    pdf = service.build_pdf(iter(pages), CREATED_AT).getvalue()
+
+    assert pdf.startswith(b'%PDF-1.4\n')
+    assert pdf.endswith(b'%%EOF\n')
+    assert b'/Type /Pages /Kids [5 0 R 8 0 R] /Count 2' in pdf
+    assert b'/MediaBox [0 0 595.44 841.68]' in pdf
+    assert b'/MediaBox [0 0 841.68 595.44]' in pdf
+    assert b'/ColorSpace /DeviceRGB' in pdf
+    assert b'/ColorSpace /DeviceGray' in pdf
+    assert b'/CreationDate (D:20240501123000Z)' in pdf
+    # JPEG data is embedded as is
+    assert all(page in pdf for page in pages)
+
+
+def test_build_pdf_xref_offsets(service):
+    pdf = service.build_pdf([jpeg((200, 300))], CREATED_AT).getvalue()
+
+    startxref = int(re.search(rb'startxref\n(\d+)\n', pdf).group(1))
+    assert pdf[startxref:].startswith(b'xref\n0 7\n')
+
+    entries = re.findall(rb'(\d{10}) 00000 n ', pdf[startxref:])
+    assert len(entries) == 6
+    for number, offset in enumerate(entries, 1):
+        assert pdf[int(offset):].startswith(f"{number} 0 obj\n".encode('ascii'))
+
+
+def test_build_pdf_is_reproducible(service):
+    pages = [jpeg((200, 300)), jpeg((300, 200))]
+    assert service.build_pdf(pages, CREATED_AT).getvalue() == service.build_pdf(pages, CREATED_AT).getvalue()
+
+
+def test_build_pdf_needs_pages(service):
+    with pytest.raises(ValueError):
+        service.build_pdf([], CREATED_AT)
+
+
+def test_images_to_pdf_converts_pages(service):
+    pdf = service.images_to_pdf([png((2000, 1000)), io.BytesIO(jpeg((100, 150)))], CREATED_AT).getvalue()
+
+    assert b'/Count 2' in pdf
+    # The PNG is converted to an RGB JPEG that fits A4 landscape at 100 DPI
+    assert b'/Width 1169 /Height 585 /ColorSpace /DeviceRGB' in pdf
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+from services.webhook_queue import WebhookQueue
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Condition not met in time")
+        time.sleep(0.01)
+
+
+def test_reject_policy_refuses_events_when_full():
+    webhook_queue = WebhookQueue(handler=lambda event: None, maxsize=2)
+
+    assert webhook_queue.put({'id': 1})
+    assert webhook_queue.put({'id': 2})
+    assert not webhook_queue.put({'id': 3})
+
+    stats = webhook_queue.get_stats()
+    assert stats['rejected'] == 1
+    assert stats['depth'] == 2
+
+
+def test_drop_oldest_policy_keeps_newest_events():
+    handled = []
+    webhook_queue = WebhookQueue(handler=handled.append, maxsize=2, overflow_policy='drop_oldest')
+
+    for event_id in (1, 2, 3):
+        assert webhook_queue.put({'id': event_id})
+    webhook_queue.start()
+
+    wait_for(lambda: len(handled) == 2)
+    assert [event['id'] for event in handled] == [2, 3]
+    assert webhook_queue.get_stats()['dropped'] == 1
+
+
+def test_unknown_overflow_policy():
+    with pytest.raises(ValueError):
+        WebhookQueue(handler=lambda event: None, overflow_policy='block')
+
+
+def test_coalescing_keeps_latest_event_per_key():
+    handled = []
+    webhook_queue = WebhookQueue(handler=handled.append, coalesce_key='id', coalesce_window=0.2)
+    webhook_queue.start()
+
+    webhook_queue.put({'id': 1, 'stage': 'A'})
+    webhook_queue.put({'id': 2, 'stage': 'A'})
+    webhook_queue.put({'id': 1, 'stage': 'B'})
+
+    wait_for(lambda: len(handled) == 2)
+    time.sleep(0.3)
+    assert handled == [{'id': 1, 'stage': 'B'}, {'id': 2, 'stage': 'A'}]
+
+    stats = webhook_queue.get_stats()
+    assert stats['coalesced'] == 1
+    assert stats['processed'] == 2
+    assert stats['depth'] == 0
+
+
+def test_coalescing_with_unbounded_queue():
+    handled = []
+    webhook_queue = WebhookQueue(handler=handled.append, maxsize=0, coalesce_key='id', coalesce_window=0.05)
+    webhook_queue.start()
+
+    for event_id in range(5):
+        webhook_queue.put({'id': event_id})
+
+    wait_for(lambda: len(handled) == 5)
+    assert webhook_queue.get_stats()['consumer_alive']
+
+
+def test_handler_errors_are_counted_and_consumer_keeps_running():
+    handled = threading.Event()
+
+    def handler(event):
+        if event['id'] == 1:
+            raise RuntimeError("boom")
+        handled.set()
+
+    webhook_queue = WebhookQueue(handler=handler)
+    webhook_queue.start()
+    webhook_queue.put({'id': 1})
+    webhook_queue.put({'id': 2})
+
+    assert handled.wait(2)
+    wait_for(lambda: webhook_queue.get_stats()['processed'] == 1)
+    stats = webhook_queue.get_stats()
+    assert stats['failed'] == 1
+    assert stats['consumer_alive']
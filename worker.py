@@ -0,0 +1,24 @@
+"""
+Background worker process (PROCESS_ROLE=worker) - runs periodic jobs
+"""
+import logging
+from apscheduler.schedulers.blocking import BlockingScheduler
+
+from config import DEBUG, setup_logging
+from database import init_db
+from services.jobs import register_jobs
+
+setup_logging(DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    init_db()
+
+    scheduler = register_jobs(BlockingScheduler(timezone='UTC'))
+    logger.info("Starting background worker...")
+    scheduler.start()
+
+
+if __name__ == '__main__':
+    main()